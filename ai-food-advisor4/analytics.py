@@ -0,0 +1,104 @@
+import warnings
+from datetime import datetime
+import numpy as np
+
+# --- PHÂN TÍCH DẠNG CỘT (NUMPY) CHO TRANG BIỂU ĐỒ ---
+
+# Thứ tự bữa ăn dùng làm mã phân loại (int8)
+MEAL_SLOTS = ('Sáng', 'Trưa', 'Tối', 'Phụ')
+SLOT_BREAKFAST, SLOT_LUNCH, SLOT_DINNER, SLOT_SNACK = range(len(MEAL_SLOTS))
+
+def _slot_from_name(meal_name):
+    """Phân loại dựa trên tên món ăn (khi không có giờ hợp lệ)."""
+    meal_name = (meal_name or '').lower()
+    if any(word in meal_name for word in ['sáng', 'bữa sáng', 'điểm tâm']):
+        return SLOT_BREAKFAST
+    if any(word in meal_name for word in ['trưa', 'bữa trưa']):
+        return SLOT_LUNCH
+    if any(word in meal_name for word in ['tối', 'bữa tối']):
+        return SLOT_DINNER
+    return SLOT_SNACK
+
+def slots_from_hours(hours):
+    """Mã bữa ăn theo giờ địa phương: 5-11 sáng, 11-14 trưa, 17-22 tối, còn lại là phụ."""
+    return np.select(
+        [(hours >= 5) & (hours < 11), (hours >= 11) & (hours < 14), (hours >= 17) & (hours < 22)],
+        [SLOT_BREAKFAST, SLOT_LUNCH, SLOT_DINNER],
+        SLOT_SNACK
+    ).astype(np.int8)
+
+def _parse_local_timestamp(value):
+    """Giờ địa phương (bỏ offset) của một timestamp ISO, NaT nếu không hợp lệ."""
+    try:
+        return np.datetime64(datetime.fromisoformat(value).replace(tzinfo=None), 's')
+    except (TypeError, ValueError):
+        return np.datetime64('NaT', 's')
+
+def _parse_date(value):
+    try:
+        return np.datetime64(value, 'D')
+    except (TypeError, ValueError):
+        return np.datetime64('NaT', 'D')
+
+def _to_datetime64(values, unit, parse_one):
+    """Chuyển cả mảng chuỗi ISO sang datetime64 một lần; chỉ khi có chuỗi lạ mới parse từng phần tử."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            return np.array(values, dtype=f'datetime64[{unit}]')
+        except (ValueError, Warning):
+            return np.array([parse_one(value) for value in values], dtype=f'datetime64[{unit}]')
+
+class MealColumns:
+    """food_log dạng cột: timestamps (datetime64[s], giờ địa phương), dates (datetime64[D]),
+    calories (int32) và slots (mã bữa ăn int8)."""
+
+    __slots__ = ('timestamps', 'dates', 'calories', 'slots')
+
+    def __init__(self, timestamps, dates, calories, slots):
+        self.timestamps = timestamps
+        self.dates = dates
+        self.calories = calories
+        self.slots = slots
+
+    def __len__(self):
+        return len(self.calories)
+
+    @classmethod
+    def from_log(cls, food_log):
+        count = len(food_log)
+        # 19 ký tự đầu = YYYY-MM-DDTHH:MM:SS, bỏ phần offset múi giờ để giữ giờ địa phương
+        raw_timestamps = [(meal.get('timestamp') or '')[:19] for meal in food_log]
+        timestamps = _to_datetime64(raw_timestamps, 's', lambda value: np.datetime64('NaT', 's'))
+        # Các timestamp không parse được theo kiểu nhanh: thử lại bằng fromisoformat
+        invalid = np.flatnonzero(np.isnat(timestamps))
+        for i in invalid:
+            timestamps[i] = _parse_local_timestamp(food_log[i].get('timestamp'))
+
+        dates = _to_datetime64([meal.get('date') for meal in food_log], 'D', _parse_date)
+        calories = np.fromiter((meal.get('calories') or 0 for meal in food_log), dtype=np.int32, count=count)
+
+        hours = (timestamps - timestamps.astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+        slots = slots_from_hours(hours)
+        for i in np.flatnonzero(np.isnat(timestamps)):
+            slots[i] = _slot_from_name(food_log[i].get('meal_name'))
+        return cls(timestamps, dates, calories, slots)
+
+# --- CÁC PHÉP TÍNH VECTOR HÓA ---
+
+# Tổng theo ngày, cửa sổ 7/14/30 ngày và xu hướng 2 tuần lấy từ rollups.CalorieRollup (O(1) mỗi request);
+# ở đây chỉ còn các phép tính cần quét từng bữa ăn.
+
+def achievement_rate(daily_calories, daily_meals, target_calories):
+    """% ngày có dữ liệu mà calories không vượt mục tiêu."""
+    active = np.asarray(daily_meals) > 0
+    total_days_with_data = int(active.sum())
+    if total_days_with_data == 0:
+        return 0
+    target_days = int((active & (np.asarray(daily_calories) <= target_calories)).sum())
+    return round((target_days / total_days_with_data) * 100)
+
+def meal_type_histogram(columns):
+    """Số bữa Sáng/Trưa/Tối/Phụ."""
+    counts = np.bincount(columns.slots, minlength=len(MEAL_SLOTS))
+    return dict(zip(MEAL_SLOTS, counts.tolist()))
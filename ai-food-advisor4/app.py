@@ -1,19 +1,60 @@
 import os
+import hmac
 import json
 import time
 import random
-from flask import Flask, request, jsonify, send_file, session, redirect, url_for
+import asyncio
+import inspect
+from flask import Flask, Response, request, jsonify, send_file, session, redirect, url_for, g
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash 
 from datetime import timedelta, datetime, timezone
 from google import genai
+from google.genai import types
 from google.genai.errors import APIError
-from PIL import Image
-import io
 import numpy as np
 from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor
+from storage import create_storage, new_user_record, new_sync_state, changes_since, MEAL_FIELDS
+from food_log import encode_cursor, decode_cursor
+from meal_ids import new_meal_id
+from analytics import meal_type_histogram, achievement_rate
+from dishes import random_dish, NUTRITION_NOTE
+from profiles import build_profile
+from vision_cache import VisionCache, create_vision_cache
+from jobs import JobQueue, QueueFull
+from suggestion_cache import SuggestionCache, remaining_calorie_bucket
+from gemini_client import GeminiGateway
+from image_ingest import ImageRejected, InvalidImage, ingest_image, to_model_part, IMAGE_MAX_UPLOAD_BYTES
+from image_pool import ImagePoolBusy, create_image_pool
+from dashboard import DashboardSnapshots
+from compression import compress_response
+from shared_store import StoreSessionInterface, create_shared_store
+from logs import get_logger
+import metrics
+from metrics import counter, histogram
+from profiling import profiler, span
+from serialization import dumps, loads
 
 # --- CẤU HÌNH ---
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify và request.get_json qua serialization (orjson/msgspec nếu có); thời gian serialize body
+    phản hồi hiện thành span json.serialize khi profiling bật. dumps() giữ bản chuẩn cho session cookie."""
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Chế độ debug của Flask in JSON thụt lề
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        with span('json.serialize'):
+            body = dumps(obj, sort_keys=self.sort_keys, indent=indent, default=self.default)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+log = get_logger('app')
 # Thiết lập khóa bí mật (BẮT BUỘC cho Session)
 app.secret_key = os.environ.get('SECRET_KEY', 'default_super_secret_key_change_me_in_production') 
 app.permanent_session_lifetime = timedelta(minutes=60)
@@ -21,80 +62,171 @@ app.permanent_session_lifetime = timedelta(minutes=60)
 # Timezone cho Việt Nam (UTC+7)
 vietnam_tz = timezone(timedelta(hours=7))
 
+# Giải mã/thu nhỏ ảnh ở process pool riêng để không giữ GIL của tiến trình web (IMAGE_POOL_WORKERS=0 để tắt).
+# Tạo đầu tiên, trước mọi thread nền, vì tiến trình con được fork.
+image_pool = create_image_pool()
+
 # Khởi tạo Gemini Client
+# GEMINI_BASE_URL: trỏ tới endpoint khác (proxy, hoặc benchmarks/fake_gemini.py khi thử offline)
+GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL')
 client = None
 try:
     # Đảm bảo biến môi trường GEMINI_API_KEY đã được thiết lập
-    client = genai.Client()
-    print("✅ Gemini Client khởi tạo thành công.")
+    client = genai.Client(http_options=types.HttpOptions(base_url=GEMINI_BASE_URL))
+    log.info("✅ Gemini Client khởi tạo thành công.")
 except Exception as e:
-    print(f"❌ Lỗi khởi tạo Gemini Client: {e}")
+    log.error("❌ Lỗi khởi tạo Gemini Client", error=e)
+
+# Mọi lời gọi Gemini đi qua gateway: gộp yêu cầu trùng, giới hạn đồng thời và tốc độ
+gemini = GeminiGateway(client)
 
-DB_FILE = 'db.json'
 GEMINI_MODEL_VISION = 'gemini-2.5-flash'
 GEMINI_MODEL_REASONING = 'gemini-2.5-flash'
 
-# --- HÀM HỖ TRỢ CHUNG ---
+# Backend lưu trữ (json hoặc sqlite) - cấu hình qua biến môi trường STORAGE_BACKEND
+storage = create_storage()
+log.info("✅ Storage backend", backend=storage.name)
+
+# Kho dùng chung giữa các worker (SHARED_STORE): session phía server và trạng thái công việc nền
+shared_store = create_shared_store()
+if shared_store is not None:
+    app.session_interface = StoreSessionInterface(shared_store)
+    log.info("✅ Shared store", store=shared_store.name)
+
+# Cache kết quả phân tích ảnh theo nội dung ảnh (tắt bằng VISION_CACHE_ENABLED=0)
+vision_cache = create_vision_cache()
+
+# Worker nền phân tích ảnh món ăn: log_meal không giữ request thread trong lúc gọi Gemini
+MEAL_JOB_WORKERS = int(os.environ.get('MEAL_JOB_WORKERS', '4'))
+MEAL_JOB_QUEUE_SIZE = int(os.environ.get('MEAL_JOB_QUEUE_SIZE', '100'))
+MEAL_JOB_MAX_WAIT = float(os.environ.get('MEAL_JOB_MAX_WAIT', '30'))
+meal_jobs = JobQueue(workers=MEAL_JOB_WORKERS, max_queue=MEAL_JOB_QUEUE_SIZE, name='meal-analysis',
+                     store=shared_store)
+
+# Ghi nhiều ảnh một lần: số ảnh tối đa mỗi request, số ảnh mỗi lời gọi Gemini, số thread giải mã ảnh
+MEAL_BATCH_MAX_PHOTOS = int(os.environ.get('MEAL_BATCH_MAX_PHOTOS', '10'))
+GEMINI_IMAGES_PER_REQUEST = int(os.environ.get('GEMINI_IMAGES_PER_REQUEST', '5'))
+IMAGE_DECODE_WORKERS = int(os.environ.get('IMAGE_DECODE_WORKERS', '4'))
+image_decode_pool = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix='image-decode')
+# Từ chối request quá lớn ngay khi đọc header (413), trước khi nhận hết dữ liệu
+app.config['MAX_CONTENT_LENGTH'] = IMAGE_MAX_UPLOAD_BYTES * MEAL_BATCH_MAX_PHOTOS + 1024 * 1024
+
+# Cache gợi ý thực đơn theo (mục tiêu, mức calories còn lại) - dùng chung giữa người dùng
+suggestion_cache = SuggestionCache()
+
+# Ảnh chụp /api/dashboard theo người dùng, dựng lại khi dữ liệu của người đó đổi
+dashboard_snapshots = DashboardSnapshots()
+
+# Phân trang /api/food_log: số bữa mặc định và tối đa mỗi trang
+FOOD_LOG_PAGE_SIZE = int(os.environ.get('FOOD_LOG_PAGE_SIZE', '100'))
+FOOD_LOG_MAX_PAGE_SIZE = int(os.environ.get('FOOD_LOG_MAX_PAGE_SIZE', '1000'))
+FOOD_LOG_FIELDS = ('id',) + MEAL_FIELDS
+# Số id tối đa trong một request xóa hàng loạt
+MEAL_DELETE_MAX_IDS = int(os.environ.get('MEAL_DELETE_MAX_IDS', '500'))
+
+# Token cho các route /api/admin/* và route số liệu (header X-Admin-Token); không đặt thì các route này trả 404
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Token riêng cho Prometheus scrape /metrics và /api/*/metrics (header Authorization: Bearer <token>),
+# để không phải đưa ADMIN_TOKEN vào cấu hình scrape
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# --- METRICS (/metrics, định dạng Prometheus) ---
+HTTP_REQUEST_SECONDS = histogram('http_request_duration_seconds', "Độ trễ xử lý request theo route",
+                                 ('method', 'route', 'status'))
+GEMINI_RETRIES = counter('gemini_retries_total', "Số lần thử lại lời gọi Gemini sau lỗi API", ('kind',))
+GEMINI_FALLBACKS = counter('gemini_fallbacks_total', "Số lần dùng dữ liệu mẫu/phương án dự phòng thay cho Gemini",
+                           ('kind',))
+GEMINI_PARSE_FAILURES = counter('gemini_parse_failures_total', "Số phản hồi Gemini không phải JSON hợp lệ")
+IMAGE_DECODE_SECONDS = histogram('image_decode_seconds', "Thời gian giải mã/thu nhỏ ảnh tải lên (gồm chờ pool)",
+                                 ('pool', 'outcome'))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler.enabled:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.profile_trace = profiler.start_trace(f'{request.method} {route}', path=request.path)
+
+# Đăng ký trước compress_json: after_request chạy theo thứ tự ngược nên thời gian đo gồm cả nén
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route,
+                                     status=response.status_code)
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(error):
+    # teardown chạy cả khi view ném lỗi (và trên đường ASGI), nên trace luôn được đóng
+    handle = g.pop('profile_trace', None)
+    if handle is not None:
+        profiler.finish_trace(handle, status=g.get('response_status', 500))
+
+@app.after_request
+def compress_json(response):
+    """Nén gzip/brotli các phản hồi JSON lớn theo Accept-Encoding."""
+    return compress_response(response, request.accept_encodings)
 
-def load_data(file_name, default_data):
-    """Đọc dữ liệu từ file JSON."""
-    if os.path.exists(file_name):
-        try:
-            with open(file_name, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Cảnh báo: File {file_name} bị lỗi định dạng. Sử dụng dữ liệu mặc định.")
-            return default_data
-    return default_data
-
-def save_data(file_name, data):
-    """Lưu dữ liệu vào file JSON."""
-    with open(file_name, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+# --- HÀM HỖ TRỢ CHUNG ---
 
 def load_db():
-    return load_data(DB_FILE, {"users": {}})
+    return storage.load_all()
 
 def save_db(db):
-    save_data(DB_FILE, db)
+    storage.save_all(db)
     
 def get_user_data(user_id):
     """Lấy dữ liệu người dùng từ DB."""
-    db = load_db()
-    return db['users'].get(user_id)
+    return storage.get_user(user_id)
 
-def clean_and_load_json(text_response):
-    """Làm sạch chuỗi phản hồi Gemini và tải JSON."""
-    try:
-        json_text = text_response.strip()
-        
-        # Xử lý các trường hợp format phổ biến
-        if json_text.startswith('```json'):
-            json_text = json_text[7:].strip()
-        elif json_text.startswith('```'):
-            json_text = json_text[3:].strip()
-            
-        if json_text.endswith('```'):
-            json_text = json_text[:-3].strip()
-        
-        # Xử lý trường hợp có text thừa trước/sau JSON
-        start_idx = json_text.find('{')
-        end_idx = json_text.rfind('}') + 1
-        
-        if start_idx != -1 and end_idx != 0:
-            json_text = json_text[start_idx:end_idx]
-        
-        print(f"🧹 Cleaned JSON text: {json_text}")
-        return json.loads(json_text)
+class ModelResponseInvalid(ValueError):
+    """Phản hồi của Gemini không đúng định dạng mong đợi: dùng dữ liệu mẫu và không cache."""
+
+def parse_model_json(text_response):
+    """Làm sạch chuỗi phản hồi Gemini và tải object JSON; ModelResponseInvalid nếu không parse được."""
+    json_text = text_response.strip()
+    
+    # Xử lý các trường hợp format phổ biến
+    if json_text.startswith('```json'):
+        json_text = json_text[7:].strip()
+    elif json_text.startswith('```'):
+        json_text = json_text[3:].strip()
         
+    if json_text.endswith('```'):
+        json_text = json_text[:-3].strip()
+    
+    # Xử lý trường hợp có text thừa trước/sau JSON
+    start_idx = json_text.find('{')
+    end_idx = json_text.rfind('}') + 1
+    
+    if start_idx != -1 and end_idx != 0:
+        json_text = json_text[start_idx:end_idx]
+    
+    log.debug("🧹 Cleaned JSON text", text=json_text)
+    try:
+        data = json.loads(json_text)
     except json.JSONDecodeError as e:
-        print(f"❌ Lỗi parse JSON: {e}")
-        print(f"📄 Original response: {text_response}")
-        
+        GEMINI_PARSE_FAILURES.inc()
+        log.warning("❌ Lỗi parse JSON", error=e)
+        log.debug("📄 Original response", text=text_response)
+        raise ModelResponseInvalid(f"Không parse được JSON: {e}") from e
+    if not isinstance(data, dict):
+        GEMINI_PARSE_FAILURES.inc()
+        raise ModelResponseInvalid("Phản hồi không phải object JSON")
+    return data
+
+def clean_and_load_json(text_response):
+    """Như parse_model_json nhưng không báo lỗi: parse hỏng thì trả dữ liệu trích từ văn bản."""
+    try:
+        return parse_model_json(text_response)
+    except ModelResponseInvalid:
         # Fallback: cố gắng extract thông tin từ text
         return extract_info_from_text(text_response)
     except Exception as e:
-        print(f"❌ Lỗi khác khi parse: {e}")
+        log.error("❌ Lỗi khác khi parse", error=e)
         return create_fallback_meal_data()
 
 def extract_info_from_text(text):
@@ -120,19 +252,45 @@ def extract_info_from_text(text):
     
     return fallback_data
 
-def retry_on_error(max_retries=3, delay=2):
-    """Decorator để thử lại khi API bị lỗi"""
+def _retry_wait(attempt, error, max_retries, delay, kind):
+    """Số giây chờ trước lần thử kế tiếp sau APIError ở lần thử attempt (0, 1, ...); None nếu không thử lại."""
+    # Lần thử cuối, hoặc circuit breaker vừa mở thì không chờ thêm
+    if attempt == max_retries - 1 or gemini.breaker.is_open:
+        return None
+    wait_time = delay * (2 ** attempt) + random.uniform(0, 1)
+    GEMINI_RETRIES.inc(kind=kind)
+    log.warning("⚠️ API lỗi, thử lại", kind=kind, attempt=attempt + 1, wait=round(wait_time, 1), error=error)
+    return wait_time
+
+def retry_on_error(max_retries=3, delay=2, kind='default'):
+    """Decorator để thử lại khi API bị lỗi; func nhận thêm tham số attempt (1, 2, ...)
+
+    Dùng được cho cả coroutine (đường ASGI): khi đó chờ bằng asyncio.sleep, không giữ thread.
+    """
     def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, attempt=attempt + 1, **kwargs)
+                    except APIError as e:
+                        wait_time = _retry_wait(attempt, e, max_retries, delay, kind)
+                        if wait_time is None:
+                            raise
+                        await asyncio.sleep(wait_time)
+                return None
+            return async_wrapper
+
         @wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
-                    return func(*args, **kwargs)
+                    return func(*args, attempt=attempt + 1, **kwargs)
                 except APIError as e:
-                    if attempt == max_retries - 1:  # Lần thử cuối
-                        raise e
-                    wait_time = delay * (2 ** attempt) + random.uniform(0, 1)
-                    print(f"⚠️ API lỗi, thử lại sau {wait_time:.1f} giây... (lần {attempt + 1})")
+                    wait_time = _retry_wait(attempt, e, max_retries, delay, kind)
+                    if wait_time is None:
+                        raise
                     time.sleep(wait_time)
             return None
         return wrapper
@@ -188,35 +346,168 @@ def generate_fallback_suggestions(profile, remaining_calories):
 
 def create_fallback_meal_data():
     """Tạo dữ liệu món ăn mẫu khi API bị lỗi"""
-    meal_names = [
-        "Cơm tấm sườn nướng",
-        "Phở bò", 
-        "Bún chả",
-        "Bánh mì thịt",
-        "Cơm gà xé",
-        "Bún bò Huế",
-        "Hủ tiếu nam vang"
-    ]
-    
-    descriptions = [
-        "Cơm trắng với sườn nướng, bì, chả và đồ chua",
-        "Phở nước dùng thơm ngon với thịt bò tái, chín",
-        "Bún với chả thịt nướng, nem và nước mắm chua ngọt",
-        "Bánh mì giòn với nhân thịt, pate và rau sống",
-        "Cơm trắng với gà xé, rau sống và nước mắm",
-        "Bún bò với hương vị Huế đặc trưng, giò heo",
-        "Hủ tiếu với nước dùng trong, thịt heo, tôm"
-    ]
-    
-    index = random.randint(0, len(meal_names) - 1)
-    
+    meal_name, description = random_dish()
     return {
-        'meal_name': meal_names[index],
+        'meal_name': meal_name,
         'estimated_calories': random.randint(200, 800),
-        'description': descriptions[index],
-        'nutrition_analysis': 'Món ăn truyền thống Việt Nam'
+        'description': description,
+        'nutrition_analysis': NUTRITION_NOTE
     }
 
+# PROMPT cho Gemini AI - ngắn gọn và hiệu quả
+VISION_PROMPT = """
+Phân tích món ăn trong ảnh. Trả về JSON:
+
+{
+    "meal_name": "Tên món ăn",
+    "estimated_calories": số_calories,
+    "description": "Mô tả ngắn",
+    "nutrition_analysis": "Phân tích dinh dưỡng"
+}
+
+Ví dụ:
+{
+    "meal_name": "Phở bò",
+    "estimated_calories": 450,
+    "description": "Phở bò tái chín, nước dùng thơm",
+    "nutrition_analysis": "Protein từ thịt bò, tinh bột từ bánh phở"
+}
+"""
+
+BATCH_VISION_PROMPT = """
+Phân tích món ăn trong {count} ảnh sau, theo đúng thứ tự ảnh. Trả về JSON:
+
+{{
+    "items": [
+        {{"meal_name": "Tên món ăn", "estimated_calories": số_calories, "description": "Mô tả ngắn", "nutrition_analysis": "Phân tích dinh dưỡng"}}
+    ]
+}}
+
+Mảng "items" phải có đúng {count} phần tử, phần tử thứ i ứng với ảnh thứ i.
+"""
+
+# --- PHÂN TÍCH ẢNH: PHẦN DÙNG CHUNG CHO ĐƯỜNG WSGI (app.py) VÀ ASGI (asgi.py) ---
+# Hai đường chỉ khác ở chỗ chờ (gọi thẳng hay await / asyncio.to_thread); prompt, parse, cache và
+# fallback nằm trong các hàm đồng bộ dưới đây.
+
+def lookup_meal_analysis(img):
+    """(cache_key, phash, ai_data đã cache hoặc None) của ảnh."""
+    with span('image.fingerprint'):
+        cache_key, phash = VisionCache.fingerprint(img)
+    cached = vision_cache.get(cache_key, phash) if vision_cache else None
+    if cached is not None:
+        log.debug("♻️ Dùng lại kết quả phân tích ảnh từ cache")
+    return cache_key, phash, cached
+
+def encode_meal_image(img):
+    with span('image.encode'):
+        return to_model_part(img)
+
+def meal_analysis_request(image_part, attempt):
+    """Tham số generate_content/agenerate_content cho một ảnh."""
+    if attempt == 1:
+        log.debug("🔄 Đang gửi ảnh đến Gemini API", model=GEMINI_MODEL_VISION)
+    return {'model': GEMINI_MODEL_VISION, 'contents': [VISION_PROMPT, image_part], 'kind': 'vision',
+            'attempt': attempt}
+
+def finish_meal_analysis(cache_key, phash, response_text=None, error=None):
+    """Kết quả phân tích từ phản hồi của model, hoặc dữ liệu mẫu khi lời gọi lỗi (error).
+
+    Chỉ ghi vision cache khi phản hồi parse được; dữ liệu trích từ văn bản hay dữ liệu mẫu không được cache.
+    """
+    if error is not None:
+        if isinstance(error, APIError):
+            # Vẫn lỗi sau khi hết lượt thử (hoặc breaker đã mở): dùng fallback
+            log.error("❌ Gemini API vẫn lỗi, dùng dữ liệu mẫu", error=error)
+        else:
+            log.error("❌ Lỗi khác khi gọi API", error=error)
+        GEMINI_FALLBACKS.inc(kind='vision')
+        ai_data = create_fallback_meal_data()
+        log.debug("📊 Using fallback data", data=ai_data)
+        return ai_data
+    log.debug("✅ Gemini API phản hồi thành công", response=response_text)
+    try:
+        ai_data = parse_model_json(response_text)
+    except ModelResponseInvalid:
+        return extract_info_from_text(response_text)
+    if vision_cache:
+        vision_cache.put(cache_key, phash, ai_data)
+    return ai_data
+
+def save_meal(user_id, ai_data, timestamp, date_used):
+    """Tạo bản ghi từ kết quả phân tích và lưu vào Nhật ký."""
+    meal_entry = build_meal_entry(ai_data, timestamp, date_used)
+    storage.add_meals(user_id, [meal_entry])
+    return meal_entry
+
+def analyze_meal_image(img):
+    """Phân tích ảnh món ăn bằng Gemini, có cache theo nội dung ảnh."""
+    cache_key, phash, cached = lookup_meal_analysis(img)
+    if cached is not None:
+        return cached
+    # Cùng một ảnh đang được phân tích (bấm gửi 2 lần, nhiều tab) thì chờ chung một lời gọi
+    return dict(gemini.single_flight(('vision', cache_key), request_meal_analysis, img, cache_key, phash))
+
+@retry_on_error(max_retries=3, delay=2, kind='vision')
+def fetch_meal_analysis(image_part, attempt):
+    return gemini.generate_content(**meal_analysis_request(image_part, attempt)).text
+
+def request_meal_analysis(img, cache_key, phash):
+    """Gọi Gemini (có retry) cho một ảnh chưa có trong cache."""
+    try:
+        response_text = fetch_meal_analysis(encode_meal_image(img))
+    except Exception as e:
+        return finish_meal_analysis(cache_key, phash, error=e)
+    return finish_meal_analysis(cache_key, phash, response_text)
+
+def request_batch_analysis(images):
+    """Một lời gọi Gemini cho nhiều ảnh; trả về [] nếu lỗi hoặc số kết quả không khớp số ảnh."""
+    log.debug("🔄 Đang gửi nhiều ảnh trong một yêu cầu đến Gemini API", images=len(images))
+    try:
+        with span('image.encode', images=len(images)):
+            image_parts = [to_model_part(img) for img in images]
+        response = gemini.generate_content(
+            model=GEMINI_MODEL_VISION,
+            contents=[BATCH_VISION_PROMPT.format(count=len(images))] + image_parts,
+            kind='vision_batch'
+        )
+        items = clean_and_load_json(response.text).get('items')
+        if isinstance(items, list) and len(items) == len(images) and all(isinstance(item, dict) for item in items):
+            return items
+        log.warning("⚠️ Gemini trả về kết quả nhóm không hợp lệ", images=len(images))
+    except Exception as e:
+        log.warning("⚠️ Phân tích nhóm ảnh lỗi", images=len(images), error=e)
+    # Phân tích lại từng ảnh
+    GEMINI_FALLBACKS.inc(kind='vision_batch')
+    return []
+
+def analyze_meal_images(images):
+    """Phân tích nhiều ảnh: dùng cache trước, phần còn lại gửi theo nhóm nhiều ảnh mỗi lời gọi Gemini."""
+    results = [None] * len(images)
+    pending = []
+    for i, img in enumerate(images):
+        with span('image.fingerprint', index=i):
+            cache_key, phash = VisionCache.fingerprint(img)
+        cached = vision_cache.get(cache_key, phash) if vision_cache else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append((i, img, cache_key, phash))
+
+    for start in range(0, len(pending), GEMINI_IMAGES_PER_REQUEST):
+        chunk = pending[start:start + GEMINI_IMAGES_PER_REQUEST]
+        items = request_batch_analysis([img for _, img, _, _ in chunk]) if len(chunk) > 1 else []
+        if not items:
+            # Nhóm lỗi (hoặc chỉ có 1 ảnh): phân tích từng ảnh, có retry và fallback
+            for i, img, _, _ in chunk:
+                results[i] = analyze_meal_image(img)
+            continue
+        for (i, _, cache_key, phash), ai_data in zip(chunk, items):
+            results[i] = ai_data
+            if vision_cache:
+                vision_cache.put(cache_key, phash, ai_data)
+    return results
+
 # --- DECORATOR & LOGIC TÍNH TOÁN ---
 
 def login_required(f):
@@ -232,16 +523,30 @@ def login_required(f):
         return f(*args, **kwargs)
     return wrapper
 
-def calculate_tdee(gender, age, height_cm, weight_kg, activity_level):
-    """Tính toán TDEE dựa trên công thức Mifflin-St Jeor."""
-    if gender.lower() == 'nam':
-        bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + 5
-    else:
-        bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) - 161
+def _token_matches(token, expected):
+    return bool(expected) and hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+def _is_admin():
+    return _token_matches(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
 
-    activity_factors = {'ít': 1.2, 'bình thường': 1.55, 'nhiều': 1.9}
-    activity_factor = activity_factors.get(activity_level.lower(), 1.55)
-    return round(bmr * activity_factor)
+def admin_required(f):
+    """Route quản trị: cần header X-Admin-Token khớp ADMIN_TOKEN; sai hoặc chưa cấu hình thì 404."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not _is_admin():
+            return jsonify({"error": "Not found"}), 404
+        return f(*args, **kwargs)
+    return wrapper
+
+def metrics_required(f):
+    """Route số liệu: như admin_required, hoặc Authorization: Bearer khớp METRICS_TOKEN (Prometheus scrape)."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if not (_is_admin() or (scheme.lower() == 'bearer' and _token_matches(token.strip(), METRICS_TOKEN))):
+            return jsonify({"error": "Not found"}), 404
+        return f(*args, **kwargs)
+    return wrapper
 
 # --- ROUTES PHỤC VỤ HTML ---
 
@@ -283,7 +588,7 @@ def serve_static(filename):
 def get_current_date():
     """API để lấy ngày hiện tại từ server - ĐÃ SỬA TIMEZONE VIỆT NAM"""
     current_date = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
-    print(f"🌏 Server date (Vietnam time): {current_date}")
+    log.debug("🌏 Server date (Vietnam time)", date=current_date)
     return jsonify({"current_date": current_date})
 
 # --- AUTH API ---
@@ -291,31 +596,28 @@ def get_current_date():
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.json
-    db = load_db()
     username = data['username']
 
-    if username in db['users']:
+    if get_user_data(username):
         return jsonify({"error": "Tên đăng nhập đã tồn tại."}), 400
 
     password_hash = generate_password_hash(data['password'])
     
-    db['users'][username] = {
-        'username': username,
-        'password_hash': password_hash,
-        'profile': None,
-        'food_log': []
-    }
-    save_db(db)
+    if not storage.create_user(new_user_record(username, password_hash)):
+        return jsonify({"error": "Tên đăng nhập đã tồn tại."}), 400
     return jsonify({"message": "Đăng ký thành công."}), 201
 
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.json
-    db = load_db()
     username = data['username']
 
-    user = db['users'].get(username)
+    user = get_user_data(username)
     if user and check_password_hash(user['password_hash'], data['password']):
+        # Không giữ lại dữ liệu/id session có từ trước khi đăng nhập (session fixation)
+        session.clear()
+        if hasattr(session, 'regenerate'):
+            session.regenerate()
         session.permanent = True
         session['user_id'] = username 
         return jsonify({"message": "Đăng nhập thành công"}), 200
@@ -350,8 +652,7 @@ def status():
 @login_required
 def handle_profile():
     user_id = session['user_id']
-    db = load_db()
-    user = db['users'][user_id]
+    user = get_user_data(user_id)
 
     if request.method == 'GET':
         return jsonify(user['profile']) if user['profile'] else jsonify(None), 200
@@ -366,25 +667,10 @@ def handle_profile():
         if age <= 0 or height_cm <= 0 or weight_kg <= 0:
              return jsonify({"error": "Tuổi, chiều cao và cân nặng phải lớn hơn 0"}), 400
 
-        tdee = calculate_tdee(data['gender'], age, height_cm, weight_kg, data['activity_level'])
-        
-        target_goal = data['goal'].lower()
-        if target_goal == 'giảm cân':
-            target_calories = tdee - 500
-        elif target_goal == 'tăng cân':
-            target_calories = tdee + 500
-        else:
-            target_calories = tdee
+        profile = build_profile(data['name'], data['gender'], age, height_cm, weight_kg,
+                                data['activity_level'], data['goal'])
 
-        profile = {
-            'name': data['name'], 'gender': data['gender'], 'age': age,
-            'height_cm': height_cm, 'weight_kg': weight_kg,
-            'activity_level': data['activity_level'], 'goal': target_goal,
-            'tdee': tdee, 'target_calories': max(1200, target_calories)
-        }
-        
-        user['profile'] = profile
-        save_db(db)
+        storage.set_profile(user_id, profile)
         return jsonify({"message": "Hồ sơ đã được lưu thành công", "profile": profile}), 200
 
     except Exception as e:
@@ -393,12 +679,140 @@ def handle_profile():
 @app.route('/api/food_log', methods=['GET'])
 @login_required
 def get_food_log():
-    user = get_user_data(session['user_id'])
-    return jsonify(user['food_log'])
+    """Nhật ký ăn uống. Không tham số: cả mảng như trước.
+
+    ?limit=&cursor=&start=&end=&fields= : một trang mới -> cũ {items, next_cursor, version}.
+    ?since=<version>&fields= : chỉ thay đổi từ lần đồng bộ trước {version, added, deleted};
+    reset=true khi lịch sử thay đổi không còn đủ và client phải tải lại từ đầu.
+    """
+    user_id = session['user_id']
+    args = request.args
+    if not any(key in args for key in ('limit', 'cursor', 'start', 'end', 'fields', 'since')):
+        return jsonify(get_user_data(user_id)['food_log'])
+
+    try:
+        limit = min(FOOD_LOG_MAX_PAGE_SIZE, max(1, int(args.get('limit', FOOD_LOG_PAGE_SIZE))))
+        cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+        since = int(args['since']) if 'since' in args else None
+        fields = [field for field in args.get('fields', '').split(',') if field]
+        unknown = [field for field in fields if field not in FOOD_LOG_FIELDS]
+        if unknown:
+            raise ValueError(f"Trường không hợp lệ: {', '.join(unknown)}")
+        for key in ('start', 'end'):
+            if args.get(key):
+                datetime.strptime(args[key], "%Y-%m-%d")
+    except ValueError as e:
+        return jsonify({"error": f"Tham số không hợp lệ: {e}"}), 400
+
+    def project(meals):
+        if not fields:
+            return meals
+        return [{field: meal[field] for field in fields if field in meal} for meal in meals]
+
+    with storage.consistent_read():
+        user = get_user_data(user_id)
+        if user is None:
+            return jsonify({"error": "Không tìm thấy người dùng"}), 404
+        sync = user.get('sync') or new_sync_state()
+        food_index = storage.get_food_log(user_id)
+        if since is not None:
+            delta = changes_since(sync, since)
+            if delta is None:
+                return jsonify({'version': sync['version'], 'reset': True})
+            added, deleted = delta
+            return jsonify({'version': sync['version'], 'reset': False,
+                            'added': project(food_index.with_ids(added)), 'deleted': sorted(deleted)})
+        items, next_cursor = food_index.page(limit, cursor, args.get('start') or None, args.get('end') or None)
+        return jsonify({'items': project(items), 'next_cursor': encode_cursor(next_cursor),
+                        'version': sync['version']})
+
+def resolve_meal_time(custom_date, custom_time):
+    """Tính (timestamp, ngày) của bữa ăn theo giờ Việt Nam."""
+    # Xử lý ngày và giờ - SỬA TIMEZONE VIỆT NAM
+    if custom_date and custom_time:
+        # Tạo timestamp từ ngày và giờ custom
+        try:
+            custom_datetime_str = f"{custom_date} {custom_time}"
+            custom_datetime = datetime.strptime(custom_datetime_str, "%Y-%m-%d %H:%M")
+            # Thêm timezone Việt Nam
+            custom_datetime = custom_datetime.replace(tzinfo=vietnam_tz)
+            timestamp = custom_datetime.isoformat()
+            date_used = custom_date
+            log.debug("📅 Using custom date", date=date_used, timestamp=timestamp)
+        except ValueError as e:
+            log.warning("❌ Lỗi parse datetime", error=e)
+            # Fallback: dùng thời gian hiện tại với timezone Việt Nam
+            timestamp = datetime.now(vietnam_tz).isoformat()
+            date_used = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
+    else:
+        # Dùng thời gian hiện tại với timezone Việt Nam - SỬA QUAN TRỌNG
+        timestamp = datetime.now(vietnam_tz).isoformat()
+        date_used = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
+        log.debug("📅 Using current Vietnam date", date=date_used)
+    return timestamp, date_used
+
+def build_meal_entry(ai_data, timestamp, date_used):
+    """Tạo bản ghi nhật ký từ kết quả phân tích của AI."""
+    return {
+        'id': new_meal_id(),
+        'timestamp': timestamp,
+        'date': date_used,
+        'meal_name': ai_data.get('meal_name', 'Món ăn không xác định'),
+        'calories': int(ai_data.get('estimated_calories', 300)),
+        'description': ai_data.get('description', 'Không có mô tả chi tiết'),
+        'nutrition_analysis': ai_data.get('nutrition_analysis', 'Chưa có phân tích dinh dưỡng')
+    }
+
+def process_meal_job(user_id, img, timestamp, date_used):
+    """Công việc nền: phân tích ảnh rồi lưu bữa ăn vào Nhật ký."""
+    # Phân tích ảnh (dùng lại kết quả cache nếu ảnh đã từng được phân tích)
+    return save_meal(user_id, analyze_meal_image(img), timestamp, date_used)
+
+def process_meal_batch_job(user_id, items):
+    """Công việc nền: phân tích nhiều ảnh rồi lưu mọi bữa ăn trong một lần ghi."""
+    decoded = [item for item in items if 'img' in item]
+    analyses = analyze_meal_images([item['img'] for item in decoded])
+    entries = []
+    for item, ai_data in zip(decoded, analyses):
+        item['data'] = build_meal_entry(ai_data, item['timestamp'], item['date'])
+        entries.append(item['data'])
+    if entries:
+        storage.add_meals(user_id, entries)
+
+    results = []
+    for item in items:
+        result = {'index': item['index'], 'filename': item['filename']}
+        if 'data' in item:
+            result.update({'status': 'ok', 'data': item['data']})
+        else:
+            result.update({'status': 'error', 'error': item['error']})
+        results.append(result)
+    return {'items': results, 'logged': len(entries)}
+
+def submit_image_ingest(stream):
+    """Giải mã ảnh ở process pool (nếu bật) hoặc thread pool; lỗi (kể cả quá tải) nằm trong Future."""
+    started = time.perf_counter()
+    if image_pool is None:
+        future = image_decode_pool.submit(ingest_image, stream)
+    else:
+        try:
+            future = image_pool.submit(stream)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+    pool = 'thread' if image_pool is None else 'process'
+
+    def record(done):
+        outcome = 'ok' if done.exception() is None else type(done.exception()).__name__
+        IMAGE_DECODE_SECONDS.observe(time.perf_counter() - started, pool=pool, outcome=outcome)
+
+    future.add_done_callback(record)
+    return future
 
 @app.route('/api/log_meal', methods=['POST'])
 @login_required
 def log_meal():
+    """Nhận ảnh và trả về job_id ngay; phân tích chạy ở worker nền (?sync=1 để chờ kết quả)."""
     if not client: 
         return jsonify({"error": "Gemini API Client chưa được cấu hình."}), 500
     if 'photo' not in request.files: 
@@ -407,142 +821,113 @@ def log_meal():
     image_file = request.files['photo']
     custom_date = request.form.get('date')
     custom_time = request.form.get('time')
+    user_id = session['user_id']
     
     try:
-        # Đọc và xử lý ảnh
-        image_data = image_file.read()
-        img = Image.open(io.BytesIO(image_data))
-        
-        # Resize ảnh nếu quá lớn
-        if img.size[0] > 1024 or img.size[1] > 1024:
-            img.thumbnail((1024, 1024))
-
-        # Xử lý ngày và giờ - SỬA TIMEZONE VIỆT NAM
-        if custom_date and custom_time:
-            # Tạo timestamp từ ngày và giờ custom
-            try:
-                custom_datetime_str = f"{custom_date} {custom_time}"
-                custom_datetime = datetime.strptime(custom_datetime_str, "%Y-%m-%d %H:%M")
-                # Thêm timezone Việt Nam
-                custom_datetime = custom_datetime.replace(tzinfo=vietnam_tz)
-                timestamp = custom_datetime.isoformat()
-                date_used = custom_date
-                print(f"📅 Using custom date: {date_used}, time: {timestamp}")
-            except ValueError as e:
-                print(f"❌ Lỗi parse datetime: {e}")
-                # Fallback: dùng thời gian hiện tại với timezone Việt Nam
-                timestamp = datetime.now(vietnam_tz).isoformat()
-                date_used = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
-        else:
-            # Dùng thời gian hiện tại với timezone Việt Nam - SỬA QUAN TRỌNG
-            timestamp = datetime.now(vietnam_tz).isoformat()
-            date_used = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
-            print(f"📅 Using current Vietnam date: {date_used}")
-
-        # PROMPT cho Gemini AI - ngắn gọn và hiệu quả
-        prompt = ("""
-Phân tích món ăn trong ảnh. Trả về JSON:
+        # Giải mã ở process pool (đọc từ file tạm của upload), thu nhỏ ngay trong lúc giải mã
+        with span('image.ingest'):
+            img = submit_image_ingest(image_file.stream).result()
 
-{
-    "meal_name": "Tên món ăn",
-    "estimated_calories": số_calories,
-    "description": "Mô tả ngắn",
-    "nutrition_analysis": "Phân tích dinh dưỡng"
-}
+        timestamp, date_used = resolve_meal_time(custom_date, custom_time)
 
-Ví dụ:
-{
-    "meal_name": "Phở bò",
-    "estimated_calories": 450,
-    "description": "Phở bò tái chín, nước dùng thơm",
-    "nutrition_analysis": "Protein từ thịt bò, tinh bột từ bánh phở"
-}
-""")
+        if request.args.get('sync') == '1':
+            meal_entry = process_meal_job(user_id, img, timestamp, date_used)
+            return jsonify({
+                "message": "Món ăn đã được phân tích và ghi nhận thành công", 
+                "data": meal_entry
+            }), 200
 
-        print(f"🔄 Đang gửi ảnh đến Gemini API với model: {GEMINI_MODEL_VISION}")
-        
-        # Gọi Gemini API với retry logic
-        max_retries = 3
-        last_error = None
-        
-        for attempt in range(max_retries):
-            try:
-                response = client.models.generate_content(
-                    model=GEMINI_MODEL_VISION, 
-                    contents=[prompt, img]
-                )
-                print(f"✅ Gemini API phản hồi thành công (lần {attempt + 1})")
-                print(f"📄 Response: {response.text}")
-                ai_data = clean_and_load_json(response.text)
-                break
-            except APIError as e:
-                last_error = e
-                if attempt == max_retries - 1:  # Lần thử cuối
-                    # Nếu vẫn lỗi sau 3 lần thử, dùng fallback
-                    print(f"❌ Gemini API vẫn lỗi sau {max_retries} lần thử: {e}")
-                    ai_data = create_fallback_meal_data()
-                    print(f"📊 Using fallback data: {ai_data}")
-                else:
-                    wait_time = 2 * (2 ** attempt) + random.uniform(0, 1)
-                    print(f"⚠️ Vision API lỗi, thử lại sau {wait_time:.1f} giây... (lần {attempt + 1})")
-                    time.sleep(wait_time)
-            except Exception as e:
-                print(f"❌ Lỗi khác khi gọi API: {e}")
-                ai_data = create_fallback_meal_data()
-                break
-
-        # Lưu vào Nhật ký ăn uống
-        db = load_db()
-        user = db['users'][session['user_id']]
-        
-        meal_entry = {
-            'timestamp': timestamp,
-            'date': date_used,
-            'meal_name': ai_data.get('meal_name', 'Món ăn không xác định'),
-            'calories': int(ai_data.get('estimated_calories', 300)),
-            'description': ai_data.get('description', 'Không có mô tả chi tiết'),
-            'nutrition_analysis': ai_data.get('nutrition_analysis', 'Chưa có phân tích dinh dưỡng')
-        }
-        
-        user['food_log'].append(meal_entry)
-        save_db(db)
+        try:
+            job = meal_jobs.submit(user_id, process_meal_job, user_id, img, timestamp, date_used)
+        except QueueFull:
+            return jsonify({"error": "Hệ thống đang bận, vui lòng thử lại sau."}), 503, {'Retry-After': '5'}
 
         return jsonify({
-            "message": "Món ăn đã được phân tích và ghi nhận thành công", 
-            "data": meal_entry
-        }), 200
-
+            "message": "Đã nhận ảnh, đang phân tích món ăn",
+            "job_id": job.id,
+            "status_url": url_for('get_job', job_id=job.id)
+        }), 202
+
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), 413
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 415
+    except ImagePoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
     except Exception as e:
-        print(f"❌ Unexpected Error in log_meal: {e}")
+        log.exception("❌ Unexpected Error in log_meal", error=e)
         return jsonify({"error": f"Lỗi hệ thống: {str(e)}"}), 500
 
-@app.route('/api/suggest_menu', methods=['GET'])
+@app.route('/api/log_meals', methods=['POST'])
 @login_required
-@retry_on_error(max_retries=3, delay=2)
-def suggest_menu():
+def log_meals():
+    """Ghi nhiều bữa ăn từ nhiều ảnh; các trường photo, date, time lặp lại theo cùng thứ tự."""
     if not client: 
         return jsonify({"error": "Gemini API Client chưa được cấu hình."}), 500
-    
-    user = get_user_data(session['user_id'])
-    profile = user.get('profile')
-    if not profile: 
-        return jsonify({"error": "Vui lòng nhập Hồ sơ cá nhân trước để nhận gợi ý."}), 404
+    photos = request.files.getlist('photo')
+    if not photos:
+        return jsonify({"error": "Không tìm thấy file ảnh"}), 400
+    if len(photos) > MEAL_BATCH_MAX_PHOTOS:
+        return jsonify({"error": f"Tối đa {MEAL_BATCH_MAX_PHOTOS} ảnh mỗi lần"}), 400
 
-    food_log = user['food_log']
-    
-    # SỬA: Dùng Vietnam date để tính calories hôm nay
-    today_date = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
-    today_log = [log for log in food_log if log['date'] == today_date]
-    
-    calories_consumed_today = sum(item.get('calories', 0) for item in today_log)
-    target_calories = profile['target_calories']
-    remaining_calories = target_calories - calories_consumed_today
+    dates = request.form.getlist('date')
+    times = request.form.getlist('time')
+    user_id = session['user_id']
+
+    # Giải mã và thu nhỏ các ảnh song song
+    futures = [submit_image_ingest(photo.stream) for photo in photos]
+    items = []
+    for i, (photo, future) in enumerate(zip(photos, futures)):
+        item = {'index': i, 'filename': photo.filename}
+        try:
+            with span('image.ingest', index=i):
+                item['img'] = future.result()
+        except Exception as e:
+            log.warning("❌ Không đọc được ảnh", filename=photo.filename, error=e)
+            item['error'] = str(e) if isinstance(e, (ImageRejected, InvalidImage, ImagePoolBusy)) else f"Không đọc được ảnh: {str(e)}"
+        else:
+            item['timestamp'], item['date'] = resolve_meal_time(
+                dates[i] if i < len(dates) else None, times[i] if i < len(times) else None)
+        items.append(item)
 
-    # PROMPT ngắn gọn cho gợi ý
-    prompt = f"""
-Người dùng: {profile['name']}, Mục tiêu: {profile['goal']}
-Calories hôm nay: {calories_consumed_today}/{target_calories}kcal
-Calories còn lại: {remaining_calories}kcal
+    if request.args.get('sync') == '1':
+        return jsonify(process_meal_batch_job(user_id, items)), 200
+
+    try:
+        job = meal_jobs.submit(user_id, process_meal_batch_job, user_id, items)
+    except QueueFull:
+        return jsonify({"error": "Hệ thống đang bận, vui lòng thử lại sau."}), 503, {'Retry-After': '5'}
+
+    return jsonify({
+        "message": f"Đã nhận {len(photos)} ảnh, đang phân tích món ăn",
+        "job_id": job.id,
+        "status_url": url_for('get_job', job_id=job.id)
+    }), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Trạng thái công việc phân tích; ?wait=giây để long-poll tới khi xong."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), MEAL_JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    job = meal_jobs.get(job_id, owner=session['user_id'], wait=wait)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy công việc"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/jobs/metrics', methods=['GET'])
+@metrics_required
+def get_job_metrics():
+    """Độ sâu hàng đợi, thời gian chờ và thời gian xử lý của worker phân tích ảnh."""
+    return jsonify(meal_jobs.metrics()), 200
+
+def build_suggestion_prompt(goal, calorie_bucket):
+    """Prompt gợi ý thực đơn (ngắn gọn) cho một mục tiêu và mức calories còn lại đã làm tròn."""
+    return f"""
+Mục tiêu: {goal}
+Calories còn lại hôm nay: khoảng {calorie_bucket}kcal
 
 Gợi ý 3 món ăn phù hợp. Trả về JSON:
 
@@ -554,106 +939,271 @@ Gợi ý 3 món ăn phù hợp. Trả về JSON:
 }}
 """
 
-    try:
-        print(f"🔄 Đang gửi yêu cầu gợi ý đến Gemini API với model: {GEMINI_MODEL_REASONING}")
-        response = client.models.generate_content(model=GEMINI_MODEL_REASONING, contents=[prompt])
-        
-        ai_data = clean_and_load_json(response.text)
-        return jsonify(ai_data), 200
+# --- GỢI Ý THỰC ĐƠN: PHẦN DÙNG CHUNG CHO ĐƯỜNG WSGI VÀ ASGI ---
 
-    except APIError as e:
-        print(f"❌ Gemini API Error, using fallback data: {e}")
-        # Dữ liệu mẫu khi API lỗi
-        fallback_data = generate_fallback_suggestions(profile, remaining_calories)
-        return jsonify(fallback_data), 200
+def menu_context(user_id):
+    """(profile, calories còn lại hôm nay); profile None nếu chưa có hồ sơ."""
+    profile = get_user_data(user_id).get('profile')
+    if not profile:
+        return None, 0
+    # SỬA: Dùng Vietnam date để tính calories hôm nay
+    today_date = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
+    return profile, profile['target_calories'] - storage.get_rollup(user_id).calories(today_date)
+
+def suggestion_cache_key(profile, remaining_calories):
+    return profile['goal'], remaining_calorie_bucket(remaining_calories)
+
+def suggestion_request(cache_key, attempt):
+    """Tham số generate_content/agenerate_content; prompt chỉ phụ thuộc khóa cache (không có tên người dùng)
+    để kết quả dùng chung được."""
+    log.debug("🔄 Đang gửi yêu cầu gợi ý đến Gemini API", model=GEMINI_MODEL_REASONING, attempt=attempt)
+    return {'model': GEMINI_MODEL_REASONING, 'contents': [build_suggestion_prompt(*cache_key)],
+            'kind': 'reasoning', 'attempt': attempt}
+
+def parse_suggestions(response_text):
+    """Gợi ý từ phản hồi của model (giá trị này được cache); ModelResponseInvalid nếu thiếu advice/menu_suggestions
+    để suggest_menu dùng dữ liệu mẫu thay vì cache phản hồi hỏng."""
+    ai_data = parse_model_json(response_text)
+    if not (ai_data.get('advice') and isinstance(ai_data.get('menu_suggestions'), list)):
+        raise ModelResponseInvalid("Phản hồi gợi ý thiếu advice hoặc menu_suggestions")
+    return ai_data
+
+def fallback_suggestions(profile, remaining_calories, error):
+    """Gợi ý mẫu khi không lấy được gợi ý từ model."""
+    if isinstance(error, APIError):
+        log.error("❌ Gemini API Error, using fallback data", error=error)
+    else:
+        log.error("❌ Error, using fallback", error=error)
+    GEMINI_FALLBACKS.inc(kind='reasoning')
+    return generate_fallback_suggestions(profile, remaining_calories)
+
+def personalize_suggestions(ai_data, profile):
+    """Gắn tên người dùng vào bản sao gợi ý lấy từ cache (không sửa bản dùng chung)."""
+    data = dict(ai_data)
+    if data.get('advice'):
+        data['advice'] = f"{profile['name']} ơi, {data['advice']}"
+    return data
+
+@app.route('/api/images/metrics', methods=['GET'])
+@metrics_required
+def get_image_pool_metrics():
+    """Mức bận của process pool giải mã ảnh."""
+    if image_pool is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(image_pool.stats(), enabled=True)), 200
+
+@app.route('/api/suggest_menu', methods=['GET'])
+@login_required
+def suggest_menu():
+    if not client: 
+        return jsonify({"error": "Gemini API Client chưa được cấu hình."}), 500
+    
+    profile, remaining_calories = menu_context(session['user_id'])
+    if not profile: 
+        return jsonify({"error": "Vui lòng nhập Hồ sơ cá nhân trước để nhận gợi ý."}), 404
+
+    cache_key = suggestion_cache_key(profile, remaining_calories)
+    try:
+        ai_data = suggestion_cache.get_or_compute(
+            cache_key, lambda: gemini.single_flight(('suggest',) + cache_key, fetch_suggestions, cache_key))
     except Exception as e:
-        print(f"❌ Error, using fallback: {e}")
-        fallback_data = generate_fallback_suggestions(profile, remaining_calories)
-        return jsonify(fallback_data), 200
+        # Dữ liệu mẫu khi API lỗi
+        return jsonify(fallback_suggestions(profile, remaining_calories, e)), 200
+    return jsonify(personalize_suggestions(ai_data, profile)), 200
+
+# Retry đặt quanh lời gọi API (không phải cả view) để fallback ở suggest_menu chỉ chạy khi đã hết lượt thử
+@retry_on_error(max_retries=3, delay=2, kind='reasoning')
+def fetch_suggestions(cache_key, attempt):
+    return parse_suggestions(gemini.generate_content(**suggestion_request(cache_key, attempt)).text)
+
+@app.route('/api/gemini/metrics', methods=['GET'])
+@metrics_required
+def get_gemini_metrics():
+    """Số lời gọi Gemini thật, số yêu cầu được gộp và số lần bị giới hạn."""
+    return jsonify(gemini.stats()), 200
+
+@app.route('/api/suggestions/cache', methods=['GET'])
+@metrics_required
+def get_suggestion_cache_stats():
+    """Tỉ lệ trúng cache gợi ý thực đơn."""
+    return jsonify(suggestion_cache.stats()), 200
+
+def collect_component_metrics():
+    """Số liệu sẵn có của gateway Gemini, hàng đợi, pool ảnh, các cache và file dữ liệu; đọc lúc scrape
+    nên không tốn gì trên đường xử lý request. Cùng nguồn với các route /api/*/metrics (JSON)."""
+    stats = gemini.stats()
+    yield 'gemini_calls_total', 'counter', "Số lời gọi Gemini thật", {}, stats['calls']
+    yield 'gemini_coalesced_total', 'counter', "Số yêu cầu dùng chung lời gọi đang chạy", {}, stats['coalesced']
+    yield 'gemini_throttled_total', 'counter', "Số lần hết lượt gọi (tốc độ/đồng thời)", {}, stats['throttled']
+    yield 'gemini_active_calls', 'gauge', "Số lời gọi Gemini đang chạy", {}, stats['active']
+    yield 'gemini_breaker_open', 'gauge', "1 nếu circuit breaker đang mở", {}, int(stats['breaker']['state'] == 'open')
+    yield 'gemini_breaker_rejected_total', 'counter', "Số lời gọi bị circuit breaker chặn", {}, \
+        stats['breaker']['rejected']
+
+    stats = meal_jobs.metrics()
+    yield 'jobs_queue_depth', 'gauge', "Số công việc đang chờ worker", {}, stats['queue_depth']
+    yield 'jobs_running', 'gauge', "Số công việc đang chạy", {}, stats['running'] + stats['async_tasks']
+    for status in ('submitted', 'completed', 'failed', 'rejected'):
+        yield 'jobs_total', 'counter', "Số công việc nền theo trạng thái", {'status': status}, stats[status]
+
+    if image_pool is not None:
+        stats = image_pool.stats()
+        yield 'image_pool_in_flight', 'gauge', "Số ảnh đang chờ/đang giải mã ở process pool", {}, stats['in_flight']
+        yield 'image_pool_busy_ratio', 'gauge', "Tỉ lệ thời gian bận của process pool", {}, stats['busy_ratio']
+        for status in ('completed', 'failed', 'rejected'):
+            yield 'image_pool_tasks_total', 'counter', "Số ảnh xử lý ở process pool theo trạng thái", \
+                {'status': status}, stats[status]
+
+    caches = [('suggestions', suggestion_cache.stats()), ('dashboard', dashboard_snapshots.stats())]
+    if vision_cache:
+        caches.append(('vision', vision_cache.stats()))
+    for name, stats in caches:
+        # vision: near_hit = ảnh gần giống (pHash); suggestions: stale = bản hết hạn trả về trong lúc làm mới
+        for result, key in (('hit', 'hits'), ('near_hit', 'near_hits'), ('stale', 'stale_hits'), ('miss', 'misses')):
+            if key in stats:
+                yield 'cache_requests_total', 'counter', "Số lần tra cache theo kết quả", \
+                    {'cache': name, 'result': result}, stats[key]
+        yield 'cache_entries', 'gauge', "Số mục trong cache", {'cache': name}, stats.get('size', stats.get('entries'))
+
+    for path in (storage.file_name, getattr(storage, 'journal_file', None)):
+        if path and os.path.exists(path):
+            yield 'storage_file_bytes', 'gauge', "Kích thước file dữ liệu", \
+                {'backend': storage.name, 'file': os.path.basename(path)}, os.path.getsize(path)
+
+metrics.add_collector(collect_component_metrics)
+
+@app.route('/metrics', methods=['GET'])
+@metrics_required
+def get_metrics():
+    """Mọi số liệu của tiến trình này theo định dạng text của Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# --- PROFILING (QUẢN TRỊ) ---
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+@admin_required
+def admin_profile():
+    """Trạng thái profiler; POST {"enabled", "slow_ms", "interval_ms", "reset"} để bật/tắt và chỉnh ngưỡng."""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profiler.configure(enabled=data.get('enabled'), slow_ms=data.get('slow_ms'),
+                               interval_ms=data.get('interval_ms'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "slow_ms/interval_ms phải là số"}), 400
+        if data.get('reset'):
+            profiler.reset()
+    return jsonify(profiler.status()), 200
+
+@app.route('/api/admin/profile/traces', methods=['GET'])
+@admin_required
+def admin_profile_traces():
+    """Trace gần nhất (mới trước) kèm các span; ?slow=1 chỉ lấy request chậm, ?limit=số trace."""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'traces': profiler.traces(slow_only=request.args.get('slow') == '1', limit=limit)}), 200
+
+def folded_download(text, filename):
+    return Response(text, content_type='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/admin/profile/stacks', methods=['GET'])
+@admin_required
+def admin_profile_stacks():
+    """Mẫu stack của request chậm, định dạng folded (flamegraph.pl, speedscope, inferno)."""
+    return folded_download(profiler.folded_stacks(), 'stacks.folded')
+
+@app.route('/api/admin/profile/spans', methods=['GET'])
+@admin_required
+def admin_profile_spans():
+    """Thời gian riêng của từng span (micro giây) dạng folded; ?slow=1 chỉ tính request chậm."""
+    return folded_download(profiler.folded_spans(slow_only=request.args.get('slow') == '1'), 'spans.folded')
 
 @app.route('/api/delete_meal', methods=['POST'])
 @login_required
 def delete_meal():
     user_id = session['user_id']
-    data = request.json
-    timestamp = data.get('timestamp')
-    
-    db = load_db()
-    user = db['users'][user_id]
-    
-    # Tìm và xóa bữa ăn theo timestamp
-    initial_length = len(user['food_log'])
-    user['food_log'] = [meal for meal in user['food_log'] if meal['timestamp'] != timestamp]
+    data = request.json or {}
+
+    if data.get('id'):
+        removed = len(storage.delete_meal_ids(user_id, [data['id']]))
+    else:
+        # Client cũ chỉ gửi timestamp (xóa mọi bữa cùng timestamp)
+        removed = storage.delete_meals(user_id, [data.get('timestamp')])
     
-    if len(user['food_log']) < initial_length:
-        save_db(db)
+    if removed:
         return jsonify({"message": "Đã xóa bữa ăn thành công"}), 200
     else:
         return jsonify({"error": "Không tìm thấy bữa ăn để xóa"}), 404
 
+@app.route('/api/delete_meals', methods=['POST'])
+@login_required
+def delete_meals():
+    """Xóa nhiều bữa ăn theo id trong một lần ghi: {"ids": [...]}."""
+    ids = (request.json or {}).get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(meal_id, str) for meal_id in ids):
+        return jsonify({"error": "Cần danh sách id bữa ăn"}), 400
+    if len(ids) > MEAL_DELETE_MAX_IDS:
+        return jsonify({"error": f"Tối đa {MEAL_DELETE_MAX_IDS} bữa ăn mỗi lần xóa"}), 400
+
+    deleted = storage.delete_meal_ids(session['user_id'], ids)
+    deleted_set = set(deleted)
+    return jsonify({"deleted": deleted, "not_found": [meal_id for meal_id in ids if meal_id not in deleted_set]}), 200
+
 # --- API CHO TRANG BIỂU ĐỒ ---
 
 @app.route('/api/nutrition_analysis', methods=['GET'])
 @login_required
 def get_nutrition_analysis():
     """API để lấy dữ liệu phân tích dinh dưỡng cho biểu đồ"""
-    user = get_user_data(session['user_id'])
+    analysis = nutrition_analysis_data(session['user_id'], get_user_data(session['user_id']))
+    if analysis is None:
+        return jsonify({"error": "Chưa có hồ sơ"}), 404
+    return jsonify(analysis), 200
+
+def nutrition_analysis_data(user_id, user):
+    """Số liệu phân tích dinh dưỡng của người dùng (None nếu chưa có hồ sơ)."""
     profile = user.get('profile')
     food_log = user['food_log']
     
     if not profile:
-        return jsonify({"error": "Chưa có hồ sơ"}), 404
+        return None
     
-    # Phân tích dữ liệu - SỬA: Dùng Vietnam date
-    today = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
-    today_log = [log for log in food_log if log['date'] == today]
+    # Chỉ mục theo ngày + tổng hợp duy trì sẵn: không quét lại food_log
+    with span('analytics.food_index'):
+        food_index = storage.get_food_log(user_id)
+    rollup = food_index.rollup
     
-    # Lấy dữ liệu 30 ngày gần nhất
-    month_dates = [datetime.now(vietnam_tz).date() - timedelta(days=i) for i in range(30)]
-    month_dates_str = [date.strftime("%Y-%m-%d") for date in month_dates]
-    month_log = [log for log in food_log if log['date'] in month_dates_str]
+    # Phân tích dữ liệu - SỬA: Dùng Vietnam date
+    today_date = datetime.now(vietnam_tz).date()
+    today = today_date.strftime("%Y-%m-%d")
     
-    # Tính toán calories
-    today_calories = sum(item.get('calories', 0) for item in today_log)
-    month_calories = sum(item.get('calories', 0) for item in month_log)
+    # Tính toán calories (30 ngày gần nhất)
+    today_calories = rollup.calories(today)
+    month_calories = rollup.window(30, today_date)['calories']
     
-    month_avg_calories = month_calories / max(len(month_dates), 1)
+    month_avg_calories = month_calories / 30
     
     # Tính toán xu hướng calories 7 ngày
-    daily_calories = []
-    week_dates = [datetime.now(vietnam_tz).date() - timedelta(days=i) for i in range(6, -1, -1)]
-    week_dates_str = [date.strftime("%Y-%m-%d") for date in week_dates]
-    
-    for date in week_dates_str:
-        day_log = [log for log in food_log if log['date'] == date]
-        day_calories = sum(item.get('calories', 0) for item in day_log)
-        daily_calories.append(day_calories)
-    
-    # Phân tích loại món ăn
-    meal_types = analyze_meal_types(food_log)
+    week_dates_str = food_index.last_days(7, today_date)
+    daily_calories = food_index.calories_for_dates(week_dates_str)
+    daily_meals = np.array([rollup.meals(date) for date in week_dates_str])
     
-    # Tính % đạt mục tiêu (7 ngày gần nhất)
-    target_days = 0
-    total_days_with_data = 0
+    # Phân tích loại món ăn (cột NumPy dựng một lần cho mỗi phiên bản food_log)
+    with span('analytics.meal_types'):
+        meal_types = analyze_meal_types(storage.get_columns(user_id))
     
-    for date in week_dates_str:
-        day_log = [log for log in food_log if log['date'] == date]
-        if day_log:  # Chỉ tính ngày có dữ liệu
-            day_calories = sum(item.get('calories', 0) for item in day_log)
-            total_days_with_data += 1
-            if day_calories <= profile['target_calories']:
-                target_days += 1
-    
-    achievement_rate = round((target_days / total_days_with_data) * 100) if total_days_with_data > 0 else 0
+    # Tính % đạt mục tiêu (7 ngày gần nhất, chỉ tính ngày có dữ liệu)
+    week_achievement_rate = achievement_rate(np.array(daily_calories), daily_meals, profile['target_calories'])
     
     # Phân tích xu hướng
-    trend_analysis = analyze_trend(food_log, profile)
+    with span('analytics.trend'):
+        trend_analysis = analyze_trend(food_index, profile)
     
     analysis = {
         'today_calories': today_calories,
         'target_calories': profile['target_calories'],
         'month_avg_calories': round(month_avg_calories),
-        'achievement_rate': achievement_rate,
+        'achievement_rate': week_achievement_rate,
         'meal_types': meal_types,
         'total_meals': len(food_log),
         'daily_calories_trend': daily_calories,
@@ -663,77 +1213,28 @@ def get_nutrition_analysis():
         'trend_analysis': trend_analysis
     }
     
-    return jsonify(analysis), 200
+    return analysis
 
-def analyze_meal_types(food_log):
-    """Phân tích loại món ăn dựa trên tên và thời gian"""
-    meal_categories = {
-        'Sáng': 0,
-        'Trưa': 0, 
-        'Tối': 0,
-        'Phụ': 0
-    }
-    
-    for meal in food_log:
-        meal_name = meal['meal_name'].lower()
-        meal_time = meal['timestamp'] if meal['timestamp'] else None
-        
-        # Phân loại dựa trên thời gian nếu có
-        if meal_time:
-            try:
-                hour = datetime.fromisoformat(meal_time).hour
-                if 5 <= hour < 11:
-                    meal_categories['Sáng'] += 1
-                elif 11 <= hour < 14:
-                    meal_categories['Trưa'] += 1
-                elif 17 <= hour < 22:
-                    meal_categories['Tối'] += 1
-                else:
-                    meal_categories['Phụ'] += 1
-            except:
-                # Fallback: phân loại dựa trên tên món ăn
-                if any(word in meal_name for word in ['sáng', 'bữa sáng', 'điểm tâm']):
-                    meal_categories['Sáng'] += 1
-                elif any(word in meal_name for word in ['trưa', 'bữa trưa']):
-                    meal_categories['Trưa'] += 1
-                elif any(word in meal_name for word in ['tối', 'bữa tối']):
-                    meal_categories['Tối'] += 1
-                else:
-                    meal_categories['Phụ'] += 1
-        else:
-            # Phân loại dựa trên tên món ăn
-            if any(word in meal_name for word in ['sáng', 'bữa sáng', 'điểm tâm']):
-                meal_categories['Sáng'] += 1
-            elif any(word in meal_name for word in ['trưa', 'bữa trưa']):
-                meal_categories['Trưa'] += 1
-            elif any(word in meal_name for word in ['tối', 'bữa tối']):
-                meal_categories['Tối'] += 1
-            else:
-                meal_categories['Phụ'] += 1
-    
-    return meal_categories
-
-def analyze_trend(food_log, profile):
-    """Phân tích xu hướng tiêu thụ"""
-    if len(food_log) < 7:
+def analyze_meal_types(columns):
+    """Phân tích loại món ăn dựa trên thời gian (hoặc tên khi thiếu giờ) - vector hóa bằng NumPy"""
+    return meal_type_histogram(columns)
+
+def analyze_trend(food_index, profile):
+    """Phân tích xu hướng tiêu thụ (food_index: FoodLog đánh chỉ mục theo ngày)"""
+    if len(food_index) < 7:
         return {
             'trend': 'not_enough_data',
             'message': 'Cần thêm dữ liệu để phân tích xu hướng'
         }
     
     # Lấy dữ liệu 14 ngày gần nhất - SỬA: Dùng Vietnam timezone
-    recent_dates = [datetime.now(vietnam_tz).date() - timedelta(days=i) for i in range(13, -1, -1)]
-    recent_dates_str = [date.strftime("%Y-%m-%d") for date in recent_dates]
-    
-    weekly_calories = []
-    for date in recent_dates_str:
-        day_log = [log for log in food_log if log['date'] == date]
-        day_calories = sum(item.get('calories', 0) for item in day_log)
-        weekly_calories.append(day_calories)
+    today_date = datetime.now(vietnam_tz).date()
+    last_14_days = food_index.rollup.window(14, today_date)['calories']
+    last_7_days = food_index.rollup.window(7, today_date)['calories']
     
     # Phân chia thành 2 tuần
-    week1_avg = sum(weekly_calories[:7]) / 7
-    week2_avg = sum(weekly_calories[7:]) / 7
+    week1_avg = (last_14_days - last_7_days) / 7
+    week2_avg = last_7_days / 7
     
     trend_direction = 'stable'
     if week2_avg > week1_avg + 100:
@@ -763,15 +1264,19 @@ def get_improvement_tips():
     """API để lấy gợi ý cải thiện dựa trên dữ liệu hiện tại"""
     user = get_user_data(session['user_id'])
     profile = user.get('profile')
-    food_log = user['food_log']
     
     if not profile:
         return jsonify({"error": "Chưa có hồ sơ"}), 404
     
+    return jsonify({"tips": improvement_tips(session['user_id'], profile)}), 200
+
+def improvement_tips(user_id, profile):
+    """Danh sách gợi ý cải thiện theo calories và số bữa hôm nay."""
     # Phân tích dữ liệu hiện tại - SỬA: Dùng Vietnam date
+    rollup = storage.get_rollup(user_id)
     today = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
-    today_log = [log for log in food_log if log['date'] == today]
-    today_calories = sum(item.get('calories', 0) for item in today_log)
+    today_meals = rollup.meals(today)
+    today_calories = rollup.calories(today)
     remaining_calories = profile['target_calories'] - today_calories
     
     tips = []
@@ -797,17 +1302,51 @@ def get_improvement_tips():
             tips.append("⚖️ Calories chênh lệch. Cân đối lại bữa ăn.")
     
     # Tips chung
-    if len(today_log) < 2:
+    if today_meals < 2:
         tips.append("⏰ Ăn đều 3 bữa/ngày để ổn định năng lượng.")
     
-    if len(today_log) > 5:
+    if today_meals > 5:
         tips.append("🍎 Nhiều bữa nhỏ tốt cho kiểm soát calories!")
     
     # Nếu không có tips nào
     if not tips:
         tips.append("🎉 Chế độ ăn tốt! Tiếp tục duy trì.")
     
-    return jsonify({"tips": tips}), 200
+    return tips
+
+# --- DASHBOARD (MỘT LẦN ĐỌC CHO CẢ TRANG) ---
+
+def build_dashboard(user_id, today):
+    """Gộp status, ngày hiện tại, hồ sơ, nhật ký, phân tích và gợi ý từ cùng một bản dữ liệu."""
+    user = get_user_data(user_id)
+    profile = user.get('profile')
+    return {
+        'status': {'logged_in': True, 'username': user_id, 'has_profile': bool(profile)},
+        'current_date': today,
+        'profile': profile,
+        'food_log': user['food_log'],
+        'nutrition_analysis': nutrition_analysis_data(user_id, user),
+        'improvement_tips': improvement_tips(user_id, profile) if profile else None
+    }
+
+@app.route('/api/dashboard', methods=['GET'])
+@login_required
+def get_dashboard():
+    """Dữ liệu trang chủ/biểu đồ trong một request; gửi If-None-Match để nhận 304 khi không đổi."""
+    user_id = session['user_id']
+    today = datetime.now(vietnam_tz).strftime("%Y-%m-%d")
+    # Giữ khóa storage để không có lần ghi nào chen vào giữa lúc dựng ảnh chụp
+    with storage.consistent_read():
+        revision = storage.get_revision(user_id)
+        if revision is None:
+            return jsonify({"error": "Không tìm thấy người dùng"}), 404
+        snapshot = dashboard_snapshots.get(user_id, revision, today, lambda: build_dashboard(user_id, today))
+
+    response = app.response_class(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    # Trình duyệt phải hỏi lại server mỗi lần (kèm If-None-Match)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Đường phục vụ ASGI: log_meal, suggest_menu và long-poll /api/jobs/<id> chạy như coroutine
+với client Gemini bất đồng bộ, nên hàng nghìn request đang chờ Gemini chỉ dùng chung một thread.
+Các route khác vẫn là view đồng bộ của app.py, chạy trong thread pool.
+
+Từ thư mục ai-food-advisor4:
+    uvicorn asgi:application --port 8000
+    WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:application
+"""
+import asyncio
+from flask import request, jsonify, session, url_for
+from async_views import AsyncViews
+from app import (app, client, gemini, meal_jobs, suggestion_cache, log, login_required, retry_on_error,
+                 lookup_meal_analysis, encode_meal_image, meal_analysis_request, finish_meal_analysis, save_meal,
+                 menu_context, suggestion_cache_key, suggestion_request, parse_suggestions, fallback_suggestions,
+                 personalize_suggestions, resolve_meal_time, submit_image_ingest, MEAL_JOB_MAX_WAIT)
+from jobs import QueueFull
+from image_ingest import ImageRejected, InvalidImage
+from image_pool import ImagePoolBusy
+from profiling import span
+
+application = AsyncViews(app)
+
+# --- HÀM HỖ TRỢ ---
+
+async def run_image_ingest(stream):
+    """submit_image_ingest không chặn event loop (chờ chỗ trong pool và chép ảnh chạy ở thread)."""
+    with span('image.ingest'):
+        future = await asyncio.to_thread(submit_image_ingest, stream)
+        return await asyncio.wrap_future(future)
+
+# Bản asyncio của các hàm cùng tên trong app.py: chỉ khác chỗ chờ, phần xử lý dùng chung với app.py.
+# Fingerprint/mã hóa ảnh tốn CPU, vision cache (SQLite) và storage chặn: chạy qua asyncio.to_thread.
+
+async def analyze_meal_image(img):
+    cache_key, phash, cached = await asyncio.to_thread(lookup_meal_analysis, img)
+    if cached is not None:
+        return cached
+    return dict(await gemini.asingle_flight(('vision', cache_key), request_meal_analysis, img, cache_key, phash))
+
+@retry_on_error(max_retries=3, delay=2, kind='vision')
+async def fetch_meal_analysis(image_part, attempt):
+    return (await gemini.agenerate_content(**meal_analysis_request(image_part, attempt))).text
+
+async def request_meal_analysis(img, cache_key, phash):
+    try:
+        response_text = await fetch_meal_analysis(await asyncio.to_thread(encode_meal_image, img))
+    except Exception as e:
+        return finish_meal_analysis(cache_key, phash, error=e)
+    return await asyncio.to_thread(finish_meal_analysis, cache_key, phash, response_text)
+
+async def process_meal_job(user_id, img, timestamp, date_used):
+    return await asyncio.to_thread(save_meal, user_id, await analyze_meal_image(img), timestamp, date_used)
+
+@retry_on_error(max_retries=3, delay=2, kind='reasoning')
+async def fetch_suggestions(cache_key, attempt):
+    return parse_suggestions((await gemini.agenerate_content(**suggestion_request(cache_key, attempt))).text)
+
+# --- ROUTE BẤT ĐỒNG BỘ (CÙNG URL VÀ PHẢN HỒI VỚI app.py) ---
+
+@application.endpoint('log_meal')
+@login_required
+async def log_meal():
+    if not client:
+        return jsonify({"error": "Gemini API Client chưa được cấu hình."}), 500
+    if 'photo' not in request.files:
+        return jsonify({"error": "Không tìm thấy file ảnh"}), 400
+
+    image_file = request.files['photo']
+    user_id = session['user_id']
+
+    try:
+        img = await run_image_ingest(image_file.stream)
+        timestamp, date_used = resolve_meal_time(request.form.get('date'), request.form.get('time'))
+
+        if request.args.get('sync') == '1':
+            meal_entry = await process_meal_job(user_id, img, timestamp, date_used)
+            return jsonify({
+                "message": "Món ăn đã được phân tích và ghi nhận thành công",
+                "data": meal_entry
+            }), 200
+
+        try:
+            job = meal_jobs.submit_async(user_id, process_meal_job, user_id, img, timestamp, date_used)
+        except QueueFull:
+            return jsonify({"error": "Hệ thống đang bận, vui lòng thử lại sau."}), 503, {'Retry-After': '5'}
+
+        return jsonify({
+            "message": "Đã nhận ảnh, đang phân tích món ăn",
+            "job_id": job.id,
+            "status_url": url_for('get_job', job_id=job.id)
+        }), 202
+
+    except ImageRejected as e:
+        return jsonify({"error": str(e)}), 413
+    except InvalidImage as e:
+        return jsonify({"error": str(e)}), 415
+    except ImagePoolBusy as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        log.exception("❌ Unexpected Error in log_meal", error=e)
+        return jsonify({"error": f"Lỗi hệ thống: {str(e)}"}), 500
+
+@application.endpoint('get_job')
+@login_required
+async def get_job(job_id):
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), MEAL_JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0
+    job = await meal_jobs.get_async(job_id, owner=session['user_id'], wait=wait)
+    if job is None:
+        return jsonify({"error": "Không tìm thấy công việc"}), 404
+    return jsonify(job.to_dict()), 200
+
+@application.endpoint('suggest_menu')
+@login_required
+async def suggest_menu():
+    if not client:
+        return jsonify({"error": "Gemini API Client chưa được cấu hình."}), 500
+
+    profile, remaining_calories = await asyncio.to_thread(menu_context, session['user_id'])
+    if not profile:
+        return jsonify({"error": "Vui lòng nhập Hồ sơ cá nhân trước để nhận gợi ý."}), 404
+
+    cache_key = suggestion_cache_key(profile, remaining_calories)
+    try:
+        ai_data = await suggestion_cache.get_or_compute_async(
+            cache_key, lambda: gemini.asingle_flight(('suggest',) + cache_key, fetch_suggestions, cache_key))
+    except Exception as e:
+        return jsonify(fallback_suggestions(profile, remaining_calories, e)), 200
+    return jsonify(personalize_suggestions(ai_data, profile)), 200
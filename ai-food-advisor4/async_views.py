@@ -0,0 +1,187 @@
+import os
+import sys
+import asyncio
+import inspect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from flask.ctx import RequestContext
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from profiling import mark_event_loop_request
+
+# --- CHẠY FLASK APP TRÊN ASGI: ENDPOINT CHỜ I/O LÀ COROUTINE, CÁC ROUTE KHÁC GIỮ NGUYÊN ---
+# Số thread chạy các route đồng bộ (không phải coroutine) của Flask app
+ASGI_SYNC_THREADS = int(os.environ.get('ASGI_SYNC_THREADS', '8'))
+# Body request lớn hơn mức này được ghi ra file tạm thay vì giữ trong RAM
+ASGI_SPOOL_BYTES = 512 * 1024
+_MISSING = object()
+
+def build_environ(scope, body):
+    """WSGI environ từ ASGI scope để request/session/url_for của Flask hoạt động như cũ."""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+def _run_wsgi(wsgi_app, environ):
+    """Gọi một WSGI app, trả về (status, headers, các khối body)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'], started['headers'] = status, headers
+
+    body = wsgi_app(environ, start_response)
+    try:
+        chunks = list(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return started['status'], started['headers'], chunks
+
+class AsyncViews:
+    """ASGI app bọc Flask app: endpoint nào đăng ký bằng endpoint() thì chạy như coroutine trên event loop
+    (nhiều request chờ Gemini dùng chung một thread), mọi endpoint khác chạy nguyên bản trong thread pool.
+
+    Route, phương thức, before/after_request, session và xử lý lỗi đều lấy từ Flask app nên hai đường
+    phục vụ trả lời giống nhau.
+    """
+
+    def __init__(self, app, sync_threads=ASGI_SYNC_THREADS):
+        self.app = app
+        self._views = {}
+        self._executor = ThreadPoolExecutor(max_workers=sync_threads, thread_name_prefix='asgi-sync')
+
+    def endpoint(self, name):
+        """Thay view của endpoint `name` (đã khai báo bằng @app.route) bằng một coroutine function."""
+        if name not in self.app.view_functions:
+            raise KeyError(f"Flask app không có endpoint {name}")
+
+        def decorator(view):
+            self._views[name] = view
+            return view
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        with SpooledTemporaryFile(max_size=ASGI_SPOOL_BYTES) as body:
+            complete = await self._read_body(scope, receive, body)
+            environ = build_environ(scope, body)
+            view, values = self._match(environ)
+            if not complete:
+                status, headers, chunks = _run_wsgi(RequestEntityTooLarge().get_response(environ), environ)
+            elif view is None:
+                loop = asyncio.get_running_loop()
+                status, headers, chunks = await loop.run_in_executor(self._executor, _run_wsgi, self.app, environ)
+            else:
+                status, headers, chunks = await self._dispatch(view, values, environ)
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+
+    async def _read_body(self, scope, receive, body):
+        """Nhận body vào file tạm; False (413) ngay khi Content-Length hoặc số byte đã nhận vượt
+        MAX_CONTENT_LENGTH, phần còn lại không được đọc."""
+        limit = self.app.config.get('MAX_CONTENT_LENGTH')
+        declared = dict(scope.get('headers', [])).get(b'content-length')
+        if limit is not None and declared is not None and declared.isdigit() and int(declared) > limit:
+            return False
+        received = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            received += len(chunk)
+            if limit is not None and received > limit:
+                return False
+            body.write(chunk)
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return True
+
+    def _match(self, environ):
+        try:
+            endpoint, values = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None, None
+        return self._views.get(endpoint), values
+
+    async def _in_thread(self, func, *args):
+        """func(*args) ở thread pool trong bản sao context hiện tại; contextvar mà func đặt (trace của
+        profiler...) được chép lại vào context của coroutine."""
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, context.run, func, *args)
+        for var, value in context.items():
+            if var.get(_MISSING) is not value:
+                var.set(value)
+        return result
+
+    async def _dispatch(self, view, values, environ):
+        """Như Flask.full_dispatch_request nhưng await view.
+
+        Phần đồng bộ quanh view (mở session từ kho dùng chung, before_request, after_request và lưu session)
+        chạy ở thread pool, event loop chỉ chạy view.
+        """
+        app = self.app
+        request = app.request_class(environ)
+        request.json_module = app.json
+        session = await self._in_thread(app.session_interface.open_session, app, request)
+        if session is None:
+            session = app.session_interface.make_null_session(app)
+        mark_event_loop_request()
+        with RequestContext(app, environ, request=request, session=session):
+            try:
+                try:
+                    rv = await self._in_thread(app.preprocess_request)
+                    if rv is None:
+                        rv = view(**values)
+                        # login_required... trả về response ngay (không phải coroutine) khi chưa đăng nhập
+                        if inspect.isawaitable(rv):
+                            rv = await rv
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = await self._in_thread(app.finalize_request, rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+            return _run_wsgi(response, environ)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
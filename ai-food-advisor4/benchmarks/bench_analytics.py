@@ -0,0 +1,114 @@
+"""So sánh tốc độ phân tích cho trang biểu đồ: vòng lặp Python cũ và cách endpoint đang tính
+(tổng theo ngày / cửa sổ từ CalorieRollup, loại bữa và % đạt mục tiêu từ cột NumPy).
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/bench_analytics.py [số_bữa ...]
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from analytics import MealColumns, achievement_rate, meal_type_histogram
+from rollups import CalorieRollup
+
+vietnam_tz = timezone(timedelta(hours=7))
+TARGET_CALORIES = 1800
+
+def make_log(count, today):
+    """Sinh food_log ngẫu nhiên trải đều trên count / 3 ngày gần nhất."""
+    random.seed(count)
+    days = max(1, count // 3)
+    food_log = []
+    for _ in range(count):
+        moment = datetime.combine(today - timedelta(days=random.randrange(days)), datetime.min.time(),
+                                  tzinfo=vietnam_tz) + timedelta(minutes=random.randrange(24 * 60))
+        food_log.append({
+            'timestamp': moment.isoformat(),
+            'date': moment.strftime("%Y-%m-%d"),
+            'meal_name': 'Phở bò',
+            'calories': random.randint(150, 900),
+            'description': 'Phở nước dùng thơm ngon với thịt bò tái, chín',
+            'nutrition_analysis': 'Món ăn truyền thống Việt Nam'
+        })
+    return food_log
+
+# --- Cách tính cũ (vòng lặp Python trên từng bữa ăn) ---
+
+def legacy_analysis(food_log, today):
+    today_str = today.strftime("%Y-%m-%d")
+    today_calories = sum(item.get('calories', 0) for item in food_log if item['date'] == today_str)
+    month_dates_str = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(30)]
+    month_calories = sum(item.get('calories', 0) for item in food_log if item['date'] in month_dates_str)
+    week_dates_str = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
+    daily = [sum(item.get('calories', 0) for item in food_log if item['date'] == date) for date in week_dates_str]
+    target_days = total_days = 0
+    for date in week_dates_str:
+        day_log = [log for log in food_log if log['date'] == date]
+        if day_log:
+            total_days += 1
+            if sum(item.get('calories', 0) for item in day_log) <= TARGET_CALORIES:
+                target_days += 1
+    categories = {'Sáng': 0, 'Trưa': 0, 'Tối': 0, 'Phụ': 0}
+    for meal in food_log:
+        hour = datetime.fromisoformat(meal['timestamp']).hour
+        if 5 <= hour < 11:
+            categories['Sáng'] += 1
+        elif 11 <= hour < 14:
+            categories['Trưa'] += 1
+        elif 17 <= hour < 22:
+            categories['Tối'] += 1
+        else:
+            categories['Phụ'] += 1
+    recent = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(13, -1, -1)]
+    weekly = [sum(item.get('calories', 0) for item in food_log if item['date'] == date) for date in recent]
+    return today_calories, month_calories, daily, target_days, total_days, categories, weekly
+
+# --- Cách endpoint đang tính: rollup + cột NumPy (cả hai dựng một lần cho mỗi phiên bản food_log) ---
+
+def build_indexes(food_log):
+    return MealColumns.from_log(food_log), CalorieRollup.from_entries(food_log)
+
+def served_analysis(indexes, today):
+    columns, rollup = indexes
+    week_dates_str = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
+    week_calories = np.array([rollup.calories(date) for date in week_dates_str])
+    week_meals = np.array([rollup.meals(date) for date in week_dates_str])
+    rate = achievement_rate(week_calories, week_meals, TARGET_CALORIES)
+    last_14_days = rollup.window(14, today)['calories']
+    last_7_days = rollup.window(7, today)['calories']
+    trend = ((last_14_days - last_7_days) / 7, last_7_days / 7)
+    return (rollup.calories(today.strftime("%Y-%m-%d")), rollup.window(30, today)['calories'], rate,
+            meal_type_histogram(columns), trend)
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    today = datetime.now(vietnam_tz).date()
+    print(f"{'bữa ăn':>10} | {'cũ (ms)':>10} | {'dựng chỉ mục (ms)':>17} | {'mỗi request (ms)':>16} | "
+          f"{'tăng tốc':>9}")
+    for count in sizes:
+        food_log = make_log(count, today)
+        legacy_time, legacy = timed(legacy_analysis, food_log, today, repeat=1 if count >= 500_000 else 3)
+        build_time, indexes = timed(build_indexes, food_log)
+        served_time, result = timed(served_analysis, indexes, today)
+        # Kết quả phải khớp cách tính cũ
+        legacy_rate = round(legacy[3] / legacy[4] * 100) if legacy[4] else 0
+        assert result[:4] == (legacy[0], legacy[1], legacy_rate, legacy[5]), "Kết quả lệch với cách tính cũ"
+        print(f"{count:>10} | {legacy_time * 1000:>10.1f} | {build_time * 1000:>17.1f} | "
+              f"{served_time * 1000:>16.3f} | {legacy_time / served_time:>8.0f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""So sánh đường đồng bộ (gunicorn gthread, app:app) và đường ASGI (uvicorn worker, asgi:application)
+khi nhiều request /api/log_meal?sync=1 cùng chờ Gemini.
+
+Gemini là benchmarks/fake_gemini.py với độ trễ cố định; mỗi request gửi một ảnh khác nhau (tắt vision cache)
+nên request nào cũng gọi Gemini. Đo thời gian, độ trễ, số request lỗi và số thread lớn nhất của server.
+Số lời gọi Gemini đồng thời giữ ở --gemini-concurrency (mặc định 100, bằng pool kết nối httpx của client.aio);
+request vượt quá chờ ở semaphore của gateway, không giữ thread.
+
+Client là asyncio thuần (mỗi request một kết nối) để chính client không thành nút thắt khi có hàng trăm request.
+
+Chạy từ thư mục ai-food-advisor4 (cần gunicorn, uvicorn):
+    python benchmarks/bench_async.py [--requests 500] [--latency 1.0] [--sync-threads 64] [--gemini-concurrency 100]
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    'sync': ('app:app', 'gthread'),
+    'asgi': ('asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def make_photos(count):
+    """Ảnh nhiễu nhỏ, mỗi ảnh một nội dung khác nhau."""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    photos = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 256, size=(64, 64, 3), dtype=np.uint8)).save(buffer, 'JPEG')
+        photos.append(buffer.getvalue())
+    return photos
+
+def tree_threads(pid):
+    """Tổng số thread của tiến trình pid và các tiến trình con."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                total += int(next(line for line in status if line.startswith('Threads:')).split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as children:
+                pending.extend(int(child) for child in children.read().split())
+        except (OSError, StopIteration):
+            pass
+    return total
+
+async def http_request(port, method, path, body=b'', headers=None):
+    """Một request HTTP/1.1 trên kết nối mới; trả về (status, headers, body)."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\nContent-Length: {len(body)}\r\n'
+        for name, value in (headers or {}).items():
+            head += f'{name}: {value}\r\n'
+        writer.write(head.encode('latin1') + b'\r\n' + body)
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin1').split('\r\n')
+    return int(lines[0].split(' ')[1]), [line.split(': ', 1) for line in lines[1:]], content
+
+def multipart(photo):
+    boundary = 'bench-boundary'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="photo"; filename="meal.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode('latin1') + photo + f'\r\n--{boundary}--\r\n'.encode('latin1')
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+async def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if (await http_request(port, 'GET', '/api/status'))[0] == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server không khởi động kịp")
+
+async def login(port):
+    credentials = json.dumps({'username': 'bench', 'password': 'bench'}).encode('utf-8')
+    await http_request(port, 'POST', '/api/register', credentials, {'Content-Type': 'application/json'})
+    _, headers, _ = await http_request(port, 'POST', '/api/login', credentials, {'Content-Type': 'application/json'})
+    return next(value for name, value in headers if name.lower() == 'set-cookie').split(';', 1)[0]
+
+async def drive(port, server_pid, photos):
+    await wait_ready(port)
+    cookie = await login(port)
+    peak_threads = tree_threads(server_pid)
+    latencies = []
+    errors = 0
+
+    async def one(photo):
+        nonlocal errors
+        body, headers = multipart(photo)
+        start = time.perf_counter()
+        try:
+            status = (await http_request(port, 'POST', '/api/log_meal?sync=1', body, dict(headers, Cookie=cookie)))[0]
+        except OSError:
+            status = None
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors += 1
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while True:
+            peak_threads = max(peak_threads, tree_threads(server_pid))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.ensure_future(sample_threads())
+    start = time.perf_counter()
+    await asyncio.gather(*(one(photo) for photo in photos))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    return elapsed, sorted(latencies), errors, peak_threads
+
+def run(mode, photos, sync_threads, gemini_concurrency, fake_port):
+    target, worker_class = MODES[mode]
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = dict(os.environ, BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY='1', WEB_WORKER_CLASS=worker_class,
+                   WEB_THREADS=str(sync_threads), GEMINI_API_KEY='fake',
+                   GEMINI_BASE_URL=f'http://127.0.0.1:{fake_port}', GEMINI_MAX_CONCURRENCY=str(gemini_concurrency),
+                   GEMINI_RATE_PER_SEC='100000', GEMINI_RATE_BURST='100000', MEAL_JOB_QUEUE_SIZE=str(len(photos)),
+                   VISION_CACHE_ENABLED='0', IMAGE_POOL_WORKERS='0', STORAGE_BACKEND='sqlite',
+                   SQLITE_FILE=os.path.join(tmp, 'db.sqlite3'), SECRET_KEY='bench')
+        server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', target], cwd=APP_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            return asyncio.run(drive(port, server.pid, photos))
+        finally:
+            server.terminate()
+            server.wait(30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--sync-threads', type=int, default=64)
+    parser.add_argument('--gemini-concurrency', type=int, default=100)
+    parser.add_argument('--modes', default='sync,asgi')
+    args = parser.parse_args()
+
+    photos = make_photos(args.requests)
+    fake_port = free_port()
+    fake = subprocess.Popen([sys.executable, os.path.join(APP_DIR, 'benchmarks', 'fake_gemini.py'),
+                             '--port', str(fake_port), '--latency', str(args.latency)], stdout=subprocess.DEVNULL)
+    try:
+        print(f"{args.requests} request đồng thời, Gemini giả lập trễ {args.latency:g}s, "
+              f"{os.cpu_count()} CPU, 1 worker (gthread: {args.sync_threads} thread)")
+        print(f"{'mode':>5} | {'tổng (s)':>8} | {'req/s':>7} | {'p50 s':>6} | {'p95 s':>6} | {'max s':>6} | "
+              f"{'lỗi':>4} | {'thread max':>10}")
+        for mode in args.modes.split(','):
+            elapsed, latencies, errors, threads = run(mode, photos, args.sync_threads, args.gemini_concurrency,
+                                                     fake_port)
+
+            def percentile(q):
+                return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+            print(f"{mode:>5} | {elapsed:>8.2f} | {len(latencies) / elapsed:>7.1f} | {percentile(0.5):>6.2f} | "
+                  f"{percentile(0.95):>6.2f} | {latencies[-1]:>6.2f} | {errors:>4} | {threads:>10}")
+    finally:
+        fake.terminate()
+        fake.wait(10)
+
+if __name__ == '__main__':
+    main()
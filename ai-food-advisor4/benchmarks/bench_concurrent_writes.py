@@ -0,0 +1,225 @@
+"""Stress test ghi đồng thời vào backend JSON: nhiều tiến trình (như worker gunicorn) x nhiều thread cùng
+add_meals vào một db.json, gộp journal thường xuyên (--compact-ops) để save_data chạy liên tục.
+
+Báo cáo:
+    ghi          số bữa/giây, độ trễ add_meals p50/p95/p99/max (gồm chờ khóa và fsync journal)
+    chờ khóa     số lần lấy khóa file, thời gian chờ trung bình và tỉ lệ chờ quá 1ms / 10ms (storage_lock_wait_seconds)
+    gộp journal  số lần và thời gian trung bình của compact (ghi snapshot nguyên tử + fsync + xoay sao lưu)
+    snapshot     thời gian save_data (nguyên tử) so với ghi đè tại chỗ như trước đây, trên snapshot cuối
+Sau đó kiểm tra mọi bữa đã ghi xong đều còn khi mở lại db.
+
+--crash-rounds N: N lần chạy một tiến trình ghi liên tục (gộp journal mỗi 20 thao tác) rồi kill -9 ở thời điểm
+ngẫu nhiên; sau mỗi lần mở lại db (snapshot phải đọc được, không rơi về bản sao lưu) và kiểm tra không mất
+bữa nào đã được xác nhận.
+
+Chạy từ thư mục ai-food-advisor4 (cần fcntl, tức Linux/macOS):
+    python benchmarks/bench_concurrent_writes.py [--processes 4] [--threads 2] [--seconds 10] [--users 20]
+        [--compact-ops 200] [--crash-rounds 5] [--format json]
+"""
+import os
+import sys
+import time
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage as storage_module
+from storage import JsonStorage, new_user_record, encode_snapshot, save_data, backup_files
+
+def meal(rng, worker):
+    return {'timestamp': f'2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00',
+            'date': '2024-05-01', 'meal_name': f'Món {worker}', 'calories': rng.randint(100, 900),
+            'description': 'Bữa ăn stress test', 'nutrition_analysis': 'Không có'}
+
+def histogram_totals(metric):
+    """{nhãn: (số lần, tổng giây, {cận trên bucket: số lần <= cận})} của một histogram trong tiến trình này."""
+    totals = {}
+    for suffix, labels, value in metric.samples():
+        labels = dict(labels)
+        le = labels.pop('le', None)
+        key = tuple(sorted(labels.items()))
+        count, total, buckets = totals.get(key, (0, 0.0, {}))
+        if suffix == '_bucket':
+            buckets[float(le)] = value
+        elif suffix == '_sum':
+            total = value
+        else:
+            count = value
+        totals[key] = (count, total, buckets)
+    return totals
+
+def writer(db_file, fmt, users, threads, seconds, compact_ops, worker, results):
+    """Một tiến trình: `threads` thread add_meals liên tục trong `seconds` giây."""
+    storage_module.JOURNAL_COMPACT_OPS = compact_ops
+    storage = JsonStorage(db_file, snapshot_format=fmt)
+    latencies, acked = [], []
+    deadline = time.perf_counter() + seconds
+
+    def run(index):
+        rng = random.Random(worker * 1000 + index)
+        while time.perf_counter() < deadline:
+            entry = meal(rng, worker)
+            started = time.perf_counter()
+            storage.add_meals(rng.choice(users), [entry])
+            latencies.append(time.perf_counter() - started)
+            acked.append(entry['id'])
+
+    pool = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    storage.close()
+    results.put({'latencies': latencies, 'acked': acked,
+                 'lock_wait': histogram_totals(storage_module.STORAGE_LOCK_WAIT_SECONDS),
+                 'operations': histogram_totals(storage_module.STORAGE_OPERATION_SECONDS)})
+
+def crash_writer(db_file, fmt, users, conn):
+    """Ghi liên tục, gửi id của từng bữa đã ghi xong về tiến trình cha cho tới khi bị kill."""
+    storage_module.JOURNAL_COMPACT_OPS = 20
+    storage = JsonStorage(db_file, snapshot_format=fmt)
+    rng = random.Random(os.getpid())
+    while True:
+        entry = meal(rng, 'crash')
+        storage.add_meals(rng.choice(users), [entry])
+        conn.send(entry['id'])
+
+def stored_ids(db_file, fmt):
+    storage = JsonStorage(db_file, snapshot_format=fmt)
+    try:
+        return {meal['id'] for user in storage.load_all()['users'].values() for meal in user['food_log']}
+    finally:
+        storage.close()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def merge_histograms(parts):
+    merged = {}
+    for part in parts:
+        for key, (count, total, buckets) in part.items():
+            old_count, old_total, old_buckets = merged.get(key, (0, 0.0, {}))
+            merged[key] = (old_count + count, old_total + total,
+                           {bound: old_buckets.get(bound, 0) + n for bound, n in buckets.items()})
+    return merged
+
+def stress(args, db_file, users):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=writer, args=(db_file, args.format, users, args.threads,
+                                                              args.seconds, args.compact_ops, worker, results))
+                 for worker in range(args.processes)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    parts = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [value for part in parts for value in part['latencies']]
+    acked = {meal_id for part in parts for meal_id in part['acked']}
+    print(f"{args.processes} tiến trình x {args.threads} thread, {args.seconds:.0f}s, gộp journal mỗi "
+          f"{args.compact_ops} thao tác, snapshot {args.format}")
+    print(f"ghi: {len(latencies)} bữa ({len(latencies) / elapsed:.0f} bữa/s); độ trễ add_meals ms "
+          f"p50 {percentile(latencies, 0.5) * 1000:.2f} | p95 {percentile(latencies, 0.95) * 1000:.2f} | "
+          f"p99 {percentile(latencies, 0.99) * 1000:.2f} | max {max(latencies, default=0) * 1000:.2f}")
+    for key, (count, total, buckets) in sorted(merge_histograms(part['lock_wait'] for part in parts).items()):
+        if count:
+            print(f"chờ khóa {dict(key)['mode']:>9}: {count} lần, trung bình {total / count * 1000:.3f} ms, "
+                  f"> 1ms {(1 - buckets[0.001] / count) * 100:.1f}%, > 10ms {(1 - buckets[0.01] / count) * 100:.1f}%")
+    operations = merge_histograms(part['operations'] for part in parts)
+    count, total, _ = operations.get((('backend', 'json'), ('op', 'compact')), (0, 0.0, {}))
+    if count:
+        print(f"gộp journal: {count} lần, trung bình {total / count * 1000:.1f} ms")
+
+    missing = acked - stored_ids(db_file, args.format)
+    print(f"kiểm tra: {len(acked)} bữa đã xác nhận, thiếu {len(missing)}")
+    return not missing
+
+def compare_snapshot_writes(args, db_file):
+    """save_data nguyên tử (file tạm + fsync + os.replace + fsync thư mục) so với ghi đè tại chỗ như trước."""
+    storage = JsonStorage(db_file, snapshot_format=args.format)
+    db = dict(storage.load_all(), journal_seq=0)
+    storage.close()
+    target = db_file + '.compare'
+
+    def in_place():
+        with open(target, 'wb') as f:
+            f.write(encode_snapshot(db, args.format))
+
+    def atomic():
+        save_data(target, db, args.format, backups=0)
+
+    timings = {}
+    for label, func in (('tại chỗ (cũ)', in_place), ('nguyên tử', atomic)):
+        best = float('inf')
+        for _ in range(5):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        timings[label] = best
+    size = os.path.getsize(target) / 1e6
+    print(f"ghi snapshot {size:.1f} MB: " + ', '.join(f'{label} {value * 1000:.1f} ms'
+                                                    for label, value in timings.items()))
+
+def crash_rounds(args, db_file, users):
+    ok = True
+    for round_index in range(args.crash_rounds):
+        parent, child = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=crash_writer, args=(db_file, args.format, users, child))
+        process.start()
+        child.close()
+        time.sleep(random.uniform(0.3, 1.5))
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+        acked = set()
+        while parent.poll():
+            try:
+                acked.add(parent.recv())
+            except EOFError:
+                break
+        parent.close()
+        # Snapshot chính phải đọc được (không phải rơi về bản sao lưu)
+        with open(db_file, 'rb') as f:
+            storage_module.decode_snapshot(f.read())
+        missing = acked - stored_ids(db_file, args.format)
+        ok = ok and not missing
+        print(f"crash {round_index + 1}: kill -9 sau {len(acked)} bữa đã xác nhận, thiếu {len(missing)}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--compact-ops', type=int, default=200)
+    parser.add_argument('--crash-rounds', type=int, default=5)
+    parser.add_argument('--format', default='json', choices=storage_module.SNAPSHOT_FORMATS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'db.json')
+        users = [f'stress{index}' for index in range(args.users)]
+        storage = JsonStorage(db_file, snapshot_format=args.format)
+        for username in users:
+            storage.create_user(new_user_record(username, 'hash'))
+        storage.close()
+
+        ok = stress(args, db_file, users)
+        compare_snapshot_writes(args, db_file)
+        ok = crash_rounds(args, db_file, users) and ok
+        backups = [path for path in backup_files(db_file) if os.path.exists(path)]
+        print(f"bản sao lưu: {len(backups)}; file tạm còn lại: "
+              f"{sum(1 for name in os.listdir(tmp) if '.tmp-' in name)}")
+    print("✅ Không mất dữ liệu" if ok else "❌ Mất dữ liệu đã xác nhận")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""So sánh cách nhận ảnh tải lên: đọc hết vào RAM + giải mã đủ kích thước (cũ)
+và giải mã thu nhỏ từ file tạm bằng draft() + mã hóa JPEG gọn (image_ingest).
+
+Mỗi cách chạy trong một tiến trình con riêng để đo peak RSS chính xác (ru_maxrss được giữ qua exec,
+nên tiến trình cha không tự tạo ảnh).
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/bench_ingest.py [số_lần]
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Ảnh điện thoại 12 MP
+PHOTO_SIZE = (4032, 3024)
+
+def make_photo(path):
+    """Ảnh JPEG 12 MP có nhiễu để dung lượng giống ảnh chụp thật."""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:PHOTO_SIZE[1], 0:PHOTO_SIZE[0]]
+    base = np.stack([(x * 255 // PHOTO_SIZE[0]), (y * 255 // PHOTO_SIZE[1]), ((x + y) % 256)], axis=-1)
+    noise = rng.integers(0, 40, size=base.shape)
+    Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8)).save(path, 'JPEG', quality=90)
+
+def legacy(path):
+    from PIL import Image
+    with open(path, 'rb') as upload:
+        image_data = upload.read()
+    img = Image.open(io.BytesIO(image_data))
+    if img.size[0] > 1024 or img.size[1] > 1024:
+        img.thumbnail((1024, 1024))
+    img.load()
+    # SDK mã hóa PIL Image không có filename thành PNG trước khi gửi
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return len(buffer.getvalue())
+
+def streaming(path):
+    from image_ingest import ingest_image, to_model_part
+    # Giống werkzeug: upload lớn nằm trong SpooledTemporaryFile (đã tràn ra đĩa)
+    with open(path, 'rb') as upload, tempfile.SpooledTemporaryFile(max_size=500 * 1024) as spooled:
+        shutil.copyfileobj(upload, spooled)
+        spooled.seek(0)
+        img = ingest_image(spooled)
+    return len(to_model_part(img).inline_data.data)
+
+VARIANTS = {'cũ': legacy, 'streaming': streaming}
+
+def run_child(name, path, repeat):
+    func = VARIANTS[name]
+    from PIL import Image  # noqa: F401  (nạp thư viện trước khi lấy mốc RSS)
+    import image_ingest  # noqa: F401
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = func(path)
+        timings.append(time.perf_counter() - start)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'latency_ms': sum(timings) / len(timings) * 1000,
+                      'peak_rss_mb': (peak - baseline) / 1024, 'payload_kb': payload / 1024}))
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'photo.jpg')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--make', path], check=True)
+        print(f"Ảnh {PHOTO_SIZE[0]}x{PHOTO_SIZE[1]}, {os.path.getsize(path) / (1024 * 1024):.1f}MB, {repeat} lần")
+        print(f"{'cách':>10} | {'ms/ảnh':>8} | {'peak RSS tăng (MB)':>18} | {'gửi model (KB)':>14}")
+        for name in VARIANTS:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', name, path, str(repeat)],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:>10} | {result['latency_ms']:>8.1f} | {result['peak_rss_mb']:>18.1f} | "
+                  f"{result['payload_kb']:>14.1f}")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--make':
+        make_photo(sys.argv[2])
+    elif len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
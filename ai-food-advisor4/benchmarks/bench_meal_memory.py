@@ -0,0 +1,88 @@
+"""Bộ nhớ và tốc độ của bữa ăn dạng dict (như khi đọc db.json/SQLite) so với MealRecord dạng gọn.
+
+Dữ liệu: nhật ký tổng hợp từ benchmarks/generate_data.generate_food_log, ghi ra JSON rồi đọc lại để mọi chuỗi là
+object riêng như khi nạp từ file. Bộ nhớ đo bằng tracemalloc (gồm list chứa các bữa ăn); thời gian gồm:
+chuyển dict -> MealRecord, dựng chỉ mục FoodLog, dựng cột NumPy (MealColumns), serialize JSON cả nhật ký.
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/bench_meal_memory.py [--meals 1000000] [--users 50]
+"""
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from serialization import dumps, loads
+from meal_records import compact_food_log
+from meal_ids import new_meal_id
+from food_log import FoodLog
+from analytics import MealColumns
+from profiles import build_profile
+from generate_data import generate_food_log
+
+def synthetic_meals(count, users):
+    """count bữa ăn của `users` người dùng (mỗi người một thói quen), có id như dữ liệu thật."""
+    meals, index = [], 0
+    per_user = -(-count // users)
+    while len(meals) < count:
+        rng = random.Random(index)
+        profile = build_profile('', 'nữ', 30, 156, 52, 'bình thường', 'giữ cân')
+        days = int(per_user / 2.6) + 1
+        food_log = generate_food_log(rng, profile, date.today() - timedelta(days=days - 1), days, 3.0)
+        for meal in food_log[:count - len(meals)]:
+            meal['id'] = new_meal_id()
+        meals.extend(food_log[:count - len(meals)])
+        index += 1
+    # Đi qua JSON: chuỗi của từng bữa là object riêng, như khi nạp snapshot
+    return loads(dumps(meals))
+
+def measure(build):
+    """(kết quả, số byte còn giữ sau khi build(), thời gian); thời gian đo ở lần chạy riêng không có tracemalloc."""
+    gc.collect()
+    started = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--meals', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    raw = dumps(synthetic_meals(args.meals, args.users))
+    dict_meals, dict_bytes, dict_load = measure(lambda: loads(raw))
+    records, record_bytes, record_load = measure(lambda: compact_food_log(loads(raw)))
+    assert records == dict_meals, "MealRecord đọc ra khác dict gốc"
+    per_million = 1_000_000 / args.meals
+
+    print(f"{args.meals} bữa ăn ({len(raw) / 1e6:.0f} MB JSON), {args.users} người dùng")
+    print(f"{'dạng':>10} | {'B/bữa':>6} | {'MB/1M bữa':>9} | {'nạp (s)':>7} | {'FoodLog (s)':>11} | "
+          f"{'cột (s)':>7} | {'JSON (s)':>8}")
+    for label, meals, size, load in (('dict', dict_meals, dict_bytes, dict_load),
+                                     ('MealRecord', records, record_bytes, record_load)):
+        print(f"{label:>10} | {size / args.meals:>6.0f} | {size * per_million / 2 ** 20:>9.0f} | {load:>7.2f} | "
+              f"{timed(FoodLog, meals):>11.2f} | {timed(MealColumns.from_log, meals):>7.2f} | "
+              f"{timed(dumps, meals):>8.2f}")
+    print(f"Tiết kiệm {(1 - record_bytes / dict_bytes) * 100:.0f}% bộ nhớ")
+
+if __name__ == '__main__':
+    main()
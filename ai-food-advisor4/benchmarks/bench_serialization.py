@@ -0,0 +1,119 @@
+"""So sánh cách ghi/đọc snapshot db.json và serialize phản hồi JSON trên dữ liệu tổng hợp lớn.
+
+Các cách ghi snapshot:
+    cũ           json.dump(indent=4, ensure_ascii=False) / json.load như save_data/load_data trước đây
+    <backend>    encode_snapshot/decode_snapshot với SNAPSHOT_FORMAT=json (gọn) cho từng JSON_BACKEND đang cài
+    <backend>+indent  json-indent (thụt lề 2) để so phần tốn cho khoảng trắng
+    msgpack      SNAPSHOT_FORMAT=msgpack, bữa ăn dạng mảng (cần msgpack hoặc msgspec)
+Mỗi cách báo thời gian ghi (gồm mã hóa và ghi file), thời gian đọc, kích thước file.
+Phần phản hồi đo thời gian serialize một trang /api/food_log (--page-size bữa) và cả nhật ký của một người dùng.
+
+Dữ liệu sinh bằng benchmarks/generate_data.generate_user (cùng seed cho cùng dữ liệu).
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/bench_serialization.py [--users 200] [--days 365] [--page-size 1000] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import serialization
+from storage import encode_snapshot, decode_snapshot
+from generate_data import generate_user
+
+def available_backends():
+    return [name for name, module in (('orjson', serialization.orjson), ('msgspec', serialization.msgspec),
+                                      ('json', json)) if module is not None]
+
+def legacy_save(path, db):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(db, f, ensure_ascii=False, indent=4)
+
+def legacy_load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def snapshot_save(fmt):
+    def save(path, db):
+        raw = encode_snapshot(db, fmt)
+        with open(path, 'wb') as f:
+            f.write(raw)
+    return save
+
+def snapshot_load(path):
+    with open(path, 'rb') as f:
+        return decode_snapshot(f.read())
+
+def best_of(repeat, func, *args):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--meals-per-day', type=float, default=3.0)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    start_date = date.today() - timedelta(days=args.days - 1)
+    users = {}
+    for index in range(args.users):
+        user = generate_user(index, 0, 'bench', 'hash', start_date, args.days, args.meals_per_day)
+        users[user['username']] = user
+    db = {'users': users, 'journal_seq': 0}
+    meals = sum(len(user['food_log']) for user in users.values())
+    backends = available_backends()
+    print(f"{args.users} người dùng, {meals} bữa ăn; JSON backend có sẵn: {', '.join(backends)}; "
+          f"msgpack: {serialization.msgpack_backend or 'chưa cài'}")
+
+    variants = [('cũ (json indent=4)', None, legacy_save, legacy_load)]
+    for backend in backends:
+        variants.append((backend, backend, snapshot_save('json'), snapshot_load))
+        variants.append((f'{backend}+indent', backend, snapshot_save('json-indent'), snapshot_load))
+    if serialization.msgpack_backend is not None:
+        variants.append((f'msgpack ({serialization.msgpack_backend})', backends[0], snapshot_save('msgpack'),
+                         snapshot_load))
+
+    print(f"\n{'snapshot':>22} | {'ghi (s)':>8} | {'đọc (s)':>8} | {'MB':>7} | {'ghi x':>6} | {'đọc x':>6}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'db.snapshot')
+        for label, backend, save, load in variants:
+            if backend is not None:
+                serialization.json_backend = backend
+            save_time, _ = best_of(args.repeat, save, path, db)
+            load_time, loaded = best_of(args.repeat, load, path)
+            assert loaded['users'] == users, f"{label}: dữ liệu đọc lại khác dữ liệu ghi"
+            size = os.path.getsize(path) / 1e6
+            baseline = baseline or (save_time, load_time)
+            print(f"{label:>22} | {save_time:>8.2f} | {load_time:>8.2f} | {size:>7.1f} | "
+                  f"{baseline[0] / save_time:>5.1f}x | {baseline[1] / load_time:>5.1f}x")
+
+    # Phản hồi: một trang food_log và cả nhật ký của người dùng nhiều bữa nhất (sort_keys như jsonify)
+    food_log = max((user['food_log'] for user in users.values()), key=len)
+    payloads = [(f'trang {args.page_size} bữa', {'items': food_log[:args.page_size], 'next_cursor': None}),
+                (f'nhật ký {len(food_log)} bữa', {'food_log': food_log})]
+    print(f"\n{'phản hồi':>22} | " + ' | '.join(f'{backend:>9}' for backend in backends) + " | (ms)")
+    for label, payload in payloads:
+        row = []
+        for backend in backends:
+            serialization.json_backend = backend
+            elapsed, _ = best_of(max(args.repeat, 5), serialization.dumps, payload, True)
+            row.append(f'{elapsed * 1000:>9.2f}')
+        print(f"{label:>22} | " + ' | '.join(row))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+"""Benchmark đầu-cuối cho mọi route /api/*: chạy app thật bằng gunicorn (đường đồng bộ hoặc ASGI), Gemini là
+benchmarks/fake_gemini.py (độ trễ theo phân phối, lỗi, JSON hỏng/bọc ```json), dữ liệu là người dùng tổng hợp
+với nhật ký nhiều kích thước.
+
+Mỗi client là một tiến trình, đăng nhập một người dùng và gọi các route theo trọng số cố định (random có seed,
+nên chuỗi request giống nhau giữa các lần chạy). Bữa ăn ghi thêm được xóa ngay để kích thước nhật ký giữ nguyên.
+Báo cáo theo route: số request, req/s, p50/p95/p99, số lỗi; tổng throughput và peak RSS của server
+(tổng các tiến trình, gồm worker và process pool ảnh).
+
+--save lưu kết quả JSON; --baseline so với một lần chạy trước và thoát mã 1 nếu p95 của route hoặc peak RSS
+tăng, hay throughput giảm, quá --tolerance.
+
+Chạy từ thư mục ai-food-advisor4 (cần gunicorn; uvicorn cho --server asgi):
+    python benchmarks/bench_suite.py [--server sync] [--workers 1] [--clients 8] [--seconds 20]
+        [--backend sqlite] [--log-sizes 10,300,3000] [--users-per-size 4]
+        [--latency lognormal:0.3,0.5] [--error-rate 0.02] [--malformed-rate 0.02] [--fenced-rate 0.2]
+        [--save ket_qua.json] [--baseline moc.json] [--tolerance 0.25]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_gemini
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    'sync': ('app:app', 'gthread'),
+    'asgi': ('asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+# (tên route trong báo cáo, trọng số); các bước phụ (xóa bữa vừa ghi, chờ công việc) đo dưới tên riêng
+ROUTE_MIX = [
+    ('GET /api/status', 10), ('GET /api/current_date', 2), ('GET /api/profile', 5), ('POST /api/profile', 1),
+    ('GET /api/food_log', 4), ('GET /api/food_log?limit', 4), ('GET /api/food_log?since', 4),
+    ('GET /api/dashboard', 10), ('GET /api/nutrition_analysis', 5), ('GET /api/improvement_tips', 3),
+    ('GET /api/suggest_menu', 3), ('POST /api/log_meal?sync=1', 2), ('POST /api/log_meal', 1),
+    ('POST /api/log_meals?sync=1', 1), ('GET /api/*/metrics', 1), ('GET /metrics', 1),
+    ('POST /api/login', 1),
+]
+DISHES = ['Phở bò', 'Bún chả', 'Cơm tấm sườn nướng', 'Bánh mì thịt', 'Cơm gà xé', 'Bún bò Huế', 'Hủ tiếu nam vang']
+PROFILE = {'name': 'Bench', 'gender': 'nữ', 'age': 28, 'height_cm': 160, 'weight_kg': 55,
+           'activity_level': 'vừa', 'goal': 'giữ cân'}
+PHOTOS_PER_CLIENT = 20
+# Các route số liệu chỉ trả lời khi có token quản trị
+ADMIN_HEADERS = {'X-Admin-Token': 'bench'}
+
+def seed(env, log_sizes, users_per_size):
+    """Tạo người dùng bench<kích thước>_<i> có hồ sơ và nhật ký dài <kích thước> bữa (3 bữa/ngày)."""
+    code = f"""
+import sys, random
+sys.path.insert(0, {APP_DIR!r})
+from datetime import date, timedelta
+from werkzeug.security import generate_password_hash
+from storage import create_storage, new_user_record
+rng = random.Random(0)
+storage = create_storage()
+password_hash = generate_password_hash('bench')
+today = date.today()
+for size in {log_sizes!r}:
+    for u in range({users_per_size}):
+        username = f'bench{{size}}_{{u}}'
+        storage.create_user(new_user_record(username, password_hash))
+        storage.set_profile(username, {{'name': username, 'gender': 'nữ', 'age': 28, 'height_cm': 160.0,
+                                       'weight_kg': 55.0, 'activity_level': 'vừa', 'goal': 'giữ cân',
+                                       'tdee': 2000, 'target_calories': 2000}})
+        meals = []
+        for i in range(size):
+            day = (today - timedelta(days=i // 3)).isoformat()
+            meals.append({{'timestamp': f'{{day}}T{{7 + 5 * (i % 3):02d}}:{{rng.randrange(60):02d}}:00+07:00',
+                          'date': day, 'meal_name': rng.choice({DISHES!r}), 'calories': rng.randrange(200, 800),
+                          'description': 'Bữa ăn tổng hợp cho benchmark', 'nutrition_analysis': 'Cân bằng'}})
+        storage.add_meals(username, meals)
+storage.close()
+"""
+    subprocess.run([sys.executable, '-c', code], env=env, cwd=APP_DIR, check=True, capture_output=True)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def tree_rss_mb(pid):
+    """Tổng RSS (MB) của tiến trình pid và mọi tiến trình con."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                total += int(next(line for line in status if line.startswith('VmRSS:')).split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as children:
+                pending.extend(int(child) for child in children.read().split())
+        except (OSError, StopIteration):
+            pass
+    return total / 1024
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/status')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server không khởi động kịp")
+
+def make_photos(rng):
+    """Một nhóm ảnh nhỏ mỗi client: lần đầu gọi Gemini, các lần sau trúng vision cache."""
+    import numpy as np
+    from PIL import Image
+    photos = []
+    for _ in range(PHOTOS_PER_CLIENT):
+        pixels = np.random.default_rng(rng.randrange(2 ** 32)).integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, 'JPEG')
+        photos.append(buffer.getvalue())
+    return photos
+
+def multipart(photos):
+    boundary = 'bench-boundary'
+    body = b''.join(f'--{boundary}\r\nContent-Disposition: form-data; name="photo"; filename="meal{i}.jpg"\r\n'
+                    f'Content-Type: image/jpeg\r\n\r\n'.encode('latin1') + photo + b'\r\n'
+                    for i, photo in enumerate(photos)) + f'--{boundary}--\r\n'.encode('latin1')
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+class Client:
+    """Một kết nối keep-alive đã đăng nhập; ghi lại độ trễ từng route."""
+
+    def __init__(self, port, username, rng):
+        self.port = port
+        self.username = username
+        self.rng = rng
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        self.cookie = None
+        self.version = None
+        self.etag = None
+        self.last_response = None
+        self.photos = make_photos(rng)
+        self.latencies = {}
+        self.errors = {}
+
+    def call(self, name, method, path, body=None, headers=None, expect=(200,)):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            self.last_response = response
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return None, None
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        if response.status not in expect:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def login(self):
+        self.call('POST /api/login', 'POST', '/api/login', {'username': self.username, 'password': 'bench'})
+
+    def run(self, name):
+        if name == 'GET /api/food_log?limit':
+            _, data = self.call(name, 'GET', '/api/food_log?limit=50')
+            self.version = (data or {}).get('version', self.version)
+        elif name == 'GET /api/food_log?since':
+            if self.version is None:
+                return self.run('GET /api/food_log?limit')
+            _, data = self.call(name, 'GET', f'/api/food_log?since={self.version}')
+            self.version = (data or {}).get('version', self.version)
+        elif name == 'GET /api/dashboard':
+            # Như trình duyệt: gửi lại ETag, nhận 304 khi dữ liệu không đổi
+            self.call(name, 'GET', '/api/dashboard', headers={'If-None-Match': self.etag} if self.etag else None,
+                      expect=(200, 304))
+            self.etag = self.last_response.getheader('ETag') or self.etag
+        elif name == 'POST /api/profile':
+            self.call(name, 'POST', '/api/profile', PROFILE)
+        elif name == 'POST /api/login':
+            self.login()
+        elif name == 'GET /api/*/metrics':
+            for path in ('/api/jobs/metrics', '/api/gemini/metrics', '/api/images/metrics', '/api/suggestions/cache'):
+                self.call(name, 'GET', path, headers=ADMIN_HEADERS)
+        elif name == 'GET /metrics':
+            self.call(name, 'GET', '/metrics', headers=ADMIN_HEADERS)
+        elif name == 'POST /api/log_meal?sync=1':
+            body, headers = multipart([self.rng.choice(self.photos)])
+            _, data = self.call(name, 'POST', '/api/log_meal?sync=1', body, headers)
+            self.delete([(data or {}).get('data', {}).get('id')])
+        elif name == 'POST /api/log_meal':
+            body, headers = multipart([self.rng.choice(self.photos)])
+            _, data = self.call(name, 'POST', '/api/log_meal', body, headers, expect=(202,))
+            if data and data.get('status_url'):
+                _, job = self.call('GET /api/jobs/<id>?wait', 'GET', data['status_url'] + '?wait=30')
+                self.delete([((job or {}).get('result') or {}).get('id')])
+        elif name == 'POST /api/log_meals?sync=1':
+            body, headers = multipart(self.rng.sample(self.photos, 3))
+            _, data = self.call(name, 'POST', '/api/log_meals?sync=1', body, headers)
+            self.delete([item.get('data', {}).get('id') for item in (data or {}).get('items', [])])
+        else:
+            method, path = name.split(' ', 1)
+            self.call(name, method, path)
+
+    def delete(self, ids):
+        ids = [meal_id for meal_id in ids if meal_id]
+        if ids:
+            self.call('POST /api/delete_meals', 'POST', '/api/delete_meals', {'ids': ids})
+
+def client_process(port, index, username, seconds, seed_value, results):
+    rng = random.Random(seed_value * 1000 + index)
+    client = Client(port, username, rng)
+    # Mỗi client đăng ký một tài khoản mới (đo riêng) rồi dùng tài khoản có sẵn dữ liệu
+    client.call('POST /api/register', 'POST', '/api/register',
+                {'username': f'new{index}_{seed_value}', 'password': 'bench'}, expect=(201,))
+    client.login()
+    names, weights = zip(*ROUTE_MIX)
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        client.run(rng.choices(names, weights)[0])
+    client.call('GET /api/logout', 'GET', '/api/logout', expect=(302,))
+    results.put((client.latencies, client.errors))
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def run(args):
+    target, worker_class = SERVERS[args.server]
+    log_sizes = [int(size) for size in args.log_sizes.split(',')]
+    with tempfile.TemporaryDirectory() as tmp:
+        port, fake_port = free_port(), free_port()
+        env = dict(os.environ)
+        for name, value in {'GEMINI_RATE_PER_SEC': '1000', 'GEMINI_RATE_BURST': '1000',
+                            'GEMINI_MAX_CONCURRENCY': '64', 'WEB_THREADS': '16'}.items():
+            env.setdefault(name, value)
+        env.update(BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(args.workers), WEB_WORKER_CLASS=worker_class,
+                   STORAGE_BACKEND=args.backend, DB_FILE=os.path.join(tmp, 'db.json'),
+                   SQLITE_FILE=os.path.join(tmp, 'db.sqlite3'), SHARED_STORE='sqlite' if args.workers > 1 else 'none',
+                   SHARED_STORE_FILE=os.path.join(tmp, 'shared_store.sqlite3'),
+                   VISION_CACHE_FILE=os.path.join(tmp, 'vision_cache.sqlite3'), SECRET_KEY='bench',
+                   ADMIN_TOKEN=ADMIN_HEADERS['X-Admin-Token'],
+                   GEMINI_API_KEY='fake', GEMINI_BASE_URL=f'http://127.0.0.1:{fake_port}')
+        seed(env, log_sizes, args.users_per_size)
+        usernames = [f'bench{size}_{u}' for size in log_sizes for u in range(args.users_per_size)]
+        fake = subprocess.Popen([sys.executable, fake_gemini.__file__, '--port', str(fake_port)] +
+                                fake_gemini.command_line(args), stdout=subprocess.DEVNULL)
+        server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', target], cwd=APP_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        peak_rss = 0.0
+        done = threading.Event()
+
+        def sample_rss():
+            nonlocal peak_rss
+            while not done.wait(0.2):
+                peak_rss = max(peak_rss, tree_rss_mb(server.pid))
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        try:
+            wait_ready(port)
+            sampler.start()
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=client_process,
+                                             args=(port, i, usernames[i % len(usernames)], args.seconds, args.seed,
+                                                   results))
+                     for i in range(args.clients)]
+            for proc in procs:
+                proc.start()
+            outputs = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+        finally:
+            done.set()
+            server.terminate()
+            server.wait(30)
+            fake.terminate()
+            fake.wait(10)
+
+    routes = {}
+    for latencies, errors in outputs:
+        for name in set(latencies) | set(errors):
+            route = routes.setdefault(name, {'samples': [], 'errors': 0})
+            route['samples'].extend(latencies.get(name, []))
+            route['errors'] += errors.get(name, 0)
+    report = {'routes': {}, 'peak_rss_mb': round(peak_rss, 1)}
+    for name, route in sorted(routes.items()):
+        ordered = sorted(route['samples'])
+        report['routes'][name] = {'count': len(ordered), 'rps': round(len(ordered) / args.seconds, 2),
+                                  'p50_ms': round(percentile(ordered, 0.5) * 1000, 2),
+                                  'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+                                  'p99_ms': round(percentile(ordered, 0.99) * 1000, 2), 'errors': route['errors']}
+    total = sum(route['count'] for route in report['routes'].values())
+    report['total'] = {'count': total, 'rps': round(total / args.seconds, 2),
+                       'errors': sum(route['errors'] for route in report['routes'].values())}
+    return report
+
+def print_report(report):
+    print(f"{'route':<30} | {'n':>6} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'lỗi':>4}")
+    for name, route in report['routes'].items():
+        print(f"{name:<30} | {route['count']:>6} | {route['rps']:>7.1f} | {route['p50_ms']:>8.1f} | "
+              f"{route['p95_ms']:>8.1f} | {route['p99_ms']:>8.1f} | {route['errors']:>4}")
+    total = report['total']
+    print(f"{'tổng':<30} | {total['count']:>6} | {total['rps']:>7.1f} | peak RSS {report['peak_rss_mb']:.1f}MB"
+          f" | lỗi {total['errors']}")
+
+def regressions(report, baseline, tolerance, min_count=20):
+    """Các dòng mô tả chỉ số xấu đi quá tolerance so với baseline."""
+    found = []
+    for name, route in report['routes'].items():
+        base = baseline['routes'].get(name)
+        if base and min(base['count'], route['count']) >= min_count and \
+                route['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            found.append(f"{name}: p95 {base['p95_ms']:.1f} -> {route['p95_ms']:.1f} ms")
+    if report['total']['rps'] < baseline['total']['rps'] * (1 - tolerance):
+        found.append(f"throughput {baseline['total']['rps']:.1f} -> {report['total']['rps']:.1f} req/s")
+    if report['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        found.append(f"peak RSS {baseline['peak_rss_mb']:.1f} -> {report['peak_rss_mb']:.1f} MB")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', default='sync', choices=tuple(SERVERS))
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'json'))
+    parser.add_argument('--log-sizes', default='10,300,3000')
+    parser.add_argument('--users-per-size', type=int, default=4)
+    parser.add_argument('--save')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    fake_gemini.add_arguments(parser)
+    parser.set_defaults(latency='lognormal:0.3,0.5', error_rate=0.02, error_codes='429,500,503',
+                        malformed_rate=0.02, fenced_rate=0.2, seed=0)
+    args = parser.parse_args()
+
+    print(f"server {args.server} x{args.workers}, {args.clients} client, {args.seconds:g}s, backend {args.backend}, "
+          f"{os.cpu_count()} CPU, nhật ký {args.log_sizes} bữa x {args.users_per_size} user, Gemini giả lập "
+          f"{args.latency} (lỗi {args.error_rate:g}, hỏng {args.malformed_rate:g}, ```json {args.fenced_rate:g})")
+    report = run(args)
+    report['config'] = {key: value for key, value in vars(args).items() if key not in ('save', 'baseline')}
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"⚠️ Chậm hơn baseline: {line}")
+        if found:
+            sys.exit(1)
+        print("✅ Không có route nào chậm hơn baseline quá ngưỡng")
+
+if __name__ == '__main__':
+    main()
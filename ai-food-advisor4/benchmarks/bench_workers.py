@@ -0,0 +1,144 @@
+"""Đo requests/giây của /api/status, /api/food_log và /api/nutrition_analysis khi chạy gunicorn
+với số worker khác nhau (cần cài gunicorn).
+
+Mỗi cấu hình chạy trên dữ liệu tạm riêng; client là nhiều tiến trình, mỗi tiến trình một kết nối
+keep-alive đã đăng nhập, gọi lần lượt ba endpoint trong suốt thời gian đo.
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--clients 8] [--seconds 10] [--backend sqlite]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ('/api/status', '/api/food_log', '/api/nutrition_analysis')
+USERS = 20
+MEALS_PER_USER = 300
+
+def seed(env):
+    """Tạo USERS người dùng có hồ sơ và MEALS_PER_USER bữa ăn (chạy trong tiến trình con với env của server)."""
+    code = f"""
+import sys
+sys.path.insert(0, {APP_DIR!r})
+from datetime import date, timedelta
+from werkzeug.security import generate_password_hash
+from storage import create_storage, new_user_record
+storage = create_storage()
+password_hash = generate_password_hash('bench')
+today = date.today()
+for u in range({USERS}):
+    username = f'bench{{u}}'
+    storage.create_user(new_user_record(username, password_hash))
+    storage.set_profile(username, {{'name': username, 'gender': 'nam', 'age': 30, 'height_cm': 170.0,
+                                   'weight_kg': 65.0, 'activity_level': 'vừa', 'goal': 'giữ cân',
+                                   'tdee': 2200, 'target_calories': 2200}})
+    meals = []
+    for i in range({MEALS_PER_USER}):
+        day = (today - timedelta(days=i // 3)).isoformat()
+        meals.append({{'timestamp': f'{{day}}T{{7 + 5 * (i % 3):02d}}:00:00+07:00', 'date': day,
+                      'meal_name': 'Phở bò', 'calories': 450, 'description': 'Bát phở bò tái',
+                      'nutrition_analysis': 'Nhiều đạm'}})
+    storage.add_meals(username, meals)
+storage.close()
+"""
+    subprocess.run([sys.executable, '-c', code], env=env, cwd=APP_DIR, check=True, capture_output=True)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/status')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server không khởi động kịp")
+
+def client(port, username, seconds, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request('POST', '/api/login', json.dumps({'username': username, 'password': 'bench'}),
+                 {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    latencies = {path: [] for path in ENDPOINTS}
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        path = ENDPOINTS[i % len(ENDPOINTS)]
+        i += 1
+        start = time.perf_counter()
+        conn.request('GET', path, headers={'Cookie': cookie})
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            errors += 1
+        latencies[path].append(time.perf_counter() - start)
+    results.put((latencies, errors))
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+def run(workers, clients, seconds, backend):
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f'127.0.0.1:{port}', STORAGE_BACKEND=backend,
+                   DB_FILE=os.path.join(tmp, 'db.json'), SQLITE_FILE=os.path.join(tmp, 'db.sqlite3'),
+                   SHARED_STORE='sqlite', SHARED_STORE_FILE=os.path.join(tmp, 'shared_store.sqlite3'),
+                   VISION_CACHE_FILE=os.path.join(tmp, 'vision_cache.sqlite3'), IMAGE_POOL_WORKERS='0')
+        seed(env)
+        server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=APP_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=client, args=(port, f'bench{i % USERS}', seconds, results))
+                     for i in range(clients)]
+            for proc in procs:
+                proc.start()
+            outputs = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+        finally:
+            server.terminate()
+            server.wait(30)
+    latencies = {path: [s for output, _ in outputs for s in output[path]] for path in ENDPOINTS}
+    return latencies, sum(errors for _, errors in outputs)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'json'))
+    args = parser.parse_args()
+
+    print(f"{args.clients} client, {args.seconds:g}s mỗi cấu hình, backend {args.backend}, "
+          f"{os.cpu_count()} CPU, {USERS} user x {MEALS_PER_USER} bữa")
+    print(f"{'worker':>6} | {'endpoint':<24} | {'req/s':>8} | {'p50 ms':>7} | {'p95 ms':>7}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        latencies, errors = run(workers, args.clients, args.seconds, args.backend)
+        for path, samples in latencies.items():
+            print(f"{workers:>6} | {path:<24} | {len(samples) / args.seconds:>8.1f} | "
+                  f"{percentile(samples, 0.5) * 1000:>7.1f} | {percentile(samples, 0.95) * 1000:>7.1f}")
+        total = sum(len(samples) for samples in latencies.values())
+        print(f"{workers:>6} | {'tổng':<24} | {total / args.seconds:>8.1f} | lỗi: {errors}")
+
+if __name__ == '__main__':
+    main()
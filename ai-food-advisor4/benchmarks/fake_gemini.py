@@ -0,0 +1,193 @@
+"""Server giả lập endpoint generateContent của Gemini để chạy app/benchmark offline.
+
+Mỗi yêu cầu chờ một độ trễ lấy từ phân phối cấu hình được (trên event loop, không tốn thread) rồi trả về
+JSON phân tích món ăn (có ảnh), nhóm nhiều ảnh, hoặc gợi ý thực đơn (không có ảnh). Có thể chèn lỗi HTTP
+(SDK ném APIError), phản hồi hỏng (không phải JSON, JSON cụt) và JSON bọc trong ```json.
+
+Độ trễ (--latency):
+    1.0                   cố định 1 giây
+    uniform:0.5,2         đều trong [0.5, 2]
+    normal:1,0.2          chuẩn (trung bình, độ lệch), không âm
+    lognormal:0.8,0.5     log-chuẩn (trung vị, sigma) - đuôi dài như API thật
+    exp:1                 mũ (trung bình)
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/fake_gemini.py [--port 8090] [--latency lognormal:0.8,0.5] [--error-rate 0.02]
+        [--error-codes 429,500,503] [--malformed-rate 0.02] [--fenced-rate 0.2] [--seed 0]
+rồi chạy app với GEMINI_BASE_URL=http://127.0.0.1:8090 GEMINI_API_KEY=fake
+GET /stats trả về số yêu cầu, số lỗi đã chèn và số yêu cầu đồng thời lớn nhất.
+"""
+import json
+import math
+import random
+import asyncio
+import argparse
+
+DISHES = [('Phở bò', 450), ('Bún chả', 550), ('Cơm tấm sườn', 650), ('Bánh mì thịt', 400),
+          ('Gỏi cuốn', 250), ('Bún bò Huế', 500), ('Cháo gà', 350), ('Xôi gà', 480)]
+ERROR_STATUS = {400: 'INVALID_ARGUMENT', 429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 503: 'UNAVAILABLE',
+                504: 'DEADLINE_EXCEEDED'}
+ERROR_REASON = {400: 'Bad Request', 429: 'Too Many Requests', 500: 'Internal Server Error',
+                503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+def parse_latency(spec, rng):
+    """Hàm không tham số trả về độ trễ (giây) theo chuỗi cấu hình, xem docstring module."""
+    kind, _, params = spec.partition(':')
+    if not params:
+        value = float(kind)
+        return lambda: value
+    args = [float(param) for param in params.split(',')]
+    if kind == 'uniform':
+        return lambda: rng.uniform(args[0], args[1])
+    if kind == 'normal':
+        return lambda: max(0.0, rng.gauss(args[0], args[1]))
+    if kind == 'lognormal':
+        mu = math.log(args[0])
+        return lambda: rng.lognormvariate(mu, args[1])
+    if kind == 'exp':
+        return lambda: rng.expovariate(1 / args[0])
+    raise ValueError(f"Phân phối độ trễ không hỗ trợ: {spec}")
+
+def meal_item(rng):
+    name, calories = rng.choice(DISHES)
+    return {'meal_name': name, 'estimated_calories': calories, 'description': f'{name} (giả lập)',
+            'nutrition_analysis': 'Dữ liệu từ server giả lập'}
+
+def answer(request, rng):
+    """Nội dung text model trả về, theo loại yêu cầu trong body generateContent."""
+    parts = [part for content in request.get('contents', []) for part in content.get('parts', [])]
+    images = sum(1 for part in parts if 'inlineData' in part or 'inline_data' in part)
+    if images > 1:
+        return {'items': [meal_item(rng) for _ in range(images)]}
+    if images == 1:
+        return meal_item(rng)
+    return {'advice': 'Ăn nhiều rau xanh, uống đủ nước',
+            'menu_suggestions': [{'name': name, 'calories': calories, 'nutrition_summary': 'Cân bằng'}
+                                 for name, calories in rng.sample(DISHES, 3)]}
+
+def malformed(text, rng):
+    """Các kiểu phản hồi hỏng hay gặp: văn xuôi, JSON bị cắt, JSON lẫn chú thích."""
+    return rng.choice([
+        'Xin lỗi, tôi không thể xác định món ăn trong ảnh này. Khoảng 400 calories.',
+        text[:len(text) // 2],
+        f'Đây là kết quả: {text} Hy vọng hữu ích!',
+    ])
+
+def response_body(text):
+    return json.dumps({
+        'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP',
+                        'index': 0}],
+        'usageMetadata': {'promptTokenCount': 10, 'candidatesTokenCount': 50, 'totalTokenCount': 60},
+        'modelVersion': 'fake-gemini'
+    }, ensure_ascii=False).encode('utf-8')
+
+def error_body(code):
+    return json.dumps({'error': {'code': code, 'message': 'Lỗi giả lập từ fake Gemini',
+                                 'status': ERROR_STATUS.get(code, 'UNKNOWN')}}).encode('utf-8')
+
+class FakeGemini:
+    """HTTP/1.1 keep-alive tối giản trên asyncio: một coroutine mỗi kết nối."""
+
+    def __init__(self, latency='1.0', error_rate=0.0, error_codes=(503,), malformed_rate=0.0, fenced_rate=0.0,
+                 seed=None):
+        self.rng = random.Random(seed)
+        self.latency = parse_latency(str(latency), self.rng)
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.malformed_rate = malformed_rate
+        self.fenced_rate = fenced_rate
+        self.requests = 0
+        self.errors = 0
+        self.malformed = 0
+        self.fenced = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin1').split('\r\n')
+                method, path, _ = lines[0].split(' ', 2)
+                headers = {name.lower(): value for name, value in
+                           (line.split(': ', 1) for line in lines[1:] if ': ' in line)}
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+                code, payload = await self.respond(method, path, body)
+                writer.write(f'HTTP/1.1 {code} {ERROR_REASON.get(code, "OK")}\r\n'
+                             f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'
+                             .encode('latin1') + payload)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors, 'malformed': self.malformed,
+                'fenced': self.fenced, 'in_flight': self.in_flight, 'max_in_flight': self.max_in_flight}
+
+    async def respond(self, method, path, body):
+        if method == 'GET' and path == '/stats':
+            return 200, json.dumps(self.stats()).encode('utf-8')
+        if method != 'POST' or ':generateContent' not in path:
+            return 404, b'{"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}}'
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency())
+            roll = self.rng.random()
+            if roll < self.error_rate:
+                self.errors += 1
+                code = self.rng.choice(self.error_codes)
+                return code, error_body(code)
+            text = json.dumps(answer(json.loads(body or b'{}'), self.rng), ensure_ascii=False)
+            roll -= self.error_rate
+            if roll < self.malformed_rate:
+                self.malformed += 1
+                text = malformed(text, self.rng)
+            elif roll < self.malformed_rate + self.fenced_rate:
+                self.fenced += 1
+                text = f'```json\n{text}\n```'
+            return 200, response_body(text)
+        finally:
+            self.in_flight -= 1
+
+async def serve(host, port, **options):
+    fake = FakeGemini(**options)
+    server = await asyncio.start_server(fake.handle, host, port, backlog=4096)
+    print(f"✅ Fake Gemini tại http://{host}:{port} ({options})", flush=True)
+    async with server:
+        await server.serve_forever()
+
+def add_arguments(parser):
+    """Tham số dòng lệnh của fake Gemini (benchmark dùng lại để chuyển tiếp cấu hình)."""
+    parser.add_argument('--latency', default='1.0')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-codes', default='503')
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--fenced-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+
+def command_line(args):
+    """Đối số để chạy lại fake Gemini trong tiến trình con với cùng cấu hình."""
+    line = ['--latency', args.latency, '--error-rate', str(args.error_rate), '--error-codes', args.error_codes,
+            '--malformed-rate', str(args.malformed_rate), '--fenced-rate', str(args.fenced_rate)]
+    return line + (['--seed', str(args.seed)] if args.seed is not None else [])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+                          error_codes=[int(code) for code in args.error_codes.split(',')],
+                          malformed_rate=args.malformed_rate, fenced_rate=args.fenced_rate, seed=args.seed))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
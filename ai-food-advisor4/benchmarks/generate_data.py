@@ -0,0 +1,194 @@
+"""Sinh dữ liệu tổng hợp (người dùng, hồ sơ, nhật ký ăn uống) để thử storage và phân tích ở quy mô lớn.
+
+Hồ sơ tính bằng profiles.build_profile như route /api/profile; món ăn lấy từ danh mục dishes.DISHES.
+Giờ ăn theo phân phối chuẩn quanh 7:00 (sáng), 12:00 (trưa), 18:45 (tối) và bữa phụ buổi chiều/khuya,
+luôn nằm trong khung giờ mà analytics dùng để phân loại bữa. Calories mỗi ngày dao động quanh
+target_calories của hồ sơ (cuối tuần ăn nhiều hơn), chia cho các bữa theo tỉ lệ.
+Mỗi người dùng có mức đều đặn riêng: một số ngày không ghi gì; --meals-per-day là trung bình trên
+những ngày có ghi (trên 2.77 thì phần dư là bữa phụ).
+
+Ghi vào backend đang cấu hình (STORAGE_BACKEND, DB_FILE, SQLITE_FILE); username đã tồn tại thì bỏ qua.
+SQLite: mỗi người dùng một transaction. JSON: nạp db.json một lần, thêm mọi người dùng rồi ghi snapshot
+một lần (ghi từng người sẽ đọc lại cả file mỗi lần) - đừng chạy khi app đang ghi vào cùng file.
+Cùng --seed cho cùng dữ liệu.
+
+Chạy từ thư mục ai-food-advisor4:
+    python benchmarks/generate_data.py [--users 1000] [--days 365] [--meals-per-day 3] [--seed 0]
+        [--prefix synth] [--password synth] [--backend sqlite]
+"""
+import os
+import sys
+import math
+import time
+import random
+import argparse
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+from dishes import DISHES, NUTRITION_NOTE
+from profiles import build_profile
+from storage import JsonStorage, create_storage, new_user_record
+
+vietnam_tz = timezone(timedelta(hours=7))
+
+FAMILY_NAMES = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ',
+                'Hồ', 'Ngô', 'Dương', 'Lý']
+MALE_NAMES = ['Văn An', 'Minh Đức', 'Quốc Huy', 'Thành Nam', 'Hoàng Long', 'Đức Anh', 'Gia Bảo', 'Tuấn Kiệt',
+              'Văn Dũng', 'Hữu Phước', 'Quang Vinh', 'Minh Khang']
+FEMALE_NAMES = ['Thị Lan', 'Ngọc Anh', 'Thu Trang', 'Phương Linh', 'Thanh Hương', 'Minh Thư', 'Bảo Ngọc',
+                'Thị Mai', 'Khánh Vy', 'Hồng Nhung', 'Thùy Dung', 'Hà My']
+ACTIVITY_WEIGHTS = {'ít': 40, 'bình thường': 45, 'nhiều': 15}
+
+# Giờ ăn (trung bình, độ lệch chuẩn) và khung giờ [từ, đến) của từng bữa theo analytics.slots_from_hours
+MEAL_TIMES = {
+    'Sáng': (7.0, 0.75, 5, 11),
+    'Trưa': (12.0, 0.5, 11, 14),
+    'Tối': (18.75, 0.75, 17, 22),
+}
+# Bữa phụ: chủ yếu buổi chiều, đôi khi ăn khuya
+SNACK_TIMES = [(0.8, 15.5, 0.75, 14, 17), (0.2, 22.75, 0.5, 22, 24)]
+# Xác suất có bữa chính trong một ngày có ghi; tổng 2.77 bữa
+MAIN_MEAL_RATES = {'Sáng': 0.85, 'Trưa': 0.97, 'Tối': 0.95}
+# Tỉ lệ calories trong ngày của mỗi bữa (mỗi bữa phụ một phần)
+CALORIE_SHARES = {'Sáng': 0.25, 'Trưa': 0.35, 'Tối': 0.32, 'Phụ': 0.08}
+MEAN_DISH_CALORIES = sum(dish[2] for dish in DISHES) / len(DISHES)
+
+def random_profile(rng, name):
+    """Hồ sơ hợp lệ: chiều cao theo giới tính, cân nặng từ BMI, mục tiêu phụ thuộc BMI."""
+    gender = rng.choice(['nam', 'nữ'])
+    age = rng.randint(18, 65)
+    height_cm = round(rng.gauss(168, 6) if gender == 'nam' else rng.gauss(156, 5.5), 1)
+    bmi = min(35.0, max(16.5, rng.gauss(22.5, 3)))
+    weight_kg = round(bmi * (height_cm / 100) ** 2, 1)
+    if bmi >= 25:
+        goal_weights = {'giảm cân': 75, 'giữ cân': 22, 'tăng cân': 3}
+    elif bmi < 18.5:
+        goal_weights = {'giảm cân': 3, 'giữ cân': 32, 'tăng cân': 65}
+    else:
+        goal_weights = {'giảm cân': 30, 'giữ cân': 55, 'tăng cân': 15}
+    activity_level = rng.choices(list(ACTIVITY_WEIGHTS), weights=list(ACTIVITY_WEIGHTS.values()))[0]
+    goal = rng.choices(list(goal_weights), weights=list(goal_weights.values()))[0]
+    return build_profile(name, gender, age, height_cm, weight_kg, activity_level, goal)
+
+def poisson(rng, mean):
+    """Số ngẫu nhiên theo phân phối Poisson (thuật toán Knuth, mean nhỏ)."""
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+def meal_hour(rng, mean, sd, start, end):
+    """Giờ ăn (số thực) theo phân phối chuẩn, giữ trong khung [start, end)."""
+    return min(end - 1 / 60, max(start, rng.gauss(mean, sd)))
+
+def day_slots(rng, meals_per_day):
+    """Các (bữa, giờ) trong một ngày có ghi, trung bình meals_per_day bữa."""
+    main_total = sum(MAIN_MEAL_RATES.values())
+    scale = min(1.0, meals_per_day / main_total)
+    slots = [(slot, meal_hour(rng, *MEAL_TIMES[slot])) for slot, rate in MAIN_MEAL_RATES.items()
+             if rng.random() < rate * scale]
+    for _ in range(poisson(rng, max(0.0, meals_per_day - main_total))):
+        _, *window = rng.choices(SNACK_TIMES, weights=[snack[0] for snack in SNACK_TIMES])[0]
+        slots.append(('Phụ', meal_hour(rng, *window)))
+    return sorted(slots, key=lambda slot: slot[1])
+
+def pick_dish(rng, slot):
+    return rng.choices(DISHES, weights=[dish[3][slot] for dish in DISHES])[0]
+
+def generate_food_log(rng, profile, start_date, days, meals_per_day):
+    """Nhật ký `days` ngày từ start_date theo thói quen riêng của một người dùng."""
+    consistency = rng.betavariate(8, 2)
+    # Người giảm cân hay ăn vượt mục tiêu một chút, người tăng cân hay ăn thiếu
+    bias = rng.gauss({'giảm cân': 1.05, 'tăng cân': 0.95}.get(profile['goal'], 1.0), 0.08)
+    food_log = []
+    for offset in range(days):
+        if rng.random() > consistency:
+            continue
+        day = start_date + timedelta(days=offset)
+        slots = day_slots(rng, meals_per_day)
+        if not slots:
+            continue
+        weekend = 1.1 if day.weekday() >= 5 else 1.0
+        day_total = profile['target_calories'] * bias * weekend * max(0.3, rng.gauss(1.0, 0.15))
+        share_total = sum(CALORIE_SHARES[slot] for slot, _ in slots)
+        midnight = datetime(day.year, day.month, day.day, tzinfo=vietnam_tz)
+        date_str = day.isoformat()
+        for slot, hour in slots:
+            name, description, typical, _ = pick_dish(rng, slot)
+            calories = day_total * CALORIE_SHARES[slot] / share_total * (0.7 + 0.3 * typical / MEAN_DISH_CALORIES)
+            moment = midnight + timedelta(minutes=int(hour * 60))
+            food_log.append({
+                'timestamp': moment.isoformat(),
+                'date': date_str,
+                'meal_name': name,
+                'calories': max(50, int(round(calories, -1))),
+                'description': description,
+                'nutrition_analysis': NUTRITION_NOTE
+            })
+    return food_log
+
+def generate_user(index, seed, prefix, password_hash, start_date, days, meals_per_day):
+    """Bản ghi người dùng thứ index (có hồ sơ và nhật ký); chỉ phụ thuộc seed và index."""
+    rng = random.Random(f'{seed}:{index}')
+    profile = random_profile(rng, '')
+    given = MALE_NAMES if profile['gender'] == 'nam' else FEMALE_NAMES
+    profile['name'] = f"{rng.choice(FAMILY_NAMES)} {rng.choice(given)}"
+    user = new_user_record(f'{prefix}{index}', password_hash)
+    user['profile'] = profile
+    user['food_log'] = generate_food_log(rng, profile, start_date, days, meals_per_day)
+    return user
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365, help="Số ngày lịch sử, kết thúc hôm nay")
+    parser.add_argument('--meals-per-day', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefix', default='synth', help="Username là <prefix><số thứ tự>")
+    parser.add_argument('--start-index', type=int, default=0)
+    parser.add_argument('--password', default='synth', help="Mật khẩu chung của mọi người dùng tổng hợp")
+    parser.add_argument('--backend', default=None, help="json hoặc sqlite (mặc định theo STORAGE_BACKEND)")
+    args = parser.parse_args()
+
+    today = datetime.now(vietnam_tz).date()
+    start_date = today - timedelta(days=args.days - 1)
+    # Băm mật khẩu tốn ~0.1 giây: băm một lần cho mọi người dùng
+    password_hash = generate_password_hash(args.password)
+    storage = create_storage(args.backend)
+    # JSON: nạp cả db một lần, thêm người dùng trong bộ nhớ rồi ghi một snapshot; giữ khóa ghi suốt chu kỳ
+    # để tiến trình khác (server đang chạy) không ghi xen vào giữa load_all và save_all
+    bulk_lock = storage.exclusive() if isinstance(storage, JsonStorage) else nullcontext()
+    with bulk_lock:
+        bulk = storage.load_all() if isinstance(storage, JsonStorage) else None
+        created = skipped = meals = 0
+        started = time.perf_counter()
+        report_every = max(1, args.users // 20)
+        for index in range(args.start_index, args.start_index + args.users):
+            user = generate_user(index, args.seed, args.prefix, password_hash, start_date, args.days,
+                                 args.meals_per_day)
+            if bulk is not None:
+                is_new = bulk['users'].setdefault(user['username'], user) is user
+            else:
+                is_new = storage.create_user(user)
+            if is_new:
+                created += 1
+                meals += len(user['food_log'])
+            else:
+                skipped += 1
+            done = index - args.start_index + 1
+            if done % report_every == 0 or done == args.users:
+                elapsed = time.perf_counter() - started
+                print(f"⏳ {done}/{args.users} người dùng, {meals} bữa ăn, {elapsed:.1f}s "
+                      f"({meals / elapsed if elapsed else 0:.0f} bữa/s)", flush=True)
+        if bulk is not None:
+            storage.save_all(bulk)
+    storage.close()
+    print(f"✅ Đã tạo {created} người dùng ({skipped} đã tồn tại, bỏ qua), {meals} bữa ăn "
+          f"từ {start_date} đến {today}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+
+# --- BỘ NHỚ ĐỆM LRU DÙNG CHUNG ---
+
+class LRUCache:
+    """Cache LRU an toàn đa luồng, có giới hạn kích thước và bộ đếm hit/miss."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = max(1, int(maxsize))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """Đọc mà không cập nhật thứ tự LRU và bộ đếm."""
+        with self._lock:
+            return self._data.get(key, default)
+
+    def touch(self, key):
+        """Đánh dấu key vừa được dùng (thứ tự LRU) mà không đổi bộ đếm; dùng sau peek khi người gọi tự đếm."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
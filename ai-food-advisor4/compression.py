@@ -0,0 +1,43 @@
+import os
+import gzip
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, không có thì chỉ dùng gzip
+    brotli = None
+
+# --- NÉN PHẢN HỒI JSON (BROTLI NẾU CÓ, NẾU KHÔNG THÌ GZIP) ---
+# Phản hồi nhỏ hơn ngưỡng này (byte) không đáng nén
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+COMPRESS_MIMETYPES = ('application/json',)
+
+def choose_encoding(accept_encodings):
+    """'br' hoặc 'gzip' theo Accept-Encoding của client; None nếu client không nhận bản nén nào."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response, accept_encodings):
+    """Nén thân phản hồi JSON 200 đủ lớn (dùng trong after_request), trả về chính response."""
+    if (response.status_code != 200 or response.direct_passthrough
+            or response.mimetype not in COMPRESS_MIMETYPES or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    body = response.get_data()
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0))
+    response.headers['Content-Encoding'] = encoding
+    # Bản nén không giống từng byte với bản gốc: ETag mạnh phải đổi thành weak (If-None-Match vẫn khớp)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
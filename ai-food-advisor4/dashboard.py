@@ -0,0 +1,45 @@
+import os
+import hashlib
+from cache import LRUCache
+from profiling import span
+from serialization import dumps
+
+# --- ẢNH CHỤP DASHBOARD THEO NGƯỜI DÙNG ---
+DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', '1024'))
+
+class DashboardSnapshot:
+    __slots__ = ('revision', 'date', 'etag', 'body')
+
+    def __init__(self, revision, date, etag, body):
+        self.revision = revision
+        self.date = date
+        self.etag = etag
+        self.body = body
+
+class DashboardSnapshots:
+    """Dashboard đã serialize sẵn cho từng người dùng, dựng lại khi dữ liệu (revision) hoặc ngày đổi.
+
+    ETag là hash của nội dung nên giống nhau giữa các tiến trình khi dữ liệu giống nhau.
+    """
+
+    def __init__(self, maxsize=DASHBOARD_CACHE_SIZE):
+        self._cache = LRUCache(maxsize)
+        self.builds = 0
+
+    def get(self, user_id, revision, date, build):
+        """Ảnh chụp hiện tại của user_id; build() chỉ được gọi khi ảnh chụp cũ không còn đúng."""
+        snapshot = self._cache.get(user_id)
+        if snapshot is None or snapshot.revision != revision or snapshot.date != date:
+            with span('dashboard.build'):
+                data = build()
+            with span('json.serialize'):
+                body = dumps(data, sort_keys=True)
+            snapshot = DashboardSnapshot(revision, date, hashlib.sha1(body).hexdigest(), body)
+            self._cache.put(user_id, snapshot)
+            self.builds += 1
+        return snapshot
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats['builds'] = self.builds
+        return stats
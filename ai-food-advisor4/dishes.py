@@ -0,0 +1,26 @@
+import random
+
+# --- DANH MỤC MÓN ĂN VIỆT NAM (DÙNG CHO FALLBACK KHI GEMINI LỖI VÀ DỮ LIỆU TỔNG HỢP) ---
+# (tên món, mô tả, calories điển hình của một phần, trọng số theo bữa Sáng/Trưa/Tối/Phụ)
+DISHES = [
+    ("Cơm tấm sườn nướng", "Cơm trắng với sườn nướng, bì, chả và đồ chua", 650,
+     {'Sáng': 3, 'Trưa': 5, 'Tối': 4, 'Phụ': 0}),
+    ("Phở bò", "Phở nước dùng thơm ngon với thịt bò tái, chín", 450,
+     {'Sáng': 6, 'Trưa': 3, 'Tối': 2, 'Phụ': 1}),
+    ("Bún chả", "Bún với chả thịt nướng, nem và nước mắm chua ngọt", 550,
+     {'Sáng': 1, 'Trưa': 5, 'Tối': 2, 'Phụ': 0}),
+    ("Bánh mì thịt", "Bánh mì giòn với nhân thịt, pate và rau sống", 400,
+     {'Sáng': 6, 'Trưa': 1, 'Tối': 1, 'Phụ': 6}),
+    ("Cơm gà xé", "Cơm trắng với gà xé, rau sống và nước mắm", 600,
+     {'Sáng': 1, 'Trưa': 5, 'Tối': 4, 'Phụ': 0}),
+    ("Bún bò Huế", "Bún bò với hương vị Huế đặc trưng, giò heo", 500,
+     {'Sáng': 4, 'Trưa': 3, 'Tối': 2, 'Phụ': 1}),
+    ("Hủ tiếu nam vang", "Hủ tiếu với nước dùng trong, thịt heo, tôm", 480,
+     {'Sáng': 4, 'Trưa': 2, 'Tối': 3, 'Phụ': 2}),
+]
+NUTRITION_NOTE = 'Món ăn truyền thống Việt Nam'
+
+def random_dish(rng=random):
+    """Một món ngẫu nhiên trong danh mục: (tên, mô tả)."""
+    name, description, _, _ = rng.choice(DISHES)
+    return name, description
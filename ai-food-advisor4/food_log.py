@@ -0,0 +1,172 @@
+import json
+import base64
+from bisect import bisect_left, bisect_right, insort
+from datetime import date as date_cls, timedelta
+from rollups import CalorieRollup
+
+# --- NHẬT KÝ ĂN UỐNG ĐÁNH CHỈ MỤC THEO NGÀY ---
+
+def _timestamp_key(entry):
+    return entry['timestamp']
+
+def encode_cursor(cursor):
+    """Cursor (date, timestamp, số bữa cùng mốc đã trả) -> chuỗi mờ cho client; None -> None."""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(token):
+    """Ngược của encode_cursor; ValueError nếu cursor không hợp lệ."""
+    try:
+        date, timestamp, skip = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception:
+        raise ValueError("cursor không hợp lệ")
+    if not isinstance(date, str) or not isinstance(timestamp, str) or not isinstance(skip, int) or skip < 0:
+        raise ValueError("cursor không hợp lệ")
+    return date, timestamp, skip
+
+class FoodLog:
+    """Chỉ mục theo ngày cho food_log: mỗi ngày một bucket đã sắp theo timestamp.
+
+    Tổng calories từng ngày (CalorieRollup) được cập nhật ngay khi thêm/xóa bữa ăn,
+    nên truy vấn "N ngày gần nhất" chỉ tốn O(N) thay vì quét toàn bộ lịch sử.
+    Chỉ mục id -> bữa ăn cho phép tìm/xóa một bữa mà không quét cả nhật ký.
+    """
+
+    def __init__(self, entries=()):
+        self._days = {}
+        self.rollup = CalorieRollup()
+        self._dates_by_timestamp = {}
+        self._by_id = {}
+        self._count = 0
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, entry):
+        date = entry['date']
+        timestamp = entry['timestamp']
+        bucket = self._days.get(date)
+        if bucket is None:
+            bucket = self._days[date] = []
+        # Bữa ăn thường được ghi theo thứ tự thời gian: thêm vào cuối mà không cần tìm vị trí
+        if not bucket or bucket[-1]['timestamp'] <= timestamp:
+            bucket.append(entry)
+        else:
+            insort(bucket, entry, key=_timestamp_key)
+        self.rollup.add(date, entry.get('calories', 0))
+        self._dates_by_timestamp.setdefault(timestamp, set()).add(date)
+        self._by_id[entry['id']] = entry
+        self._count += 1
+
+    def remove_ids(self, ids):
+        """Xóa các bữa ăn theo id (tìm trong bucket của ngày bằng bisect), trả về số bữa đã xóa."""
+        removed = 0
+        for meal_id in set(ids):
+            entry = self._by_id.pop(meal_id, None)
+            if entry is None:
+                continue
+            date, timestamp = entry['date'], entry['timestamp']
+            bucket = self._days[date]
+            lo = bisect_left(bucket, timestamp, key=_timestamp_key)
+            hi = bisect_right(bucket, timestamp, lo=lo, key=_timestamp_key)
+            position = next(i for i in range(lo, hi) if bucket[i] is entry)
+            del bucket[position]
+            self.rollup.remove(date, entry.get('calories', 0))
+            if hi - lo == 1:
+                dates = self._dates_by_timestamp[timestamp]
+                dates.discard(date)
+                if not dates:
+                    del self._dates_by_timestamp[timestamp]
+            if not bucket:
+                del self._days[date]
+            removed += 1
+        self._count -= removed
+        return removed
+
+    def remove_timestamps(self, timestamps):
+        """Xóa mọi bữa ăn có timestamp thuộc danh sách, trả về số bữa đã xóa."""
+        return self.remove_ids([meal['id'] for meal in self.with_timestamps(timestamps)])
+
+    # --- Truy vấn ---
+
+    def day(self, date):
+        """Các bữa ăn của một ngày (chuỗi YYYY-MM-DD), đã sắp theo giờ."""
+        return self._days.get(date, [])
+
+    def day_calories(self, date):
+        return self.rollup.calories(date)
+
+    def has_day(self, date):
+        return date in self._days
+
+    def calories_for_dates(self, dates):
+        return [self.rollup.calories(date) for date in dates]
+
+    def last_days(self, days, end_date):
+        """Danh sách ngày (cũ -> mới) của `days` ngày kết thúc tại end_date."""
+        if isinstance(end_date, str):
+            end_date = date_cls.fromisoformat(end_date)
+        return [(end_date - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days - 1, -1, -1)]
+
+    def calories_last_days(self, days, end_date):
+        return self.calories_for_dates(self.last_days(days, end_date))
+
+    def meals_in_range(self, start_date, end_date):
+        """Bữa ăn từ start_date đến end_date (bao gồm), chi phí tỉ lệ với số ngày."""
+        start = date_cls.fromisoformat(start_date)
+        end = date_cls.fromisoformat(end_date)
+        meals = []
+        for i in range((end - start).days + 1):
+            meals.extend(self._days.get((start + timedelta(days=i)).strftime("%Y-%m-%d"), ()))
+        return meals
+
+    def get(self, meal_id):
+        return self._by_id.get(meal_id)
+
+    def with_ids(self, ids):
+        """Các bữa ăn hiện có với id thuộc danh sách (mới -> cũ)."""
+        meals = [self._by_id[meal_id] for meal_id in set(ids) if meal_id in self._by_id]
+        meals.sort(key=lambda meal: (meal['date'], meal['timestamp']), reverse=True)
+        return meals
+
+    def with_timestamps(self, timestamps):
+        """Các bữa ăn hiện có với timestamp thuộc danh sách (mới -> cũ)."""
+        meals = []
+        for timestamp in set(timestamps):
+            for date in self._dates_by_timestamp.get(timestamp, ()):
+                meals.extend(meal for meal in self._days[date] if meal['timestamp'] == timestamp)
+        meals.sort(key=lambda meal: (meal['date'], meal['timestamp']), reverse=True)
+        return meals
+
+    def page(self, limit, cursor=None, start_date=None, end_date=None):
+        """Tối đa `limit` bữa ăn theo thứ tự mới -> cũ (ngày rồi timestamp), lọc ngày bao gồm hai đầu.
+
+        `cursor` là giá trị trả về của trang trước; trả về (items, cursor kế tiếp hoặc None nếu hết).
+        """
+        dates = sorted((date for date in self._days
+                        if (start_date is None or date >= start_date) and (end_date is None or date <= end_date)),
+                       reverse=True)
+        cursor_key = cursor[:2] if cursor is not None else None
+        skipped = 0
+        items, last_key, run = [], None, 0
+        for date in dates:
+            if cursor is not None and date > cursor[0]:
+                continue
+            for meal in reversed(self._days[date]):
+                key = (date, meal['timestamp'])
+                if cursor is not None and date == cursor[0]:
+                    if meal['timestamp'] > cursor[1]:
+                        continue
+                    if key == cursor_key and skipped < cursor[2]:
+                        skipped += 1
+                        continue
+                if len(items) == limit:
+                    return items, (last_key[0], last_key[1], run)
+                items.append(meal)
+                # Số bữa cùng (ngày, timestamp) đã trả, kể cả ở các trang trước
+                run = run + 1 if key == last_key else (skipped if key == cursor_key else 0) + 1
+                last_key = key
+        return items, None
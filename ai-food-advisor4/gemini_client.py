@@ -0,0 +1,382 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from collections import deque
+import httpx
+from google.genai import types
+from google.genai.errors import APIError
+from logs import get_logger
+from metrics import histogram
+from profiling import span
+
+log = get_logger('gemini')
+
+# --- CỔNG GỌI GEMINI: GỘP YÊU CẦU TRÙNG, GIỚI HẠN ĐỒNG THỜI VÀ TỐC ĐỘ ---
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', '8'))
+# Token bucket: tốc độ trung bình (yêu cầu/giây) và số yêu cầu dồn tối đa
+GEMINI_RATE_PER_SEC = float(os.environ.get('GEMINI_RATE_PER_SEC', '2'))
+GEMINI_RATE_BURST = int(os.environ.get('GEMINI_RATE_BURST', '10'))
+# Chờ tối đa bao lâu (giây) để có lượt gọi trước khi bỏ cuộc
+GEMINI_THROTTLE_TIMEOUT = float(os.environ.get('GEMINI_THROTTLE_TIMEOUT', '30'))
+# Circuit breaker: mở sau N lỗi liên tiếp, sau RESET giây cho 1 lời gọi thử (half-open)
+GEMINI_BREAKER_FAILURES = int(os.environ.get('GEMINI_BREAKER_FAILURES', '5'))
+GEMINI_BREAKER_RESET = float(os.environ.get('GEMINI_BREAKER_RESET', '30'))
+# Deadline mỗi lời gọi = p95 độ trễ gần đây x FACTOR, kẹp trong [MIN, MAX] giây
+GEMINI_DEADLINE_FACTOR = float(os.environ.get('GEMINI_DEADLINE_FACTOR', '2'))
+GEMINI_DEADLINE_MIN = float(os.environ.get('GEMINI_DEADLINE_MIN', '5'))
+GEMINI_DEADLINE_MAX = float(os.environ.get('GEMINI_DEADLINE_MAX', '60'))
+# Cần tối thiểu bấy nhiêu mẫu trước khi thu hẹp deadline
+GEMINI_DEADLINE_MIN_SAMPLES = 20
+
+GEMINI_REQUEST_SECONDS = histogram('gemini_request_seconds', "Độ trễ lời gọi Gemini thật theo model và lần thử",
+                                   ('model', 'kind', 'attempt', 'outcome'))
+
+class GeminiThrottled(Exception):
+    """Không lấy được lượt gọi Gemini trong thời gian cho phép."""
+
+class CircuitOpen(Exception):
+    """Circuit breaker đang mở: Gemini được coi là đang lỗi, không gọi API."""
+
+def is_outage_error(error):
+    """Lỗi cho thấy Gemini đang có sự cố (được tính vào circuit breaker): lỗi mạng, timeout, 429 và 5xx.
+
+    Các lỗi 4xx khác là do chính yêu cầu (prompt, ảnh, khóa API...), Gemini vẫn trả lời bình thường.
+    """
+    if isinstance(error, APIError):
+        return error.code == 429 or (error.code or 0) >= 500
+    return isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError))
+
+class CircuitBreaker:
+    """Ba trạng thái closed -> open -> half_open, dùng chung cho mọi lời gọi Gemini."""
+
+    def __init__(self, failure_threshold=GEMINI_BREAKER_FAILURES, reset_timeout=GEMINI_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opens = 0
+        self.rejected = 0
+
+    def _set_state(self, state):
+        if state != self.state:
+            log.warning("⚠️ Circuit breaker Gemini đổi trạng thái", previous=self.state, state=state)
+            self.state = state
+
+    def allow(self):
+        """True nếu được phép gọi API; ở half_open chỉ cho một lời gọi thử tại một thời điểm."""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._set_state('half_open')
+            if self.state == 'half_open':
+                if self._probing:
+                    self.rejected += 1
+                    return False
+                self._probing = True
+            return True
+
+    def cancel(self):
+        """Lời gọi đã được cho phép nhưng không thực hiện (bị giới hạn tốc độ) hoặc lỗi không tính vào breaker."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state('closed')
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.opens += 1
+                self._opened_at = time.monotonic()
+                self._set_state('open')
+
+    @property
+    def is_open(self):
+        """Đang mở và chưa tới lúc thử lại: không nên retry."""
+        with self._lock:
+            return self.state == 'open' and time.monotonic() - self._opened_at < self.reset_timeout
+
+class LatencyTracker:
+    """Giữ các độ trễ thành công gần nhất, suy ra deadline cho lời gọi kế tiếp."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def deadline(self):
+        with self._lock:
+            count = len(self._samples)
+        if count < GEMINI_DEADLINE_MIN_SAMPLES:
+            return GEMINI_DEADLINE_MAX
+        return min(GEMINI_DEADLINE_MAX, max(GEMINI_DEADLINE_MIN, self.percentile(0.95) * GEMINI_DEADLINE_FACTOR))
+
+class TokenBucket:
+    """Token bucket thread-safe: mỗi lượt gọi tiêu 1 token, token hồi lại theo `rate`/giây."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_acquire(self):
+        """(True, 0) nếu lấy được token, ngược lại (False, số giây cần chờ)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True, 0.0
+            return False, (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout):
+        """Lấy 1 token, chờ tối đa timeout giây; trả về False nếu hết giờ."""
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired, wait = self._try_acquire()
+            if acquired:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout):
+        """Như acquire nhưng chờ bằng asyncio.sleep, không giữ thread."""
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired, wait = self._try_acquire()
+            if acquired:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def available(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class GeminiGateway:
+    """Bọc genai.Client: các yêu cầu cùng khóa đang chạy chỉ gọi API một lần (single-flight),
+    tổng số lời gọi đồng thời và tốc độ gọi đều bị giới hạn. Circuit breaker chặn gọi khi API đang lỗi.
+
+    Các hàm a* là bản asyncio (client.aio) cho đường phục vụ ASGI; dùng chung breaker, token bucket
+    và thống kê, giới hạn đồng thời tính riêng cho mỗi event loop.
+    """
+
+    def __init__(self, client, max_concurrency=GEMINI_MAX_CONCURRENCY, rate=GEMINI_RATE_PER_SEC,
+                 burst=GEMINI_RATE_BURST, throttle_timeout=GEMINI_THROTTLE_TIMEOUT):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.throttle_timeout = throttle_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self._latency = {}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._async_inflight = {}
+        self._async_slots = weakref.WeakKeyDictionary()
+        self._active = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.throttled = 0
+
+    def _tracker(self, kind):
+        with self._lock:
+            return self._latency.setdefault(kind, LatencyTracker())
+
+    def generate_content(self, model, contents, kind='default', attempt=1):
+        """Một lời gọi API thật, sau khi qua circuit breaker, token bucket và giới hạn đồng thời.
+
+        `kind` tách thống kê độ trễ (ảnh và văn bản có độ trễ rất khác nhau) để tính deadline;
+        `attempt` (lần thử của người gọi) chỉ dùng làm nhãn metrics.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen("Gemini đang lỗi, tạm ngừng gọi API")
+        deadline = time.monotonic() + self.throttle_timeout
+        with span('gemini.throttle', kind=kind):
+            if not self._bucket.acquire(self.throttle_timeout):
+                self._throttled()
+                raise GeminiThrottled("Vượt giới hạn tốc độ gọi Gemini")
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._throttled()
+                raise GeminiThrottled("Quá nhiều lời gọi Gemini đồng thời")
+        tracker = self._tracker(kind)
+        config = types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=int(tracker.deadline() * 1000)))
+        with self._lock:
+            self._active += 1
+            self.calls += 1
+        started = time.monotonic()
+        try:
+            with span('gemini.generate_content', model=model, kind=kind, attempt=attempt):
+                response = self.client.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self._record_error(e)
+            self._observe(model, kind, attempt, type(e).__name__, started)
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+        tracker.record(self._observe(model, kind, attempt, 'ok', started))
+        self.breaker.record_success()
+        return response
+
+    def _record_error(self, error):
+        if is_outage_error(error):
+            self.breaker.record_failure()
+        else:
+            # Không tính vào breaker, chỉ trả lượt thử nếu đây là lời gọi thử ở half_open
+            self.breaker.cancel()
+
+    @staticmethod
+    def _observe(model, kind, attempt, outcome, started):
+        elapsed = time.monotonic() - started
+        GEMINI_REQUEST_SECONDS.observe(elapsed, model=model, kind=kind, attempt=attempt, outcome=outcome)
+        return elapsed
+
+    def _async_slots_for_loop(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._async_slots.get(loop)
+            if slots is None:
+                slots = self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+            return slots
+
+    async def agenerate_content(self, model, contents, kind='default', attempt=1):
+        """Bản asyncio của generate_content: chờ token/lượt gọi và chờ API mà không giữ thread."""
+        if not self.breaker.allow():
+            raise CircuitOpen("Gemini đang lỗi, tạm ngừng gọi API")
+        deadline = time.monotonic() + self.throttle_timeout
+        with span('gemini.throttle', kind=kind):
+            if not await self._bucket.acquire_async(self.throttle_timeout):
+                self._throttled()
+                raise GeminiThrottled("Vượt giới hạn tốc độ gọi Gemini")
+            slots = self._async_slots_for_loop()
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self._throttled()
+                raise GeminiThrottled("Quá nhiều lời gọi Gemini đồng thời")
+        tracker = self._tracker(kind)
+        config = types.GenerateContentConfig(
+            http_options=types.HttpOptions(timeout=int(tracker.deadline() * 1000)))
+        with self._lock:
+            self._active += 1
+            self.calls += 1
+        started = time.monotonic()
+        try:
+            with span('gemini.generate_content', model=model, kind=kind, attempt=attempt):
+                response = await self.client.aio.models.generate_content(model=model, contents=contents,
+                                                                         config=config)
+        except Exception as e:
+            self._record_error(e)
+            self._observe(model, kind, attempt, type(e).__name__, started)
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+            slots.release()
+        tracker.record(self._observe(model, kind, attempt, 'ok', started))
+        self.breaker.record_success()
+        return response
+
+    async def asingle_flight(self, key, func, *args):
+        """Bản asyncio của single_flight: các coroutine cùng `key` chờ chung một task func(*args)."""
+        with self._lock:
+            task = self._async_inflight.get(key)
+            if task is None:
+                task = self._async_inflight[key] = asyncio.ensure_future(func(*args))
+                task.add_done_callback(lambda _: self._async_inflight.pop(key, None))
+            else:
+                self.coalesced += 1
+        # shield: một client ngắt kết nối không hủy lời gọi mà các client khác đang chờ
+        return await asyncio.shield(task)
+
+    def _throttled(self):
+        self.breaker.cancel()
+        with self._lock:
+            self.throttled += 1
+
+    def single_flight(self, key, func, *args):
+        """Chạy func(*args) một lần cho mọi lời gọi đồng thời cùng `key`; tất cả nhận chung kết quả/lỗi."""
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            trackers = dict(self._latency)
+        latency = {kind: {'p50': round(tracker.percentile(0.5), 3), 'p95': round(tracker.percentile(0.95), 3),
+                          'deadline': round(tracker.deadline(), 1)}
+                   for kind, tracker in trackers.items()}
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'throttled': self.throttled,
+                'active': self._active,
+                'in_flight_keys': len(self._inflight) + len(self._async_inflight),
+                'max_concurrency': self.max_concurrency,
+                'tokens_available': round(self._bucket.available(), 2),
+                'breaker': {'state': self.breaker.state, 'opens': self.breaker.opens,
+                            'rejected': self.breaker.rejected},
+                'latency_seconds': latency
+            }
@@ -0,0 +1,26 @@
+import os
+
+# --- CHẠY PRODUCTION NHIỀU WORKER ---
+# Từ thư mục ai-food-advisor4:  gunicorn -c gunicorn.conf.py app:app
+# Nhiều worker cần: STORAGE_BACKEND=sqlite (hoặc json, đã có khóa file), SHARED_STORE=sqlite/redis
+# để session và trạng thái công việc dùng chung, và SECRET_KEY giống nhau ở mọi worker.
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', str(2 * (os.cpu_count() or 1) + 1)))
+# Request phần lớn chờ Gemini/IO: mỗi worker phục vụ nhiều request bằng thread.
+# Đường ASGI (asgi:application): WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WEB_THREADS', '4'))
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+# Không preload: mỗi worker tự mở SQLite/journal, process pool ảnh và thread nền sau khi fork
+preload_app = False
+accesslog = os.environ.get('ACCESS_LOG') or None
+
+# Mỗi worker có process pool giải mã ảnh riêng: mặc định 1 tiến trình/worker thay vì min(4, số CPU)
+os.environ.setdefault('IMAGE_POOL_WORKERS', '1')
+
+def on_starting(server):
+    if workers > 1 and os.environ.get('SHARED_STORE', 'none').lower() in ('none', 'memory'):
+        server.log.warning("Nhiều worker nhưng SHARED_STORE=none/memory: trạng thái công việc nền "
+                           "chỉ xem được ở worker đã nhận ảnh")
@@ -0,0 +1,66 @@
+import io
+import os
+from PIL import Image
+from google.genai import types
+
+# --- NHẬN ẢNH TẢI LÊN: GIẢI MÃ THU NHỎ + MÃ HÓA GỌN TRƯỚC KHI GỬI MODEL ---
+IMAGE_MAX_UPLOAD_BYTES = int(float(os.environ.get('IMAGE_MAX_UPLOAD_MB', '20')) * 1024 * 1024)
+IMAGE_MAX_PIXELS = int(float(os.environ.get('IMAGE_MAX_MEGAPIXELS', '60')) * 1_000_000)
+# Cạnh dài nhất của ảnh sau khi thu nhỏ
+IMAGE_MAX_SIDE = int(os.environ.get('IMAGE_MAX_SIDE', '1024'))
+# Định dạng gửi cho Gemini (JPEG hoặc WEBP)
+IMAGE_MODEL_FORMAT = os.environ.get('IMAGE_MODEL_FORMAT', 'JPEG').upper()
+IMAGE_MODEL_QUALITY = int(os.environ.get('IMAGE_MODEL_QUALITY', '85'))
+
+class ImageRejected(ValueError):
+    """Ảnh vượt giới hạn dung lượng/số điểm ảnh (413)."""
+
+class InvalidImage(ValueError):
+    """File tải lên không phải ảnh hoặc ảnh hỏng, không giải mã được (415)."""
+
+def _stream_size(stream):
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+def ingest_image(stream):
+    """Đọc ảnh từ stream (file tạm của upload, không copy vào bộ nhớ) và thu nhỏ ngay khi giải mã.
+
+    Với JPEG, draft() cho libjpeg giải mã ở tỉ lệ 1/2, 1/4, 1/8 nên ảnh 12 MP không bao giờ
+    được bung ra đủ kích thước trong RAM.
+    """
+    size = _stream_size(stream)
+    if size > IMAGE_MAX_UPLOAD_BYTES:
+        raise ImageRejected(f"Ảnh quá lớn ({size // (1024 * 1024)}MB), tối đa "
+                            f"{IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+    try:
+        img = Image.open(stream)
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(f"Ảnh quá nhiều điểm ảnh: {e}")
+    except Exception as e:
+        raise InvalidImage(f"Không đọc được ảnh: {e}")
+    # Image.open chỉ đọc header: kiểm tra số điểm ảnh trước khi giải mã
+    width, height = img.size
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageRejected(f"Ảnh quá nhiều điểm ảnh ({width}x{height})")
+
+    try:
+        img.draft(img.mode, (IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        if img.size[0] > IMAGE_MAX_SIDE or img.size[1] > IMAGE_MAX_SIDE:
+            img.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        # Giải mã xong để đóng được file tạm của upload và chuyển ảnh sang worker thread
+        img.load()
+    except Exception as e:
+        # Header đọc được nhưng dữ liệu ảnh bị cắt cụt/hỏng
+        raise InvalidImage(f"Không đọc được ảnh: {e}")
+    return img
+
+def to_model_part(img):
+    """Mã hóa lại ảnh đã thu nhỏ thành JPEG/WebP gọn (SDK mặc định gửi PNG, nặng gấp nhiều lần)."""
+    buffer = io.BytesIO()
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    img.save(buffer, IMAGE_MODEL_FORMAT, quality=IMAGE_MODEL_QUALITY)
+    return types.Part.from_bytes(data=buffer.getvalue(), mime_type=f'image/{IMAGE_MODEL_FORMAT.lower()}')
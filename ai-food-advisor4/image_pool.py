@@ -0,0 +1,264 @@
+import io
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from PIL import Image
+from image_ingest import ImageRejected, ingest_image, IMAGE_MAX_UPLOAD_BYTES
+from logs import get_logger
+
+log = get_logger('image_pool')
+
+# --- PROCESS POOL GIẢI MÃ / THU NHỎ ẢNH (KHÔNG GIỮ GIL CỦA TIẾN TRÌNH WEB) ---
+# 0 = tắt, giải mã trong thread của tiến trình web như trước
+IMAGE_POOL_WORKERS = int(os.environ.get('IMAGE_POOL_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Số ảnh tối đa đang chờ/đang xử lý; vượt quá thì chờ tối đa QUEUE_TIMEOUT giây rồi từ chối
+IMAGE_POOL_MAX_PENDING = int(os.environ.get('IMAGE_POOL_MAX_PENDING', str(max(1, IMAGE_POOL_WORKERS) * 4)))
+IMAGE_POOL_QUEUE_TIMEOUT = float(os.environ.get('IMAGE_POOL_QUEUE_TIMEOUT', '5'))
+# Số mẫu thời gian xử lý gần nhất dùng để tính phân vị
+METRIC_WINDOW = 1000
+COPY_CHUNK = 1024 * 1024
+
+class ImagePoolBusy(Exception):
+    """Process pool đã đủ việc, client nên thử lại sau."""
+
+class _BufferReader(io.RawIOBase):
+    """File chỉ đọc trên một memoryview (shared memory) để PIL đọc mà không copy cả ảnh."""
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), len(self._view) - self._pos))
+        memoryview(buffer).cast('B')[:count] = self._view[self._pos:self._pos + count]
+        self._pos += count
+        return count
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+def _warmup(delay):
+    # Giữ tiến trình bận một chút để executor fork thêm tiến trình cho các lượt warm-up tiếp theo
+    time.sleep(delay)
+    return os.getpid()
+
+def _ingest_shared(name, size):
+    """Chạy trong tiến trình con: đọc ảnh từ shared memory, ghi điểm ảnh đã thu nhỏ ra shared memory mới."""
+    started = time.perf_counter()
+    source = SharedMemory(name=name)
+    try:
+        with source.buf[:size] as view:
+            reader = _BufferReader(view)
+            img = ingest_image(io.BufferedReader(reader))
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            pixels = img.tobytes()
+            reader.close()
+    finally:
+        source.close()
+    output = SharedMemory(create=True, size=max(1, len(pixels)))
+    output.buf[:len(pixels)] = pixels
+    output.close()
+    return output.name, len(pixels), img.mode, img.size, time.perf_counter() - started
+
+def _copy_to_shared_memory(stream):
+    """Chép upload (file tạm) vào shared memory theo từng khối, không tạo bản bytes trung gian."""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    if size > IMAGE_MAX_UPLOAD_BYTES:
+        raise ImageRejected(f"Ảnh quá lớn ({size // (1024 * 1024)}MB), tối đa "
+                            f"{IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)}MB")
+    stream.seek(0)
+    shm = SharedMemory(create=True, size=max(1, size))
+    try:
+        position = 0
+        while position < size:
+            with shm.buf[position:min(size, position + COPY_CHUNK)] as chunk:
+                read = stream.readinto(chunk) if hasattr(stream, 'readinto') else None
+                if read is None:
+                    data = stream.read(len(chunk))
+                    chunk[:len(data)] = data
+                    read = len(data)
+            if not read:
+                break
+            position += read
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, position
+
+def _take_image(name, length, mode, size):
+    output = SharedMemory(name=name)
+    try:
+        with output.buf[:length] as view:
+            return Image.frombytes(mode, size, view)
+    finally:
+        output.close()
+        output.unlink()
+
+class ImagePool:
+    """ProcessPoolExecutor cho ảnh tải lên; dữ liệu ảnh vào/ra qua shared memory thay vì pickle."""
+
+    def __init__(self, workers=IMAGE_POOL_WORKERS, max_pending=IMAGE_POOL_MAX_PENDING,
+                 queue_timeout=IMAGE_POOL_QUEUE_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        # Tiến trình con dùng chung resource tracker để shared memory tạo/xóa ở hai phía không bị báo rò rỉ
+        resource_tracker.ensure_running()
+        self._executor = self._new_executor()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._task_times = deque(maxlen=METRIC_WINDOW)
+        self._started_at = time.monotonic()
+        self._busy_seconds = 0.0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def _new_executor(self):
+        # fork khi chưa có thread nào (xem create_image_pool): tiến trình con không phải nạp lại app
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+
+    def _replace_executor(self, broken):
+        """Thay executor đã hỏng (tiến trình con bị kill, OOM...) bằng executor mới; trả về executor hiện tại."""
+        with self._lock:
+            replaced = self._executor is broken
+            if replaced:
+                self._executor = self._new_executor()
+                self.restarts += 1
+            executor = self._executor
+        if replaced:
+            log.warning("⚠️ Image process pool bị hỏng (tiến trình con chết), tạo pool mới", restarts=self.restarts)
+            # Không chờ: có thể đang chạy trong thread quản lý của chính executor cũ
+            broken.shutdown(wait=False)
+        return executor
+
+    def warm(self):
+        """Khởi động sẵn mọi tiến trình con (import PIL...) để request đầu không phải chờ."""
+        pids = {future.result() for future in [self._executor.submit(_warmup, 0.2) for _ in range(self.workers)]}
+        log.info("✅ Image process pool sẵn sàng", processes=len(pids))
+
+    def submit(self, stream):
+        """Đưa ảnh vào pool, trả về Future cho PIL Image đã thu nhỏ (ImagePoolBusy nếu quá tải)."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise ImagePoolBusy("Hệ thống đang xử lý quá nhiều ảnh")
+        try:
+            shm, size = _copy_to_shared_memory(stream)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_flight += 1
+            executor = self._executor
+        result = Future()
+        self._run(executor, shm, size, result, retried=False)
+        return result
+
+    def _run(self, executor, shm, size, result, retried):
+        """Chạy ảnh trên executor; pool hỏng (tiến trình con bị kill, OOM...) thì thay executor và chạy lại
+        ảnh này một lần (ảnh vẫn còn trong shared memory)."""
+        try:
+            task = executor.submit(_ingest_shared, shm.name, size)
+        except Exception as e:
+            # RuntimeError: executor vừa bị một lời gọi khác thay và shutdown
+            if isinstance(e, (BrokenProcessPool, RuntimeError)) and not retried:
+                self._run(self._replace_executor(executor), shm, size, result, retried=True)
+            else:
+                self._finish(shm, result, None, e)
+            return
+
+        def done(task):
+            error = task.exception()
+            if isinstance(error, BrokenProcessPool) and not retried:
+                self._run(self._replace_executor(executor), shm, size, result, retried=True)
+            else:
+                self._finish(shm, result, task, error)
+        task.add_done_callback(done)
+
+    def _finish(self, shm, result, task, error):
+        shm.close()
+        shm.unlink()
+        image = None
+        if error is None:
+            name, length, mode, size, elapsed = task.result()
+            try:
+                image = _take_image(name, length, mode, size)
+            except Exception as e:
+                error = e
+        with self._lock:
+            self.in_flight -= 1
+            if error is None:
+                self.completed += 1
+                self._busy_seconds += elapsed
+                self._task_times.append(elapsed)
+            else:
+                self.failed += 1
+        self._slots.release()
+        if error is None:
+            result.set_result(image)
+        else:
+            result.set_exception(error)
+
+    def ingest(self, stream):
+        return self.submit(stream).result()
+
+    def stats(self):
+        with self._lock:
+            task_times = sorted(self._task_times)
+            uptime = time.monotonic() - self._started_at
+
+            def percentile(q):
+                return task_times[min(len(task_times) - 1, int(q * len(task_times)))] if task_times else 0.0
+
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'in_flight': self.in_flight,
+                # Tỉ lệ tiến trình con đang bận lúc này và trung bình từ khi khởi động
+                'utilization': round(min(self.in_flight, self.workers) / self.workers, 4),
+                'busy_ratio': round(self._busy_seconds / (uptime * self.workers), 4) if uptime else 0.0,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'restarts': self.restarts,
+                'task_seconds': {'p50': round(percentile(0.5), 4), 'p95': round(percentile(0.95), 4)}
+            }
+
+def create_image_pool():
+    """Tạo và khởi động pool theo cấu hình; None nếu bị tắt hoặc không khởi động được.
+
+    Phải gọi trước khi app tạo thread nền (storage, worker) để fork an toàn. Nền tảng không có fork
+    (Windows) sẽ nạp lại cả app trong mỗi tiến trình con, nên ở đó pool bị tắt.
+    """
+    if IMAGE_POOL_WORKERS <= 0 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    try:
+        pool = ImagePool()
+        pool.warm()
+        return pool
+    except Exception as e:
+        log.error("❌ Không khởi động được image process pool, giải mã ảnh trong thread", error=e)
+        return None
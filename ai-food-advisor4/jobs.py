@@ -0,0 +1,252 @@
+import time
+import uuid
+import queue
+import asyncio
+import threading
+from collections import deque
+from logs import get_logger
+
+log = get_logger('jobs')
+
+# --- HÀNG ĐỢI CÔNG VIỆC NỀN (IN-PROCESS) ---
+
+# Giữ kết quả công việc đã xong trong bao lâu (giây) để client kịp lấy
+JOB_RESULT_TTL = 15 * 60
+# Số mẫu thời gian gần nhất dùng để tính phân vị
+METRIC_WINDOW = 1000
+# Chu kỳ hỏi lại trạng thái khi long-poll công việc của worker khác hoặc long-poll bằng asyncio (giây)
+POLL_INTERVAL = 0.2
+
+class QueueFull(Exception):
+    """Hàng đợi đã đầy, client nên thử lại sau."""
+
+class Job:
+    __slots__ = ('id', 'owner', 'status', 'result', 'error', 'created_at', 'started_at',
+                 'finished_at', '_func', '_args')
+
+    def __init__(self, owner, func, args):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._func = func
+        self._args = args
+
+    @property
+    def done(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data['data'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+    @classmethod
+    def from_shared(cls, data):
+        """Bản sao chỉ đọc của công việc do worker khác ghi vào kho dùng chung."""
+        job = cls(data['owner'], None, ())
+        job.id = data['job_id']
+        job.status = data['status']
+        job.result = data.get('data')
+        job.error = data.get('error')
+        return job
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class JobQueue:
+    """Hàng đợi có giới hạn + nhóm worker thread cố định.
+
+    Đây là bản chạy trong tiến trình (không cần broker), dùng được cả khi test offline.
+    Khi có `store` (shared_store), trạng thái công việc được ghi vào đó để mọi worker đều trả lời được.
+    submit_async chạy coroutine thành task trên event loop (đường ASGI) thay vì trên worker thread.
+    """
+
+    def __init__(self, workers=4, max_queue=100, name='jobs', store=None):
+        self.workers = workers
+        self.name = name
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._threads = []
+        self._running = 0
+        self._async_jobs = set()
+        self._wait_times = deque(maxlen=METRIC_WINDOW)
+        self._process_times = deque(maxlen=METRIC_WINDOW)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, owner, func, *args):
+        """Đưa công việc vào hàng đợi, trả về Job ngay lập tức (QueueFull nếu đầy)."""
+        job = Job(owner, func, args)
+        with self._lock:
+            self._ensure_workers()
+            self._purge_finished()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFull(f"Hàng đợi {self.name} đã đầy")
+            self._jobs[job.id] = job
+            self.submitted += 1
+        self._publish(job)
+        return job
+
+    def _publish(self, job):
+        if self.store is None:
+            return
+        try:
+            self.store.set(f'job:{job.id}', dict(job.to_dict(), owner=job.owner), JOB_RESULT_TTL)
+        except Exception as e:
+            log.warning("⚠️ Không ghi được trạng thái công việc vào kho dùng chung", job=job.id, error=e)
+
+    def submit_async(self, owner, func, *args):
+        """Chạy coroutine func(*args) thành task trên event loop hiện tại, trả về Job ngay.
+
+        Không chiếm worker thread; số task đang chạy vẫn bị giới hạn bởi max_queue (QueueFull nếu đầy).
+        """
+        job = Job(owner, func, args)
+        with self._lock:
+            self._purge_finished()
+            if len(self._async_jobs) >= self._queue.maxsize:
+                self.rejected += 1
+                raise QueueFull(f"Hàng đợi {self.name} đã đầy")
+            self._jobs[job.id] = job
+            self.submitted += 1
+            # Giữ tham chiếu tới task để không bị thu gom khi đang chạy
+            task = asyncio.ensure_future(self._run_async(job))
+            self._async_jobs.add(task)
+        task.add_done_callback(self._async_jobs.discard)
+        self._publish(job)
+        return job
+
+    async def _run_async(self, job):
+        self._start(job)
+        try:
+            result, error, status = await job._func(*job._args), None, 'done'
+        except Exception as e:
+            log.error("❌ Công việc lỗi", job=job.id, error=e)
+            result, error, status = None, str(e), 'failed'
+        self._finish(job, result, error, status)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            self._start(job)
+            try:
+                result, error, status = job._func(*job._args), None, 'done'
+            except Exception as e:
+                log.error("❌ Công việc lỗi", job=job.id, error=e)
+                result, error, status = None, str(e), 'failed'
+            self._finish(job, result, error, status)
+            self._queue.task_done()
+
+    def _start(self, job):
+        with self._lock:
+            job.status = 'running'
+            job.started_at = time.time()
+            self._running += 1
+            self._wait_times.append(job.started_at - job.created_at)
+
+    def _finish(self, job, result, error, status):
+        with self._cond:
+            job.result, job.error, job.status = result, error, status
+            job.finished_at = time.time()
+            job._func = job._args = None
+            self._running -= 1
+            self._process_times.append(job.finished_at - job.started_at)
+            if status == 'done':
+                self.completed += 1
+            else:
+                self.failed += 1
+            self._cond.notify_all()
+        self._publish(job)
+
+    def _purge_finished(self):
+        expired_before = time.time() - JOB_RESULT_TTL
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.done and job.finished_at < expired_before]:
+            del self._jobs[job_id]
+
+    def get(self, job_id, owner=None, wait=0):
+        """Lấy công việc; wait > 0 sẽ chờ (long-poll) tối đa wait giây tới khi xong."""
+        deadline = time.time() + wait
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                if owner is not None and job.owner != owner:
+                    return None
+                while not job.done and time.time() < deadline:
+                    self._cond.wait(deadline - time.time())
+                return job
+        return self._get_shared(job_id, owner, deadline)
+
+    def _get_shared(self, job_id, owner, deadline):
+        """Công việc do worker khác nhận: đọc (và long-poll) từ kho dùng chung."""
+        if self.store is None:
+            return None
+        while True:
+            data = self.store.get(f'job:{job_id}')
+            if data is None or (owner is not None and data['owner'] != owner):
+                return None
+            job = Job.from_shared(data)
+            if job.done or time.time() >= deadline:
+                return job
+            time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.time())))
+
+    async def get_async(self, job_id, owner=None, wait=0):
+        """Như get() nhưng long-poll bằng asyncio.sleep, không chặn event loop."""
+        deadline = time.time() + wait
+        while True:
+            job = self.get(job_id, owner)
+            if job is None or job.done or time.time() >= deadline:
+                return job
+            await asyncio.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.time())))
+
+    def metrics(self):
+        with self._lock:
+            wait_times = list(self._wait_times)
+            process_times = list(self._process_times)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'workers': self.workers,
+                'running': self._running,
+                'async_tasks': len(self._async_jobs),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait_seconds': {
+                    'p50': round(_percentile(wait_times, 0.5), 4),
+                    'p95': round(_percentile(wait_times, 0.95), 4),
+                    'max': round(max(wait_times, default=0.0), 4)
+                },
+                'processing_seconds': {
+                    'p50': round(_percentile(process_times, 0.5), 4),
+                    'p95': round(_percentile(process_times, 0.95), 4),
+                    'max': round(max(process_times, default=0.0), 4)
+                }
+            }
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+
+# --- LOG CÓ MỨC, DẠNG CẤU TRÚC (key=value HOẶC JSON), LOG DEBUG ĐƯỢC LẤY MẪU ---
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# text: "thời gian MỨC tên thông điệp key=value ..."; json: mỗi dòng một object
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+# Tỉ lệ giữ lại log DEBUG (nội dung phản hồi Gemini... mỗi request) khi LOG_LEVEL=DEBUG: 1 = tất cả
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1'))
+ROOT_LOGGER = 'food_advisor'
+
+def _field_text(value):
+    text = str(value)
+    return json.dumps(text, ensure_ascii=False) if not text or any(c in text for c in ' ="\n') else text
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={_field_text(value)}' for key, value in fields.items())
+        return line
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class Logger:
+    """log.info("thông điệp", key=value, ...). Mức không bật chỉ tốn một lần isEnabledFor (có cache);
+    debug() còn được lấy mẫu theo LOG_DEBUG_SAMPLE_RATE nên có thể bật ở production."""
+    __slots__ = ('_logger',)
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def is_enabled_for(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def debug(self, msg, **fields):
+        if self._logger.isEnabledFor(logging.DEBUG) and (
+                LOG_DEBUG_SAMPLE_RATE >= 1 or random.random() < LOG_DEBUG_SAMPLE_RATE):
+            self._logger.debug(msg, extra={'fields': fields})
+
+    def info(self, msg, **fields):
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(msg, extra={'fields': fields})
+
+    def warning(self, msg, **fields):
+        if self._logger.isEnabledFor(logging.WARNING):
+            self._logger.warning(msg, extra={'fields': fields})
+
+    def error(self, msg, **fields):
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._logger.error(msg, extra={'fields': fields})
+
+    def exception(self, msg, **fields):
+        """error() kèm traceback; gọi trong khối except."""
+        if self._logger.isEnabledFor(logging.ERROR):
+            self._logger.error(msg, exc_info=True, extra={'fields': fields})
+
+_configure_lock = threading.Lock()
+_configured = False
+
+def _configure():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        root = logging.getLogger(ROOT_LOGGER)
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _configured = True
+
+def get_logger(name):
+    _configure()
+    return Logger(logging.getLogger(f'{ROOT_LOGGER}.{name}'))
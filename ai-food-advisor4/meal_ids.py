@@ -0,0 +1,45 @@
+import os
+import time
+import hashlib
+import threading
+from datetime import datetime
+
+# --- ID BỮA ĂN: 26 KÝ TỰ KIỂU ULID, SẮP XẾP ĐƯỢC THEO THỜI GIAN TẠO ---
+# 10 ký tự đầu: mili giây (48 bit); 16 ký tự sau: 80 bit ngẫu nhiên. Bảng chữ Crockford base32.
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_RANDOM_BITS = 80
+
+_lock = threading.Lock()
+_last = (0, 0)
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+def new_meal_id():
+    """ID mới; các ID tạo trong cùng mili giây vẫn tăng dần theo thứ tự tạo."""
+    global _last
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, last_random = _last
+        if ms <= last_ms:
+            ms, random_part = last_ms, (last_random + 1) % (1 << _RANDOM_BITS)
+        else:
+            random_part = int.from_bytes(os.urandom(_RANDOM_BITS // 8), 'big')
+        _last = (ms, random_part)
+    return _encode(ms, 10) + _encode(random_part, 16)
+
+def legacy_meal_id(seed, timestamp):
+    """ID cố định cho bữa ăn cũ chưa có id: phần thời gian lấy từ timestamp, phần còn lại từ hash của seed.
+
+    Cùng seed luôn cho cùng ID nên dữ liệu cũ được gán ID giống nhau ở mọi lần nạp.
+    """
+    try:
+        ms = max(0, int(datetime.fromisoformat(timestamp).timestamp() * 1000))
+    except (TypeError, ValueError):
+        ms = 0
+    random_part = int.from_bytes(hashlib.sha1(seed.encode('utf-8')).digest()[:_RANDOM_BITS // 8], 'big')
+    return _encode(ms, 10) + _encode(random_part, 16)
@@ -0,0 +1,241 @@
+import os
+from collections.abc import Mapping
+from datetime import date as date_cls
+
+# --- BỮA ĂN DẠNG GỌN TRONG BỘ NHỚ (__slots__, SỐ NGUYÊN ĐÓNG GÓI, CHUỖI DÙNG CHUNG) ---
+# COMPACT_MEALS=0: giữ mỗi bữa ăn là dict như khi đọc từ file/SQLite
+COMPACT_MEALS = os.environ.get('COMPACT_MEALS', '1') != '0'
+# Số chuỗi (tên món, mô tả, phân tích) tối đa trong bảng dùng chung; đầy thì làm lại từ đầu
+MEAL_TEXT_POOL_SIZE = int(os.environ.get('MEAL_TEXT_POOL_SIZE', '100000'))
+
+RECORD_FIELDS = ('id', 'timestamp', 'date', 'meal_name', 'calories', 'description', 'nutrition_analysis')
+_FIELD_SET = frozenset(RECORD_FIELDS)
+_MISSING = object()
+_DAY_US = 86_400_000_000
+
+# Bảng dùng chung: các bữa có cùng chuỗi/số trỏ tới một object thay vì mỗi bữa một bản sao
+_texts = {}
+_numbers = {}
+# Bảng hai chiều chuỗi chuẩn <-> số cho ngày, giờ trong ngày và độ lệch múi giờ; chỉ chứa chuỗi định dạng
+# lại được y hệt, nên chuỗi nào tra thấy thì đóng gói/giải nén không làm đổi chuỗi
+_date_texts, _date_ordinals = {}, {}
+_clock_texts, _clock_seconds = {}, {}
+_offset_texts, _offset_minutes = {}, {}
+
+def _shared_text(value):
+    if type(value) is not str:
+        return value
+    shared = _texts.get(value)
+    if shared is None:
+        if len(_texts) >= MEAL_TEXT_POOL_SIZE:
+            _texts.clear()
+        shared = _texts.setdefault(value, value)
+    return shared
+
+def _shared_number(value):
+    # Số nhỏ (calories, số ngày, độ lệch múi giờ) lặp lại rất nhiều; số lớn (thời điểm) thì không
+    if type(value) is int and -100_000 <= value <= 1_000_000:
+        return _numbers.setdefault(value, value)
+    return value
+
+def _date_text(ordinal):
+    text = _date_texts.get(ordinal)
+    if text is None:
+        text = date_cls.fromordinal(ordinal).isoformat()
+        _date_ordinals[text] = ordinal = _shared_number(ordinal)
+        _date_texts[ordinal] = text
+    return text
+
+def _date_ordinal(text):
+    ordinal = _date_ordinals.get(text)
+    if ordinal is None:
+        try:
+            ordinal = date_cls.fromisoformat(text).toordinal()
+        except ValueError:
+            return None
+        if _date_text(ordinal) != text:
+            return None
+    return ordinal
+
+def _clock_text(seconds):
+    text = _clock_texts.get(seconds)
+    if text is None:
+        minutes, second = divmod(seconds, 60)
+        text = f'{minutes // 60:02d}:{minutes % 60:02d}:{second:02d}'
+        _clock_seconds[text] = seconds = _shared_number(seconds)
+        _clock_texts[seconds] = text
+    return text
+
+def _clock_second(text):
+    seconds = _clock_seconds.get(text)
+    if seconds is None:
+        if len(text) != 8 or text[2] != ':' or text[5] != ':' or not text.replace(':', '').isdigit():
+            return None
+        seconds = int(text[:2]) * 3600 + int(text[3:5]) * 60 + int(text[6:])
+        if seconds >= 86400 or _clock_text(seconds) != text:
+            return None
+    return seconds
+
+def _offset_text(minutes):
+    if minutes is None:
+        return ''
+    text = _offset_texts.get(minutes)
+    if text is None:
+        sign = '-' if minutes < 0 else '+'
+        text = f'{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}'
+        _offset_minutes[text] = minutes = _shared_number(minutes)
+        _offset_texts[minutes] = text
+    return text
+
+def _offset_minute(text):
+    if text == '':
+        return None
+    minutes = _offset_minutes.get(text)
+    if minutes is None:
+        if len(text) != 6 or text[0] not in '+-' or text[3] != ':' or not (text[1:3] + text[4:]).isdigit():
+            return _MISSING
+        minutes = (int(text[1:3]) * 60 + int(text[4:])) * (-1 if text[0] == '-' else 1)
+        if abs(minutes) >= 24 * 60 or _offset_text(minutes) != text:
+            return _MISSING
+    return minutes
+
+def _format_timestamp(local_us, offset):
+    days, us = divmod(local_us, _DAY_US)
+    seconds, micro = divmod(us, 1_000_000)
+    date = _date_texts.get(days + 1) or _date_text(days + 1)
+    clock = _clock_texts.get(seconds) or _clock_text(seconds)
+    zone = '' if offset is None else _offset_texts.get(offset) or _offset_text(offset)
+    return f'{date}T{clock}.{micro:06d}{zone}' if micro else f'{date}T{clock}{zone}'
+
+def pack_timestamp(value):
+    """'YYYY-MM-DDTHH:MM:SS[.ffffff][+HH:MM]' -> (micro giây giờ địa phương kể từ 0001-01-01,
+    độ lệch múi giờ theo phút hoặc None).
+
+    Chỉ đóng gói khi định dạng lại ra đúng chuỗi cũ (cursor và so sánh timestamp dựa vào chuỗi);
+    dạng khác (Z, phần lẻ giây ngắn...) trả về chính chuỗi đó và None.
+    """
+    if type(value) is not str or len(value) < 19 or value[10] != 'T':
+        return value, None
+    ordinal = _date_ordinal(value[:10])
+    seconds = _clock_second(value[11:19])
+    if ordinal is None or seconds is None:
+        return value, None
+    rest, micro = value[19:], 0
+    if rest[:1] == '.':
+        fraction = rest[1:7]
+        if len(fraction) != 6 or not fraction.isdigit() or fraction == '000000':
+            return value, None
+        rest, micro = rest[7:], int(fraction)
+    offset = _offset_minute(rest)
+    if offset is _MISSING:
+        return value, None
+    return ((ordinal - 1) * 86400 + seconds) * 1_000_000 + micro, offset
+
+def pack_date(value):
+    """'YYYY-MM-DD' -> số thứ tự ngày (date.toordinal); giá trị khác giữ nguyên."""
+    if type(value) is not str:
+        return value
+    ordinal = _date_ordinal(value)
+    return value if ordinal is None else ordinal
+
+class MealRecord(Mapping):
+    """Một bữa ăn, đọc/ghi như dict (meal['timestamp'], meal.get('calories', 0), dict(meal)...).
+
+    timestamp, date và calories lưu dạng số; chuỗi ISO chỉ được dựng lại khi đọc. Tên món, mô tả và phân tích
+    dinh dưỡng dùng chung một object cho các bữa có cùng nội dung. Trường không có trong bữa ăn gốc thì cũng
+    không có ở đây (keys() giống dict gốc).
+    """
+
+    __slots__ = ('id', '_timestamp', '_offset', '_date', 'meal_name', 'calories', 'description', 'nutrition_analysis')
+
+    def __init__(self, entry):
+        self.id = entry.get('id', _MISSING)
+        self._timestamp, self._offset = pack_timestamp(entry.get('timestamp', _MISSING))
+        self._date = pack_date(entry.get('date', _MISSING))
+        self.meal_name = _shared_text(entry.get('meal_name', _MISSING))
+        self.calories = _shared_number(entry.get('calories', _MISSING))
+        self.description = _shared_text(entry.get('description', _MISSING))
+        self.nutrition_analysis = _shared_text(entry.get('nutrition_analysis', _MISSING))
+
+    @property
+    def timestamp(self):
+        value = self._timestamp
+        return _format_timestamp(value, self._offset) if type(value) is int else value
+
+    @property
+    def date(self):
+        value = self._date
+        return _date_texts.get(value) or _date_text(value) if type(value) is int else value
+
+    def _get(self, key):
+        return getattr(self, key) if key in _FIELD_SET else _MISSING
+
+    def __getitem__(self, key):
+        # timestamp đọc nhiều nhất (sắp xếp, phân trang): tránh qua property
+        if key == 'timestamp':
+            value = self._timestamp
+            if type(value) is int:
+                return _format_timestamp(value, self._offset)
+        else:
+            value = getattr(self, key) if key in _FIELD_SET else _MISSING
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self._get(key) is not _MISSING
+
+    def __setitem__(self, key, value):
+        if key in ('timestamp', 'date') and type(value) is int:
+            # Số nguyên ở đây là giá trị đã đóng gói
+            raise TypeError(f"{key} của bữa ăn phải là chuỗi ISO")
+        if key == 'timestamp':
+            self._timestamp, self._offset = pack_timestamp(value)
+        elif key == 'date':
+            self._date = pack_date(value)
+        elif key in ('meal_name', 'description', 'nutrition_analysis'):
+            setattr(self, key, _shared_text(value))
+        elif key == 'calories':
+            self.calories = _shared_number(value)
+        elif key == 'id':
+            self.id = value
+        else:
+            raise KeyError(f"Bữa ăn không có trường {key}")
+
+    def __iter__(self):
+        return (field for field in RECORD_FIELDS if self._get(field) is not _MISSING)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        data = {'id': self.id, 'timestamp': self.timestamp, 'date': self.date, 'meal_name': self.meal_name,
+                'calories': self.calories, 'description': self.description,
+                'nutrition_analysis': self.nutrition_analysis}
+        if _MISSING in data.values():
+            return {key: value for key, value in data.items() if value is not _MISSING}
+        return data
+
+    def __repr__(self):
+        return f'MealRecord({self.to_dict()!r})'
+
+    def __reduce__(self):
+        return MealRecord, (self.to_dict(),)
+
+def compact_meal(entry):
+    """MealRecord cho một bữa ăn dạng dict; bữa có trường lạ hoặc timestamp/date kiểu số (dữ liệu cũ),
+    hay đã gọn, thì giữ nguyên."""
+    if (type(entry) is not dict or not _FIELD_SET.issuperset(entry)
+            or type(entry.get('timestamp')) is int or type(entry.get('date')) is int):
+        return entry
+    return MealRecord(entry)
+
+def compact_food_log(food_log):
+    """food_log với mọi bữa ăn ở dạng gọn (hoặc nguyên bản nếu COMPACT_MEALS=0)."""
+    if not COMPACT_MEALS:
+        return food_log
+    return [compact_meal(entry) for entry in food_log]
@@ -0,0 +1,174 @@
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from logs import get_logger
+
+log = get_logger('metrics')
+
+# --- METRICS KIỂU PROMETHEUS (COUNTER / GAUGE / HISTOGRAM) VÀ ĐỊNH DẠNG TEXT CHO /metrics ---
+# Số liệu theo từng tiến trình: mỗi worker gunicorn trả bộ của riêng nó, Prometheus phân biệt bằng nhãn instance
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+# Mốc histogram độ trễ mặc định (giây)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels_text(pairs):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(hậu tố tên, [(nhãn, giá trị)], giá trị) của mọi chuỗi số liệu."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield '', list(zip(self.labelnames, key)), value
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """Đếm theo mốc (le) kèm tổng và số lần quan sát; mỗi observe O(log số mốc) dưới một lock."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Đo thời gian chạy khối `with` (kể cả khi ném lỗi)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', labels + [('le', _format_value(float(bound)))], cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+class Registry:
+    """Các metric khai báo trong code cộng với collector đọc số liệu sẵn có (stats()) lúc scrape."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} đã được khai báo với kiểu/nhãn khác")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def add_collector(self, collect):
+        """collect() trả về các bộ (tên, kiểu, mô tả, nhãn dạng dict, giá trị); chỉ được gọi khi scrape."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_labels_text(labels)} {_format_value(value)}')
+        families = {}
+        for collect in collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                # Một nguồn số liệu lỗi không làm hỏng cả trang /metrics
+                log.warning("⚠️ Collector metrics lỗi", collector=getattr(collect, '__name__', collect), error=e)
+                continue
+            for name, kind, documentation, labels, value in samples:
+                families.setdefault((name, kind, documentation), []).append((labels, value))
+        for (name, kind, documentation), samples in families.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels_text(sorted(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labels=()):
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+def gauge(name, documentation, labels=()):
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+def add_collector(collect):
+    REGISTRY.add_collector(collect)
+
+def render():
+    return REGISTRY.render()
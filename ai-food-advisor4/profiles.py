@@ -0,0 +1,27 @@
+# --- HỒ SƠ CÁ NHÂN: TDEE VÀ MỤC TIÊU CALORIES ---
+ACTIVITY_FACTORS = {'ít': 1.2, 'bình thường': 1.55, 'nhiều': 1.9}
+# Điều chỉnh calories mỗi ngày so với TDEE theo mục tiêu
+GOAL_ADJUSTMENTS = {'giảm cân': -500, 'tăng cân': 500}
+MIN_TARGET_CALORIES = 1200
+
+def calculate_tdee(gender, age, height_cm, weight_kg, activity_level):
+    """Tính toán TDEE dựa trên công thức Mifflin-St Jeor."""
+    if gender.lower() == 'nam':
+        bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + 5
+    else:
+        bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) - 161
+
+    activity_factor = ACTIVITY_FACTORS.get(activity_level.lower(), 1.55)
+    return round(bmr * activity_factor)
+
+def build_profile(name, gender, age, height_cm, weight_kg, activity_level, goal):
+    """Hồ sơ lưu trong storage: thông tin nhập vào kèm TDEE và mục tiêu calories mỗi ngày."""
+    tdee = calculate_tdee(gender, age, height_cm, weight_kg, activity_level)
+    target_goal = goal.lower()
+    target_calories = tdee + GOAL_ADJUSTMENTS.get(target_goal, 0)
+    return {
+        'name': name, 'gender': gender, 'age': age,
+        'height_cm': height_cm, 'weight_kg': weight_kg,
+        'activity_level': activity_level, 'goal': target_goal,
+        'tdee': tdee, 'target_calories': max(MIN_TARGET_CALORIES, target_calories)
+    }
@@ -0,0 +1,287 @@
+import os
+import sys
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from collections import deque
+
+# --- PROFILING: SPAN THEO REQUEST VÀ LẤY MẪU STACK CỦA REQUEST CHẬM ---
+# Bật từ đầu bằng PROFILING_ENABLED=1, hoặc bật/tắt lúc chạy qua POST /api/admin/profile
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+# Request chậm hơn ngưỡng này (ms) thì giữ lại các mẫu stack cho flamegraph
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '500'))
+# Chu kỳ lấy mẫu stack của các thread đang xử lý request (ms)
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+# Số trace gần nhất giữ trong bộ nhớ, số stack khác nhau tối đa trong bảng tổng hợp
+PROFILE_MAX_TRACES = int(os.environ.get('PROFILE_MAX_TRACES', '200'))
+PROFILE_MAX_STACKS = int(os.environ.get('PROFILE_MAX_STACKS', '20000'))
+PROFILE_MAX_SPANS = 1000
+PROFILE_MAX_DEPTH = 128
+
+# (trace, span cha) của ngữ cảnh hiện tại; asyncio task con kế thừa nên span lồng đúng cả khi gather
+_current = contextvars.ContextVar('profiling_span', default=None)
+# Request do event loop phục vụ (đường ASGI) dù before_request chạy ở thread pool: trace không gắn với thread
+_event_loop_request = contextvars.ContextVar('profiling_event_loop_request', default=False)
+
+class Span:
+    __slots__ = ('name', 'attrs', 'parent', 'start', 'end')
+
+    def __init__(self, name, attrs, parent, start):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.start = start
+        self.end = None
+
+    def path(self):
+        names = []
+        span = self
+        while span is not None:
+            names.append(span.name)
+            span = span.parent
+        return names[::-1]
+
+class Trace:
+    """Một request: span gốc, các span con theo thứ tự bắt đầu và mẫu stack (chỉ giữ khi request chậm)."""
+
+    def __init__(self, trace_id, name, attrs):
+        self.id = trace_id
+        self.started_at = time.time()
+        self.root = Span(name, attrs, None, time.perf_counter())
+        self.spans = []
+        self.samples = {}
+        self.status = None
+        self.slow = False
+
+    @property
+    def duration_ms(self):
+        end = self.root.end if self.root.end is not None else time.perf_counter()
+        return (end - self.root.start) * 1000
+
+    def to_dict(self):
+        base = self.root.start
+        return {
+            'id': self.id,
+            'name': self.root.name,
+            'attrs': self.root.attrs,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration_ms, 3),
+            'slow': self.slow,
+            'samples': sum(self.samples.values()),
+            'spans': [{'name': span.name, 'path': ';'.join(span.path()[1:]), 'attrs': span.attrs,
+                       'start_ms': round((span.start - base) * 1000, 3),
+                       'duration_ms': round(((span.end or span.start) - span.start) * 1000, 3)}
+                      for span in self.spans]
+        }
+
+class _SpanContext:
+    __slots__ = ('trace', 'span', 'token')
+
+    def __init__(self, trace, span):
+        self.trace = trace
+        self.span = span
+
+    def __enter__(self):
+        self.span.start = time.perf_counter()
+        self.token = _current.set((self.trace, self.span))
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.perf_counter()
+        _current.reset(self.token)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(name, **attrs):
+    """Context manager đo một đoạn code trong trace của request hiện tại.
+
+    Không có trace (profiling tắt, thread nền) thì trả về context rỗng dùng chung: chỉ tốn một ContextVar.get().
+    """
+    current = _current.get()
+    if current is None:
+        return _NOOP_SPAN
+    trace, parent = current
+    if len(trace.spans) >= PROFILE_MAX_SPANS:
+        return _NOOP_SPAN
+    child = Span(name, attrs, parent, 0.0)
+    trace.spans.append(child)
+    return _SpanContext(trace, child)
+
+def fold_frame(frame, limit=PROFILE_MAX_DEPTH):
+    """Stack của frame dạng "ngoài;...;trong" (định dạng folded của flamegraph.pl / speedscope)."""
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def _in_event_loop():
+    if _event_loop_request.get():
+        return True
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def mark_event_loop_request():
+    """Gọi trước khi chạy before_request của một request do event loop phục vụ ở thread pool."""
+    _event_loop_request.set(True)
+
+class Profiler:
+    """Ghi trace cho mọi request khi bật; một thread nền lấy mẫu stack của các thread đang xử lý request
+    (đồng bộ) và chỉ giữ mẫu của request chậm hơn slow_ms.
+
+    Coroutine trên event loop dùng chung một thread nên không lấy mẫu stack được, chỉ có span.
+    Số liệu theo từng tiến trình (mỗi worker gunicorn một bộ).
+    """
+
+    def __init__(self, enabled=PROFILING_ENABLED, slow_ms=PROFILE_SLOW_MS, interval_ms=PROFILE_SAMPLE_INTERVAL_MS,
+                 max_traces=PROFILE_MAX_TRACES, max_stacks=PROFILE_MAX_STACKS):
+        self.enabled = False
+        self.slow_ms = slow_ms
+        self.interval_ms = interval_ms
+        self.max_stacks = max_stacks
+        self._traces = deque(maxlen=max_traces)
+        self._stacks = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._sampler = None
+        self.traced = 0
+        self.slow_requests = 0
+        self.dropped_stacks = 0
+        if enabled:
+            self.configure(enabled=True)
+
+    def configure(self, enabled=None, slow_ms=None, interval_ms=None):
+        with self._lock:
+            if slow_ms is not None:
+                self.slow_ms = float(slow_ms)
+            if interval_ms is not None:
+                self.interval_ms = max(1.0, float(interval_ms))
+            if enabled is not None:
+                self.enabled = bool(enabled)
+            if self.enabled and (self._sampler is None or not self._sampler.is_alive()):
+                self._sampler = threading.Thread(target=self._sample_loop, name='profile-sampler', daemon=True)
+                self._sampler.start()
+        return self.status()
+
+    def reset(self):
+        with self._lock:
+            self._traces.clear()
+            self._stacks.clear()
+            self.traced = self.slow_requests = self.dropped_stacks = 0
+
+    def status(self):
+        with self._lock:
+            return {'enabled': self.enabled, 'slow_ms': self.slow_ms, 'interval_ms': self.interval_ms,
+                    'traced': self.traced, 'slow_requests': self.slow_requests, 'traces_kept': len(self._traces),
+                    'stacks': len(self._stacks), 'dropped_stacks': self.dropped_stacks}
+
+    # --- Trace của một request ---
+
+    def start_trace(self, name, **attrs):
+        """Bắt đầu trace cho ngữ cảnh hiện tại; trả về handle cho finish_trace (None nếu đang tắt)."""
+        if not self.enabled:
+            return None
+        trace = Trace(next(self._ids), name, attrs)
+        token = _current.set((trace, trace.root))
+        thread_id = None if _in_event_loop() else threading.get_ident()
+        if thread_id is not None:
+            with self._lock:
+                self._threads[thread_id] = trace
+        return trace, token, thread_id
+
+    def finish_trace(self, handle, status=None):
+        if handle is None:
+            return
+        trace, token, thread_id = handle
+        trace.root.end = time.perf_counter()
+        trace.status = status
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Kết thúc ở ngữ cảnh khác (teardown chạy ở nơi khác nơi bắt đầu)
+            _current.set(None)
+        with self._lock:
+            if thread_id is not None:
+                self._threads.pop(thread_id, None)
+            self.traced += 1
+            trace.slow = trace.duration_ms >= self.slow_ms
+            if trace.slow:
+                self.slow_requests += 1
+                for stack, count in trace.samples.items():
+                    key = f'{trace.root.name};{stack}'
+                    if key in self._stacks:
+                        self._stacks[key] += count
+                    elif len(self._stacks) < self.max_stacks:
+                        self._stacks[key] = count
+                    else:
+                        self.dropped_stacks += count
+            else:
+                trace.samples = {}
+            self._traces.append(trace)
+
+    def _sample_loop(self):
+        while self.enabled:
+            time.sleep(self.interval_ms / 1000)
+            with self._lock:
+                if not self._threads:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, trace in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stack = fold_frame(frame)
+                        trace.samples[stack] = trace.samples.get(stack, 0) + 1
+                # Không giữ tham chiếu tới frame của thread khác quá lượt lấy mẫu
+                del frames
+
+    # --- Xuất kết quả ---
+
+    def traces(self, slow_only=False, limit=50):
+        with self._lock:
+            traces = [trace for trace in self._traces if trace.slow or not slow_only]
+        return [trace.to_dict() for trace in traces[::-1][:limit]]
+
+    def folded_stacks(self):
+        """Mẫu stack của các request chậm, mỗi dòng "route;khung;...;khung số_mẫu"."""
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def folded_spans(self, slow_only=False):
+        """Thời gian riêng (self time, micro giây) của từng đường span, cộng dồn qua các trace đang giữ."""
+        with self._lock:
+            traces = [trace for trace in self._traces if trace.slow or not slow_only]
+        totals = {}
+        for trace in traces:
+            children = {}
+            for child in trace.spans:
+                if child.end is not None:
+                    parent = child.parent if child.parent is not None else trace.root
+                    children[id(parent)] = children.get(id(parent), 0.0) + (child.end - child.start)
+            for item in [trace.root] + trace.spans:
+                if item.end is None:
+                    continue
+                own = (item.end - item.start) - children.get(id(item), 0.0)
+                key = ';'.join(item.path())
+                totals[key] = totals.get(key, 0) + max(0, int(own * 1_000_000))
+        return ''.join(f'{key} {value}\n' for key, value in sorted(totals.items()) if value)
+
+profiler = Profiler()
@@ -0,0 +1,115 @@
+import threading
+from datetime import date as date_cls, timedelta
+
+# --- TỔNG HỢP CALORIES THEO NGÀY / CỬA SỔ TRƯỢT ---
+
+# Các cửa sổ được duy trì sẵn: tuần, 2 tuần, tháng
+ROLLUP_WINDOWS = (7, 14, 30)
+
+def _to_date(value):
+    return date_cls.fromisoformat(value) if isinstance(value, str) else value
+
+class CalorieRollup:
+    """Tổng calories và số bữa theo ngày, kèm tổng cửa sổ 7/14/30 ngày.
+
+    Thêm/xóa một bữa ăn cập nhật O(1); cửa sổ chỉ tính lại (O(30)) khi sang ngày mới.
+    Lần đọc window() có thể tính lại cửa sổ trong lúc storage đang ghi, nên cả hai giữ khóa của rollup.
+    """
+
+    def __init__(self, windows=ROLLUP_WINDOWS):
+        self._daily = {}
+        self._window_sizes = tuple(windows)
+        self._anchor = None
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_entries(cls, entries, windows=ROLLUP_WINDOWS):
+        rollup = cls(windows)
+        for entry in entries:
+            rollup.add(entry['date'], entry.get('calories', 0))
+        return rollup
+
+    # --- Cập nhật gia tăng ---
+
+    def add(self, date, calories, meals=1):
+        with self._lock:
+            day = self._daily.get(date)
+            new_day = day is None
+            if new_day:
+                day = self._daily[date] = [0, 0]
+            day[0] += calories
+            day[1] += meals
+            self._update_windows(date, calories, meals, 1 if new_day else 0)
+
+    def remove(self, date, calories, meals=1):
+        with self._lock:
+            day = self._daily.get(date)
+            if day is None:
+                return
+            day[0] -= calories
+            day[1] -= meals
+            emptied = day[1] <= 0
+            if emptied:
+                del self._daily[date]
+            self._update_windows(date, -calories, -meals, -1 if emptied else 0)
+
+    def _update_windows(self, date, calories, meals, active_days):
+        if self._anchor is None:
+            return
+        age = (self._anchor - _to_date(date)).days
+        for size, totals in self._windows.items():
+            if 0 <= age < size:
+                totals[0] += calories
+                totals[1] += meals
+                totals[2] += active_days
+
+    def _reanchor(self, today):
+        self._anchor = today
+        self._windows = {size: self._sum_days(size, today) for size in self._window_sizes}
+
+    def _sum_days(self, days, today):
+        totals = [0, 0, 0]
+        for i in range(days):
+            day = self._daily.get((today - timedelta(days=i)).strftime("%Y-%m-%d"))
+            if day:
+                totals[0] += day[0]
+                totals[1] += day[1]
+                totals[2] += 1
+        return totals
+
+    # --- Truy vấn ---
+
+    def calories(self, date):
+        day = self._daily.get(date)
+        return day[0] if day else 0
+
+    def meals(self, date):
+        day = self._daily.get(date)
+        return day[1] if day else 0
+
+    def has_day(self, date):
+        return date in self._daily
+
+    def window(self, days, today):
+        """Tổng {calories, meals, active_days} của `days` ngày kết thúc tại today."""
+        today = _to_date(today)
+        with self._lock:
+            if today != self._anchor:
+                self._reanchor(today)
+            totals = list(self._windows.get(days) or self._sum_days(days, today))
+        return {'calories': totals[0], 'meals': totals[1], 'active_days': totals[2]}
+
+    def daily_totals(self):
+        """{date: (calories, meals)} - dùng để so sánh khi kiểm tra lệch (drift)."""
+        with self._lock:
+            return {date: (day[0], day[1]) for date, day in self._daily.items()}
+
+def diff_rollups(expected, actual):
+    """So sánh hai dict {date: (calories, meals)}, trả về danh sách ngày bị lệch."""
+    drift = []
+    for date in sorted(set(expected) | set(actual)):
+        if expected.get(date, (0, 0)) != actual.get(date, (0, 0)):
+            drift.append({'date': date, 'expected': expected.get(date, (0, 0)),
+                          'actual': actual.get(date, (0, 0))})
+    return drift
@@ -0,0 +1,98 @@
+import os
+import json
+from collections.abc import Mapping
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, không có thì thử msgspec rồi json của thư viện chuẩn
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack (hoặc msgspec) chỉ cần khi SNAPSHOT_FORMAT=msgpack
+    msgpack = None
+
+# --- MÃ HÓA JSON NHANH (ORJSON / MSGSPEC, DỰ PHÒNG JSON CHUẨN) VÀ MSGPACK ---
+# JSON_BACKEND: auto (orjson > msgspec > json), hoặc chỉ định orjson / msgspec / json
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto').lower()
+
+def _choose_json_backend(name):
+    available = {'orjson': orjson is not None, 'msgspec': msgspec is not None, 'json': True}
+    if name == 'auto':
+        return next(backend for backend in ('orjson', 'msgspec', 'json') if available[backend])
+    if name not in available:
+        raise ValueError(f"JSON_BACKEND không hợp lệ: {name}")
+    if not available[name]:
+        raise RuntimeError(f"JSON_BACKEND={name} cần cài gói {name}")
+    return name
+
+json_backend = _choose_json_backend(JSON_BACKEND)
+msgpack_backend = 'msgpack' if msgpack is not None else 'msgspec' if msgspec is not None else None
+
+def _encode_default(default):
+    def encode(obj):
+        # Mapping không phải dict (MealRecord...) mã hóa như dict
+        if isinstance(obj, Mapping):
+            return obj.to_dict() if hasattr(obj, 'to_dict') else dict(obj)
+        if default is not None:
+            return default(obj)
+        raise TypeError(f"Không mã hóa JSON được kiểu {type(obj).__name__}")
+    return encode
+
+def dumps(obj, sort_keys=False, indent=False, default=None):
+    """JSON dạng bytes UTF-8 (giữ nguyên tiếng Việt như ensure_ascii=False), gọn không khoảng trắng;
+    indent=True thụt lề 2 dấu cách. default(obj) đổi kiểu không mã hóa được (kể cả datetime, như Flask)."""
+    passthrough_datetime = default is not None
+    default = _encode_default(default)
+    if json_backend == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if passthrough_datetime:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=default, option=option)
+    if json_backend == 'msgspec':
+        data = msgspec.json.encode(obj, enc_hook=default, order='sorted' if sort_keys else None)
+        return msgspec.json.format(data, indent=2) if indent else data
+    return json.dumps(obj, ensure_ascii=False, sort_keys=sort_keys, default=default,
+                      indent=2 if indent else None, separators=None if indent else (',', ':')).encode('utf-8')
+
+def loads(data):
+    """Đọc JSON từ bytes hoặc str; dữ liệu hỏng luôn ném json.JSONDecodeError (là ValueError) ở mọi backend."""
+    if json_backend == 'orjson':
+        return orjson.loads(data)
+    if json_backend == 'msgspec':
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            raise json.JSONDecodeError(str(e), data if isinstance(data, str) else '', 0) from e
+    return json.loads(data)
+
+def packb(obj):
+    """msgpack dạng bytes; RuntimeError nếu chưa cài msgpack hay msgspec."""
+    if msgpack_backend == 'msgpack':
+        return msgpack.packb(obj, use_bin_type=True)
+    if msgpack_backend == 'msgspec':
+        return msgspec.msgpack.encode(obj)
+    raise RuntimeError("Định dạng msgpack cần cài gói msgpack hoặc msgspec")
+
+def unpackb(data):
+    """Đọc msgpack; dữ liệu hỏng hoặc bị cắt cụt ném ValueError."""
+    if msgpack_backend == 'msgpack':
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (ValueError, msgpack.exceptions.UnpackException) as e:
+            raise ValueError(f"msgpack không hợp lệ: {e}") from e
+    if msgpack_backend == 'msgspec':
+        try:
+            return msgspec.msgpack.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(f"msgpack không hợp lệ: {e}") from e
+    raise RuntimeError("Định dạng msgpack cần cài gói msgpack hoặc msgspec")
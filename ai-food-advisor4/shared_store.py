@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import secrets
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+try:
+    import redis
+except ImportError:  # redis là tùy chọn, chỉ cần khi SHARED_STORE=redis
+    redis = None
+
+# --- KHO KEY-VALUE DÙNG CHUNG GIỮA CÁC WORKER (SESSION, TRẠNG THÁI CÔNG VIỆC) ---
+# none (mặc định: cookie session, công việc chỉ xem được ở worker đã nhận),
+# memory (một tiến trình, dùng khi phát triển/test), sqlite (mọi worker trên một máy), redis
+SHARED_STORE = os.environ.get('SHARED_STORE', 'none').lower()
+SHARED_STORE_FILE = os.environ.get('SHARED_STORE_FILE', 'shared_store.sqlite3')
+SHARED_STORE_REDIS_URL = os.environ.get('SHARED_STORE_REDIS_URL', 'redis://localhost:6379/0')
+# Xóa khóa hết hạn sau mỗi bấy nhiêu lần ghi (SQLite)
+SHARED_STORE_PURGE_EVERY = 500
+# Session không đổi chỉ được gia hạn (ghi lại vào kho) tối đa mỗi bấy nhiêu giây
+SESSION_REFRESH_INTERVAL = float(os.environ.get('SESSION_REFRESH_INTERVAL', '60'))
+
+SHARED_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_kv_expires_at ON kv(expires_at);
+"""
+
+class MemoryStore:
+    """Thay thế cục bộ trong tiến trình: cùng giao diện nhưng không chia sẻ giữa các worker."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            return json.loads(value)
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (json.dumps(value, ensure_ascii=False), time.time() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+class SQLiteStore:
+    """Bảng key-value trong SQLite (WAL): mọi worker trên cùng máy dùng chung."""
+
+    name = 'sqlite'
+
+    def __init__(self, file_name=SHARED_STORE_FILE):
+        self.file_name = file_name
+        self._local = threading.local()
+        self._writes = 0
+        self._connect().executescript(SHARED_STORE_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_name, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute("SELECT value FROM kv WHERE key = ? AND expires_at >= ?",
+                                      (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(value, ensure_ascii=False), time.time() + ttl))
+        self._writes += 1
+        if self._writes % SHARED_STORE_PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+class RedisStore:
+    """Redis cho triển khai nhiều máy."""
+
+    name = 'redis'
+
+    def __init__(self, url=SHARED_STORE_REDIS_URL):
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(key, json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+def create_shared_store(kind=None):
+    """Kho theo cấu hình SHARED_STORE; None nếu tắt."""
+    kind = (kind or SHARED_STORE).lower()
+    if kind == 'none':
+        return None
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'sqlite':
+        return SQLiteStore()
+    if kind == 'redis':
+        if redis is None:
+            raise RuntimeError("SHARED_STORE=redis cần cài gói redis")
+        return RedisStore()
+    raise ValueError(f"SHARED_STORE không hợp lệ: {kind}")
+
+# --- SESSION PHÍA SERVER ---
+
+class StoreSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, refreshed_at=0.0):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.refreshed_at = refreshed_at
+        self.modified = False
+        # user_id lúc mở session: đổi người dùng thì phải cấp id session mới
+        self.opened_user_id = self.get('user_id')
+        self.regenerated = False
+
+    def regenerate(self):
+        """Cấp id session mới khi lưu (gọi lúc đăng nhập), id cũ bị xóa khỏi kho."""
+        self.regenerated = True
+        self.modified = True
+
+class StoreSessionInterface(SessionInterface):
+    """Session lưu trong kho dùng chung; cookie chỉ chứa id ngẫu nhiên của session."""
+
+    prefix = 'session:'
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            stored = self.store.get(self.prefix + sid)
+            if stored is not None:
+                return StoreSession(stored['data'], sid=sid, refreshed_at=stored['refreshed_at'])
+        return StoreSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        # Chống session fixation: id mà người khác có thể đã biết không được mang theo quyền đăng nhập mới
+        if not session.new and (session.regenerated or session.get('user_id') != session.opened_user_id):
+            self.store.delete(self.prefix + session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.modified = True
+        if not session:
+            if session.modified:
+                self.store.delete(self.prefix + session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+        # Tránh một lần ghi vào kho cho mỗi request chỉ để gia hạn session
+        now = time.time()
+        if not session.modified and now - session.refreshed_at < SESSION_REFRESH_INTERVAL:
+            return
+        self.store.set(self.prefix + session.sid, {'data': dict(session), 'refreshed_at': now},
+                       app.permanent_session_lifetime.total_seconds())
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
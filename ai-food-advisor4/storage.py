@@ -0,0 +1,1272 @@
+import os
+import json
+import time
+import glob
+import shutil
+import tempfile
+import atexit
+import sqlite3
+import argparse
+import itertools
+import threading
+from bisect import bisect_right
+from functools import wraps
+from contextlib import contextmanager
+from cache import LRUCache
+from food_log import FoodLog
+from meal_ids import new_meal_id, legacy_meal_id
+from analytics import MealColumns
+from rollups import CalorieRollup, diff_rollups
+from logs import get_logger
+from metrics import histogram
+from profiling import span
+from serialization import dumps, loads, packb, unpackb, msgpack_backend
+from meal_records import compact_food_log
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, chỉ chạy một tiến trình
+    fcntl = None
+
+# --- CẤU HÌNH LƯU TRỮ ---
+# STORAGE_BACKEND: 'json' (mặc định, tương thích db.json cũ) hoặc 'sqlite'
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json').lower()
+DB_FILE = os.environ.get('DB_FILE', 'db.json')
+# Định dạng snapshot của backend JSON: json (gọn, không khoảng trắng), json-indent (dễ đọc) hoặc msgpack
+# (nhị phân, bữa ăn lưu dạng mảng theo MEAL_RECORD_FIELDS). Khi đọc tự nhận định dạng nên đổi qua lại được.
+SNAPSHOT_FORMAT = os.environ.get('SNAPSHOT_FORMAT', 'json').lower()
+SNAPSHOT_FORMATS = ('json', 'json-indent', 'msgpack')
+# Bản sao lưu xoay vòng của snapshot: <db>.1 (mới nhất) ... <db>.N; 0 để tắt. Snapshot được gộp lại mỗi vài
+# chục giây nên chỉ xoay khi bản .1 đã cũ hơn SNAPSHOT_BACKUP_INTERVAL giây
+SNAPSHOT_BACKUPS = int(os.environ.get('SNAPSHOT_BACKUPS', '3'))
+SNAPSHOT_BACKUP_INTERVAL = float(os.environ.get('SNAPSHOT_BACKUP_INTERVAL', '300'))
+SQLITE_FILE = os.environ.get('SQLITE_FILE', 'db.sqlite3')
+
+# Số bản ghi người dùng giữ trong cache (LRU)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+# Journal của backend JSON: gộp vào snapshot sau số thao tác / số giây này
+JOURNAL_COMPACT_OPS = int(os.environ.get('JOURNAL_COMPACT_OPS', '1000'))
+JOURNAL_COMPACT_INTERVAL = float(os.environ.get('JOURNAL_COMPACT_INTERVAL', '30'))
+
+# Số thay đổi gần nhất giữ lại cho mỗi người dùng để client đồng bộ delta (?since=version)
+SYNC_CHANGES_LIMIT = int(os.environ.get('SYNC_CHANGES_LIMIT', '1000'))
+
+MEAL_FIELDS = ('timestamp', 'date', 'meal_name', 'calories', 'description', 'nutrition_analysis')
+# Thứ tự cột của bữa ăn dạng mảng trong snapshot msgpack
+MEAL_RECORD_FIELDS = ('id',) + MEAL_FIELDS
+PROFILE_FIELDS = ('name', 'gender', 'age', 'height_cm', 'weight_kg',
+                  'activity_level', 'goal', 'tdee', 'target_calories')
+
+log = get_logger('storage')
+# Đọc/ghi nguyên file JSON (snapshot db.json) và từng thao tác của backend (nạp một người dùng, mỗi lần ghi)
+STORAGE_FILE_SECONDS = histogram('storage_file_seconds', "Thời gian đọc/ghi nguyên file JSON", ('op',))
+STORAGE_OPERATION_SECONDS = histogram('storage_operation_seconds', "Thời gian thao tác của backend lưu trữ",
+                                      ('backend', 'op'))
+# Chờ khóa file <db>.lock giữa các tiến trình; thường dưới 1ms nên cần bucket nhỏ hơn LATENCY_BUCKETS
+STORAGE_LOCK_WAIT_SECONDS = histogram('storage_lock_wait_seconds', "Thời gian chờ khóa file của backend JSON",
+                                      ('mode',), buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5,
+                                                          1, 5))
+
+class SnapshotCorrupted(Exception):
+    """Snapshot hỏng và không còn bản sao lưu nào đọc được."""
+
+# --- HÀM HỖ TRỢ FILE JSON ---
+
+def encode_snapshot(data, fmt=SNAPSHOT_FORMAT):
+    """Snapshot {"users": ..., "journal_seq": ...} dạng bytes theo định dạng fmt."""
+    if fmt != 'msgpack':
+        return dumps(data, indent=fmt == 'json-indent')
+    fields = set(MEAL_RECORD_FIELDS)
+    users = {}
+    for username, user in data['users'].items():
+        # Bữa ăn đủ đúng các trường chuẩn thành mảng (không lặp lại tên khóa); bữa ăn khác giữ dạng map
+        meals = [[meal[field] for field in MEAL_RECORD_FIELDS] if meal.keys() == fields else dict(meal)
+                 for meal in user.get('food_log', [])]
+        users[username] = dict(user, food_log=meals)
+    return packb(dict(data, users=users, meal_fields=list(MEAL_RECORD_FIELDS)))
+
+def decode_snapshot(raw):
+    """Đọc snapshot JSON hoặc msgpack (JSON luôn bắt đầu bằng "{", map msgpack thì không); lỗi là ValueError."""
+    if raw.lstrip()[:1] == b'{' or not raw:
+        return loads(raw)
+    data = unpackb(raw)
+    if not isinstance(data, dict):
+        raise ValueError("Snapshot msgpack không phải map")
+    fields = data.pop('meal_fields', MEAL_RECORD_FIELDS)
+    for user in data.get('users', {}).values():
+        user['food_log'] = [dict(zip(fields, meal)) if isinstance(meal, list) else meal
+                            for meal in user.get('food_log', [])]
+    return data
+
+def backup_files(file_name, backups=SNAPSHOT_BACKUPS):
+    """Đường dẫn các bản sao lưu của snapshot, mới nhất trước."""
+    return [f'{file_name}.{index}' for index in range(1, backups + 1)]
+
+def _read_snapshot(path):
+    with STORAGE_FILE_SECONDS.time(op='load'), open(path, 'rb') as f:
+        data = decode_snapshot(f.read())
+    if not isinstance(data, dict) or not isinstance(data.get('users'), dict):
+        raise ValueError("Snapshot không có users")
+    return data
+
+def load_data(file_name, default_data, backups=SNAPSHOT_BACKUPS):
+    """Đọc snapshot (JSON hoặc msgpack); chưa có file (và chưa có bản sao lưu) thì trả về default_data.
+
+    File hỏng hoặc bị mất thì đọc bản sao lưu mới nhất còn đọc được; không còn bản nào thì ném
+    SnapshotCorrupted thay vì trả về dữ liệu rỗng (lần gộp journal sau sẽ ghi đè mất mọi người dùng).
+    """
+    paths = [path for path in backup_files(file_name, backups) if os.path.exists(path)]
+    if not os.path.exists(file_name):
+        if not paths:
+            return default_data
+        log.error("❌ Mất snapshot nhưng còn bản sao lưu", file=file_name)
+    else:
+        try:
+            return _read_snapshot(file_name)
+        except ValueError as e:
+            log.error("❌ Snapshot bị lỗi định dạng, thử bản sao lưu", file=file_name, error=e)
+    for path in paths:
+        try:
+            data = _read_snapshot(path)
+        except ValueError as e:
+            log.error("❌ Bản sao lưu cũng bị lỗi", file=path, error=e)
+            continue
+        log.warning("⚠️ Dùng bản sao lưu thay cho snapshot hỏng; thay đổi sau bản sao lưu có thể đã mất",
+                    file=file_name, backup=path)
+        return data
+    raise SnapshotCorrupted(f"{file_name} bị hỏng và không có bản sao lưu đọc được")
+
+def _fsync_dir(path):
+    # Đổi tên chỉ bền vững sau khi fsync thư mục chứa file (POSIX; Windows không mở được thư mục)
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _rotate_backups(file_name, backups, interval):
+    """Đẩy <db>.1 -> <db>.2 ... và giữ snapshot hiện tại làm <db>.1 (hard link, không chép dữ liệu)."""
+    paths = backup_files(file_name, backups)
+    if not paths or not os.path.exists(file_name):
+        return
+    try:
+        if time.time() - os.path.getmtime(paths[0]) < interval:
+            return
+    except FileNotFoundError:
+        pass
+    for older, newer in zip(reversed(paths[:-1]), reversed(paths[1:])):
+        if os.path.exists(older):
+            os.replace(older, newer)
+    try:
+        os.link(file_name, paths[0])
+    except OSError:
+        # Hệ thống file không hỗ trợ hard link
+        shutil.copy2(file_name, paths[0])
+
+def save_data(file_name, data, fmt=SNAPSHOT_FORMAT, backups=SNAPSHOT_BACKUPS,
+              backup_interval=SNAPSHOT_BACKUP_INTERVAL):
+    """Lưu snapshot theo định dạng fmt một cách nguyên tử: ghi file tạm cùng thư mục, fsync rồi os.replace.
+
+    Crash giữa chừng chỉ để lại file tạm (<db>.tmp-*), snapshot cũ còn nguyên. Người gọi giữ khóa ghi
+    để không có hai tiến trình cùng xoay bản sao lưu.
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    with STORAGE_FILE_SECONDS.time(op='save'):
+        raw = encode_snapshot(data, fmt)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(file_name) + '.tmp-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+            _rotate_backups(file_name, backups, backup_interval)
+            os.replace(tmp_path, file_name)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        _fsync_dir(directory)
+
+def remove_stale_temp_files(file_name):
+    """Xóa file tạm do save_data bỏ lại khi crash; chỉ gọi khi giữ khóa ghi."""
+    for path in glob.glob(glob.escape(file_name) + '.tmp-*'):
+        try:
+            os.unlink(path)
+            log.warning("🧹 Xóa file tạm của lần ghi snapshot dở", file=path)
+        except FileNotFoundError:
+            pass
+
+def _timed(op):
+    """Ghi thời gian chạy phương thức của backend vào storage_operation_seconds."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with span(f'storage.{op}'), STORAGE_OPERATION_SECONDS.time(backend=self.name, op=op):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def new_user_record(username, password_hash):
+    """Tạo bản ghi người dùng mới theo đúng cấu trúc db.json."""
+    return {
+        'username': username,
+        'password_hash': password_hash,
+        'profile': None,
+        'food_log': [],
+        'sync': new_sync_state()
+    }
+
+def assign_meal_ids(user_id, meals, start=0):
+    """Gán id cố định cho các bữa ăn cũ chưa có id (theo user, vị trí trong food_log và timestamp)."""
+    for offset, meal in enumerate(meals):
+        if not meal.get('id'):
+            meal['id'] = legacy_meal_id(f"{user_id}:{start + offset}:{meal.get('timestamp')}", meal.get('timestamp'))
+
+# --- NHẬT KÝ THAY ĐỔI CHO DELTA SYNC ---
+
+def new_sync_state():
+    """version tăng mỗi lần food_log đổi; changes = [version, 'add'|'delete', id bữa ăn];
+    horizon = version lớn nhất đã bị cắt khỏi changes."""
+    return {'version': 0, 'horizon': 0, 'changes': []}
+
+def record_changes(sync, kind, ids, limit=SYNC_CHANGES_LIMIT):
+    """Tăng version và ghi thay đổi; bỏ các thay đổi cũ nhất khi vượt giới hạn."""
+    sync['version'] += 1
+    sync['changes'].extend([sync['version'], kind, meal_id] for meal_id in ids)
+    excess = len(sync['changes']) - limit
+    if excess > 0:
+        sync['horizon'] = max(sync['horizon'], sync['changes'][excess - 1][0])
+        del sync['changes'][:excess]
+
+def changes_since(sync, since):
+    """(id đã thêm, id đã xóa) sau version `since`; None nếu không còn đủ lịch sử."""
+    if since < sync['horizon'] or since > sync['version']:
+        return None
+    added, deleted = set(), set()
+    changes = sync['changes']
+    for _, kind, meal_id in changes[bisect_right(changes, since, key=lambda change: change[0]):]:
+        (added if kind == 'add' else deleted).add(meal_id)
+    return added, deleted
+
+def apply_op(users, op):
+    """Áp dụng một thao tác ghi (journal/write-through) lên dict users."""
+    kind = op['op']
+    if kind == 'create_user':
+        users.setdefault(op['user']['username'], op['user'])
+        return
+    user = users.get(op['user_id'])
+    if user is None:
+        return
+    if kind == 'set_profile':
+        user['profile'] = op['profile']
+    elif kind == 'add_meals':
+        # Journal ghi trước khi có id bữa ăn: gán id cố định giống như khi nạp snapshot
+        assign_meal_ids(user['username'], op['entries'], start=len(user['food_log']))
+        user['food_log'].extend(op['entries'])
+        record_changes(user.setdefault('sync', new_sync_state()), 'add', [entry['id'] for entry in op['entries']])
+    elif kind == 'delete_meal_ids':
+        ids = set(op['ids'])
+        user['food_log'] = [meal for meal in user['food_log'] if meal['id'] not in ids]
+        record_changes(user.setdefault('sync', new_sync_state()), 'delete', op['ids'])
+    elif kind == 'delete_meals':
+        # Thao tác cũ (xóa theo timestamp), chỉ còn gặp khi đọc lại journal cũ
+        timestamps = set(op['timestamps'])
+        removed = [meal['id'] for meal in user['food_log'] if meal['timestamp'] in timestamps]
+        user['food_log'] = [meal for meal in user['food_log'] if meal['timestamp'] not in timestamps]
+        record_changes(user.setdefault('sync', new_sync_state()), 'delete', removed)
+
+# --- LỚP CƠ SỞ: CACHE BẢN GHI NGƯỜI DÙNG ---
+
+class _CachedUser:
+    """Bản ghi người dùng trong cache cùng các chỉ mục dựng sẵn từ food_log."""
+
+    __slots__ = ('data', 'revision', '_food_index', '_columns')
+
+    def __init__(self, data, revision):
+        # Bữa ăn trong cache ở dạng gọn (MealRecord); bản đọc từ file/SQLite là dict
+        data['food_log'] = compact_food_log(data['food_log'])
+        self.data = data
+        # Đổi mỗi khi bản ghi được nạp lại hoặc bị sửa: dùng để vô hiệu hóa dữ liệu dẫn xuất (dashboard...)
+        self.revision = revision
+        self._food_index = None
+        self._columns = None
+
+    def food_index(self):
+        if self._food_index is None:
+            self._food_index = FoodLog(self.data['food_log'])
+        return self._food_index
+
+    def columns(self):
+        if self._columns is None:
+            self._columns = MealColumns.from_log(self.data['food_log'])
+        return self._columns
+
+    def apply(self, op):
+        if op['op'] == 'add_meals':
+            op = dict(op, entries=compact_food_log(op['entries']))
+        apply_op({self.data['username']: self.data}, op)
+        if op['op'] in ('add_meals', 'delete_meal_ids'):
+            self._columns = None
+        if self._food_index is not None:
+            if op['op'] == 'add_meals':
+                for meal in op['entries']:
+                    self._food_index.add(meal)
+            elif op['op'] == 'delete_meal_ids':
+                self._food_index.remove_ids(op['ids'])
+
+class CachedStorage:
+    """Cache LRU theo user, ghi xuyên (write-through) và vô hiệu hóa theo version của backend.
+
+    Lớp con cần cài đặt: _load_user(user_id), _write(op) -> vé chờ ghi bền (hoặc None, truyền cho
+    _wait_durable() sau khi đã nhả khóa), và _version() hoặc tự cài _validate_cache(). _write phải tự bỏ
+    khỏi cache các bản ghi bị tiến trình khác sửa mà nó phát hiện.
+    """
+
+    def __init__(self, cache_size=USER_CACHE_SIZE):
+        self._cache = LRUCache(cache_size)
+        self._lock = threading.RLock()
+        self._seen_version = None
+        self._revisions = itertools.count(1)
+
+    def _validate_cache(self):
+        # Có tiến trình/công cụ khác ghi vào DB -> bỏ toàn bộ cache
+        version = self._version()
+        if version != self._seen_version:
+            self._cache.clear()
+            self._seen_version = version
+
+    def _commit(self, op):
+        """Ghi thao tác xuống backend rồi cập nhật bản ghi đang nằm trong cache.
+
+        Chờ dữ liệu xuống đĩa sau khi nhả khóa, để các lần ghi đồng thời gom chung một lần fsync.
+        """
+        with span('storage.write', op=op['op']), STORAGE_OPERATION_SECONDS.time(backend=self.name, op=op['op']):
+            with self._lock:
+                ticket = self._write(op)
+                if op['op'] != 'create_user':
+                    entry = self._cache.peek(op['user_id'])
+                    if entry is not None:
+                        entry.apply(op)
+                        entry.revision = next(self._revisions)
+            if ticket is not None:
+                self._wait_durable(ticket)
+
+    def _wait_durable(self, ticket):
+        """Chờ lần ghi ứng với vé đã bền vững trên đĩa (chỉ gọi khi _write trả về vé)."""
+        raise NotImplementedError
+
+    def _get_entry(self, user_id):
+        with self._lock:
+            self._validate_cache()
+            entry = self._cache.get(user_id)
+            if entry is None:
+                with span('storage.load_user'), STORAGE_OPERATION_SECONDS.time(backend=self.name, op='load_user'):
+                    user = self._load_user(user_id)
+                if user is None:
+                    return None
+                entry = _CachedUser(user, next(self._revisions))
+                self._cache.put(user_id, entry)
+            return entry
+
+    def get_user(self, user_id):
+        entry = self._get_entry(user_id)
+        return entry.data if entry else None
+
+    def consistent_read(self):
+        """Khóa dùng với `with` để đọc nhiều lần mà không bị lần ghi nào chen vào giữa."""
+        return self._lock
+
+    def get_revision(self, user_id):
+        """Số hiệu phiên bản dữ liệu của người dùng trong tiến trình này (None nếu không tồn tại)."""
+        entry = self._get_entry(user_id)
+        return entry.revision if entry else None
+
+    def get_food_log(self, user_id):
+        """Chỉ mục FoodLog theo ngày của người dùng (tạo một lần, cập nhật khi ghi)."""
+        with self._lock:
+            entry = self._get_entry(user_id)
+            return entry.food_index() if entry else None
+
+    def get_columns(self, user_id):
+        """food_log dạng cột NumPy (MealColumns), dựng lại sau mỗi lần ghi food_log."""
+        with self._lock:
+            entry = self._get_entry(user_id)
+            return entry.columns() if entry else None
+
+    def create_user(self, user):
+        with self._lock:
+            if self.get_user(user['username']) is not None:
+                return False
+            assign_meal_ids(user['username'], user.get('food_log', []))
+            self._commit({'op': 'create_user', 'user': user})
+            return True
+
+    def set_profile(self, user_id, profile):
+        self._commit({'op': 'set_profile', 'user_id': user_id, 'profile': profile})
+
+    def add_meals(self, user_id, entries):
+        entries = list(entries)
+        for entry in entries:
+            entry.setdefault('id', new_meal_id())
+        self._commit({'op': 'add_meals', 'user_id': user_id, 'entries': entries})
+
+    def delete_meal_ids(self, user_id, ids):
+        """Xóa các bữa ăn theo id trong một lần ghi, trả về danh sách id đã xóa."""
+        with self._lock:
+            food_index = self.get_food_log(user_id)
+            if food_index is None:
+                return []
+            found = [meal_id for meal_id in dict.fromkeys(ids) if food_index.get(meal_id) is not None]
+            if found:
+                self._commit({'op': 'delete_meal_ids', 'user_id': user_id, 'ids': found})
+            return found
+
+    def delete_meals(self, user_id, timestamps):
+        """Xóa các bữa ăn theo timestamp (API cũ), trả về số bữa đã xóa."""
+        with self._lock:
+            food_index = self.get_food_log(user_id)
+            if food_index is None:
+                return 0
+            return len(self.delete_meal_ids(user_id, [meal['id'] for meal in food_index.with_timestamps(timestamps)]))
+
+    def get_rollup(self, user_id):
+        """Tổng hợp calories theo ngày/cửa sổ 7-14-30 ngày của người dùng."""
+        food_index = self.get_food_log(user_id)
+        return food_index.rollup if food_index is not None else None
+
+    def rebuild_rollups(self, check_only=False):
+        """Tính lại rollup của mọi người dùng từ food_log gốc (một lần load_all), trả về {user_id: [ngày lệch]}.
+
+        So với rollup đang dùng: bản trong cache nếu có, không thì bản FoodLog dựng từ food_log như khi phục vụ
+        request. Sửa = bỏ bản cache bị lệch để lần đọc sau dựng lại.
+        """
+        drift = {}
+        with self._lock:
+            for user_id, user in self.load_all()['users'].items():
+                entry = self._cache.peek(user_id)
+                if entry is not None and entry._food_index is not None:
+                    actual = entry._food_index.rollup
+                else:
+                    actual = FoodLog(compact_food_log(user['food_log'])).rollup
+                expected = CalorieRollup.from_entries(user['food_log']).daily_totals()
+                user_drift = diff_rollups(expected, actual.daily_totals())
+                if user_drift:
+                    drift[user_id] = user_drift
+                    if not check_only:
+                        self._cache.pop(user_id)
+        return drift
+
+    def cache_stats(self):
+        return self._cache.stats()
+
+# --- BACKEND JSON: SNAPSHOT + JOURNAL ---
+
+class _Journal:
+    """Journal append-only dạng JSON lines, fsync gom theo lô (group commit).
+
+    append() chỉ ghi vào file và trả về số thứ tự; người gọi nhả khóa rồi mới wait(). Writer đầu tiên
+    fsync ngay cho mọi dòng đã ghi, writer đến trong lúc đó chờ và vào chung lần fsync kế tiếp.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._file = open(file_name, 'ab')
+        self._cond = threading.Condition()
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._syncing = False
+
+    def append(self, record, repair=False):
+        """Ghi một dòng (chưa fsync), trả về số thứ tự để truyền cho wait().
+
+        repair=True: xuống dòng trước để kết thúc dòng dở của một tiến trình bị kill giữa lúc ghi.
+        """
+        line = dumps(record) + b'\n'
+        if repair:
+            line = b'\n' + line
+        with self._cond:
+            self._file.write(line)
+            self._file.flush()
+            self._written_seq += 1
+            return self._written_seq
+
+    def wait(self, seq):
+        """Chờ tới khi dòng seq đã được fsync."""
+        with self._cond:
+            while self._synced_seq < seq:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written_seq
+                # fsync không giữ khóa: writer khác vẫn ghi tiếp vào file cho lô sau
+                self._cond.release()
+                try:
+                    os.fsync(self._file.fileno())
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._cond.notify_all()
+                self._synced_seq = max(self._synced_seq, target)
+
+    def size(self):
+        return os.fstat(self._file.fileno()).st_size
+
+    def truncate(self):
+        with self._cond:
+            # Cắt tại chỗ và giữ file ở chế độ append: tiến trình khác đang mở cùng journal vẫn ghi vào cuối file
+            self._file.flush()
+            os.ftruncate(self._file.fileno(), 0)
+            os.fsync(self._file.fileno())
+            self._synced_seq = self._written_seq
+
+    def close(self):
+        with self._cond:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced_seq = self._written_seq
+            self._file.close()
+
+class _FileLock:
+    """flock trên file <db>.lock để nhiều tiến trình (worker gunicorn) dùng chung db.json.
+
+    Luôn gọi khi đã giữ khóa thread của storage; gọi lồng nhau thì chỉ lớp ngoài cùng khóa file.
+    File khóa cũng chứa seq journal mới nhất (byte 0-19) để tiến trình khác không phải đọc lại cả journal,
+    và từ byte 32 là seq cùng dấu file của snapshot do lần gộp gần nhất ghi.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._fd = os.open(file_name, os.O_RDWR | os.O_CREAT, 0o644)
+        self._depth = 0
+        self._exclusive = False
+
+    @contextmanager
+    def _hold(self, exclusive):
+        if self._depth:
+            if exclusive and not self._exclusive:
+                raise RuntimeError("Không thể nâng khóa chia sẻ thành khóa ghi")
+        elif fcntl is not None:
+            with STORAGE_LOCK_WAIT_SECONDS.time(mode='exclusive' if exclusive else 'shared'):
+                fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        if not self._depth:
+            self._exclusive = exclusive
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if not self._depth and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def shared(self):
+        return self._hold(False)
+
+    def exclusive(self):
+        return self._hold(True)
+
+    def read_seq(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        data = os.read(self._fd, 20).strip()
+        return int(data) if data.isdigit() else 0
+
+    def write_seq(self, seq):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, f"{seq:020d}".encode('ascii'))
+
+    def read_snapshot(self):
+        """(journal_seq, dấu file) của snapshot gộp gần nhất, None nếu chưa có (file khóa cũ)."""
+        os.lseek(self._fd, 32, os.SEEK_SET)
+        fields = os.read(self._fd, 96).split()
+        if len(fields) != 4 or not all(field.isdigit() for field in fields):
+            return None
+        seq, *stamp = map(int, fields)
+        return seq, tuple(stamp)
+
+    def write_snapshot(self, seq, stamp):
+        os.lseek(self._fd, 32, os.SEEK_SET)
+        fields = [seq, *stamp] if stamp is not None else [seq]
+        os.write(self._fd, ' '.join(map(str, fields)).ljust(96).encode('ascii'))
+
+    def close(self):
+        os.close(self._fd)
+
+def _file_stamp(path):
+    """(inode, mtime, kích thước) của file, None nếu chưa có; os.replace luôn đổi inode."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+def _copy_user(user):
+    """Bản sao đủ sâu để áp dụng thao tác ghi (apply_op) mà không đụng tới bản gốc; bữa ăn dùng chung."""
+    copy = dict(user, food_log=list(user['food_log']))
+    if copy.get('sync') is not None:
+        copy['sync'] = dict(copy['sync'], changes=list(copy['sync']['changes']))
+    return copy
+
+def _plain_user(user):
+    """Bản sao với bữa ăn dạng dict (cho load_all: người gọi được sửa tùy ý)."""
+    copy = _copy_user(user)
+    copy['food_log'] = [meal.to_dict() if hasattr(meal, 'to_dict') else dict(meal) for meal in copy['food_log']]
+    return copy
+
+class JsonStorage(CachedStorage):
+    """Snapshot db.json + journal db.json.journal; ghi O(1), gộp snapshot chạy nền.
+
+    Mỗi tiến trình giữ snapshot đã parse cộng phần journal đã replay (bữa ăn dạng gọn); mỗi lần đọc chỉ đọc
+    tiếp phần journal mới và bỏ khỏi cache đúng những người dùng bị tiến trình khác sửa. Snapshot chỉ được
+    parse lại khi tiến trình khác gộp journal mà tiến trình này chưa replay hết (hoặc save_all).
+
+    Nhiều tiến trình dùng chung được: ghi/gộp giữ khóa file độc quyền, đọc giữ khóa chia sẻ.
+    Chu kỳ đọc-sửa-ghi cả cơ sở dữ liệu (load_all rồi save_all) thì bọc trong exclusive().
+    """
+
+    name = 'json'
+
+    def __init__(self, file_name=DB_FILE, cache_size=USER_CACHE_SIZE, snapshot_format=SNAPSHOT_FORMAT):
+        super().__init__(cache_size)
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"SNAPSHOT_FORMAT không hợp lệ: {snapshot_format}")
+        if snapshot_format == 'msgpack' and msgpack_backend is None:
+            raise RuntimeError("SNAPSHOT_FORMAT=msgpack cần cài gói msgpack hoặc msgspec")
+        self.file_name = file_name
+        self.snapshot_format = snapshot_format
+        self.journal_file = file_name + '.journal'
+        # Bản trong bộ nhớ: users tới seq _applied_seq, seq thao tác cuối của từng người dùng,
+        # dấu file của snapshot đã đọc và vị trí đã đọc tới trong journal
+        self._users = None
+        self._user_seqs = {}
+        self._applied_seq = 0
+        self._snapshot_stamp = None
+        self._journal_pos = 0
+        self._file_lock = _FileLock(file_name + '.lock')
+        with self._file_lock.exclusive():
+            remove_stale_temp_files(file_name)
+            self._sync()
+            self._seq = max(self._applied_seq, self._file_lock.read_seq())
+            self._file_lock.write_seq(self._seq)
+        self._journal = _Journal(self.journal_file)
+        self._ops_since_compact = 0
+        self._compact_event = threading.Event()
+        self._compactor = None
+        self._closed = False
+
+    # --- Đồng bộ bản trong bộ nhớ với snapshot + journal ---
+
+    def _sync(self):
+        """Đưa bản trong bộ nhớ lên mới nhất; phải giữ khóa file (chia sẻ hoặc độc quyền)."""
+        stamp = _file_stamp(self.file_name)
+        if self._users is None or stamp != self._snapshot_stamp:
+            known = self._file_lock.read_snapshot()
+            if (self._users is not None and known is not None and known[1] == stamp
+                    and known[0] <= self._applied_seq):
+                # Tiến trình khác vừa gộp đúng phần journal mình đã replay: nội dung như cũ, chỉ đọc journal mới
+                self._snapshot_stamp = stamp
+                self._journal_pos = 0
+            else:
+                self._reload(stamp)
+        self._replay_journal()
+
+    def _reload(self, stamp):
+        """Parse lại snapshot; người dùng trong cache có seq khác với snapshot mới thì bị bỏ."""
+        db = load_data(self.file_name, {"users": {}})
+        users = db['users']
+        for username, user in users.items():
+            assign_meal_ids(username, user['food_log'])
+            user['food_log'] = compact_food_log(user['food_log'])
+        user_seqs = db.get('user_seqs')
+        if self._users is None or user_seqs is None:
+            self._cache.clear()
+        else:
+            for user_id in self._cache.keys():
+                if user_seqs.get(user_id, 0) != self._user_seqs.get(user_id, 0):
+                    self._cache.pop(user_id)
+        self._users = users
+        self._user_seqs = dict(user_seqs or {})
+        self._applied_seq = db.get('journal_seq', 0)
+        self._snapshot_stamp = stamp
+        self._journal_pos = 0
+
+    def _replay_journal(self):
+        """Áp dụng các dòng journal mới (của tiến trình khác) và bỏ người dùng liên quan khỏi cache."""
+        try:
+            f = open(self.journal_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size < self._journal_pos:
+                # Journal bị cắt mà snapshot không đổi (sửa ngoài ứng dụng): đọc lại từ đầu
+                self._reload(self._snapshot_stamp)
+            f.seek(self._journal_pos)
+            data = f.read()
+        # Chỉ đọc các dòng đã trọn; phần dở ở cuối (tiến trình ghi bị kill) để lần sau
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = loads(line)
+            except json.JSONDecodeError:
+                log.warning("⚠️ Bỏ qua dòng journal hỏng", file=self.journal_file)
+                continue
+            if record['seq'] > self._applied_seq:
+                self._cache.pop(self._apply(record))
+        self._journal_pos += end
+
+    def _apply(self, record):
+        """Áp dụng một dòng journal lên bản trong bộ nhớ, trả về user_id bị ảnh hưởng."""
+        if record['op'] == 'create_user':
+            user = _copy_user(record['user'])
+            user['food_log'] = compact_food_log(user['food_log'])
+            record = dict(record, user=user)
+            user_id = user['username']
+        else:
+            if record['op'] == 'add_meals':
+                record = dict(record, entries=compact_food_log(record['entries']))
+            user_id = record['user_id']
+        apply_op(self._users, record)
+        self._user_seqs[user_id] = record['seq']
+        self._applied_seq = max(self._applied_seq, record['seq'])
+        return user_id
+
+    def _next_seq(self):
+        """Seq kế tiếp; phải giữ khóa ghi (tiến trình khác có thể vừa ghi journal)."""
+        self._seq = max(self._seq, self._file_lock.read_seq()) + 1
+        self._file_lock.write_seq(self._seq)
+        return self._seq
+
+    def _validate_cache(self):
+        # Snapshot như cũ và journal không dài thêm: không có gì mới, khỏi lấy khóa file
+        if (self._users is not None and _file_stamp(self.file_name) == self._snapshot_stamp
+                and _file_size(self.journal_file) == self._journal_pos):
+            return
+        with self._file_lock.shared():
+            self._sync()
+
+    def _load_user(self, user_id):
+        user = self._users.get(user_id)
+        return _copy_user(user) if user is not None else None
+
+    def _write(self, op):
+        with self._file_lock.exclusive():
+            self._sync()
+            record = dict(op, seq=self._next_seq())
+            # Sau _sync mà journal còn dài hơn vị trí đã đọc: dòng cuối bị ghi dở, kết thúc nó trước
+            ticket = self._journal.append(record, repair=self._journal.size() != self._journal_pos)
+            self._journal_pos = self._journal.size()
+            self._apply(record)
+        self._ops_since_compact += 1
+        self._schedule_compaction()
+        return ticket
+
+    def _wait_durable(self, ticket):
+        self._journal.wait(ticket)
+
+    # --- Gộp journal vào snapshot ---
+
+    def _schedule_compaction(self):
+        if self._compactor is None:
+            self._compactor = threading.Thread(target=self._compact_loop, name='journal-compact', daemon=True)
+            self._compactor.start()
+        if self._ops_since_compact >= JOURNAL_COMPACT_OPS:
+            self._compact_event.set()
+
+    def _compact_loop(self):
+        while not self._closed:
+            self._compact_event.wait(JOURNAL_COMPACT_INTERVAL)
+            self._compact_event.clear()
+            if self._ops_since_compact and not self._closed:
+                try:
+                    self.compact()
+                except Exception as e:
+                    log.error("❌ Lỗi gộp journal", error=e)
+
+    def _save_snapshot(self, users, user_seqs):
+        """Ghi snapshot tại seq hiện tại (kèm seq của từng người dùng) rồi làm rỗng journal; phải giữ khóa ghi."""
+        save_data(self.file_name, {"users": users, "journal_seq": self._seq, "user_seqs": user_seqs},
+                  self.snapshot_format)
+        self._journal.truncate()
+        self._ops_since_compact = 0
+        self._applied_seq = self._seq
+        self._snapshot_stamp = _file_stamp(self.file_name)
+        self._journal_pos = 0
+        # Tiến trình khác so dấu file này để biết snapshot mới có phải chỉ là journal đã gộp hay không
+        self._file_lock.write_snapshot(self._seq, self._snapshot_stamp)
+
+    @_timed('compact')
+    def compact(self):
+        """Ghi snapshot mới (kèm journal_seq) rồi làm rỗng journal."""
+        with self._lock, self._file_lock.exclusive():
+            self._sync()
+            self._seq = max(self._seq, self._file_lock.read_seq())
+            self._save_snapshot(self._users, self._user_seqs)
+
+    # --- API chung ---
+
+    @contextmanager
+    def exclusive(self):
+        """Giữ khóa ghi (thread và file) suốt một chu kỳ load_all() -> sửa -> save_all(): tiến trình khác
+        không ghi xen vào giữa được, nên save_all không ghi đè mất các thay đổi đó."""
+        with self._lock, self._file_lock.exclusive():
+            yield self
+
+    @_timed('load_all')
+    def load_all(self):
+        with self._lock, self._file_lock.shared():
+            self._sync()
+            return {"users": {username: _plain_user(user) for username, user in self._users.items()}}
+
+    @_timed('save_all')
+    def save_all(self, db):
+        with self._lock, self._file_lock.exclusive():
+            for username, user in db['users'].items():
+                assign_meal_ids(username, user.get('food_log', []))
+            # Mọi người dùng nhận seq mới: tiến trình khác bỏ hết bản cache cũ
+            seq = self._next_seq()
+            self._save_snapshot(db['users'], dict.fromkeys(db['users'], seq))
+            # Không giữ tham chiếu tới dict của người gọi: lần đọc sau parse lại snapshot vừa ghi
+            self._users = None
+            self._cache.clear()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            if self._ops_since_compact:
+                self.compact()
+            self._closed = True
+            self._compact_event.set()
+            self._journal.close()
+            self._file_lock.close()
+
+# --- BACKEND SQLITE (WAL) ---
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY REFERENCES users(username) ON DELETE CASCADE,
+    name TEXT,
+    gender TEXT,
+    age INTEGER,
+    height_cm REAL,
+    weight_kg REAL,
+    activity_level TEXT,
+    goal TEXT,
+    tdee INTEGER,
+    target_calories INTEGER
+);
+CREATE TABLE IF NOT EXISTS food_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL,
+    meal_name TEXT,
+    calories INTEGER,
+    description TEXT,
+    nutrition_analysis TEXT,
+    meal_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_food_log_user_date ON food_log(user_id, date);
+CREATE INDEX IF NOT EXISTS idx_food_log_user_timestamp ON food_log(user_id, timestamp);
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    calories INTEGER NOT NULL,
+    meals INTEGER NOT NULL,
+    PRIMARY KEY (user_id, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id TEXT PRIMARY KEY REFERENCES users(username) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    horizon INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL REFERENCES users(username) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    meal_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sync_changes_user ON sync_changes(user_id, id);
+"""
+
+SQLITE_ROLLUP_QUERY = """
+SELECT user_id, date, SUM(COALESCE(calories, 0)) AS calories, COUNT(*) AS meals
+FROM food_log GROUP BY user_id, date
+"""
+
+class SQLiteStorage(CachedStorage):
+    """Lưu dữ liệu trong SQLite ở chế độ WAL: mỗi thao tác ghi chỉ chạm vài dòng."""
+
+    name = 'sqlite'
+
+    def __init__(self, file_name=SQLITE_FILE, cache_size=USER_CACHE_SIZE):
+        super().__init__(cache_size)
+        self.file_name = file_name
+        # Mỗi thread dùng một connection riêng (sqlite3 không chia sẻ connection giữa thread)
+        self._local = threading.local()
+        # executescript tự COMMIT nên không chạy trong _Transaction
+        conn = self._connect()
+        conn.executescript(SQLITE_SCHEMA)
+        self._migrate_schema(conn)
+        # DB tạo trước khi có bảng daily_rollup: dựng lại một lần
+        if (conn.execute("SELECT 1 FROM food_log LIMIT 1").fetchone()
+                and not conn.execute("SELECT 1 FROM daily_rollup LIMIT 1").fetchone()):
+            self.rebuild_rollups()
+
+    def _migrate_schema(self, conn):
+        """Nâng cấp DB tạo bởi phiên bản cũ: thêm cột meal_id và gán id cho các bữa ăn chưa có."""
+        if 'meal_id' not in {row['name'] for row in conn.execute("PRAGMA table_info(food_log)")}:
+            conn.execute("ALTER TABLE food_log ADD COLUMN meal_id TEXT")
+        with self._transaction() as tx:
+            rows = tx.execute("SELECT id, user_id, timestamp FROM food_log WHERE meal_id IS NULL").fetchall()
+            tx.executemany("UPDATE food_log SET meal_id = ? WHERE id = ?",
+                           [(legacy_meal_id(f"{row['user_id']}:{row['id']}:{row['timestamp']}", row['timestamp']),
+                             row['id']) for row in rows])
+            # Nhật ký đồng bộ cũ ghi timestamp thay vì id: bỏ đi, client sẽ tải lại từ đầu (reset)
+            if 'timestamp' in {row['name'] for row in tx.execute("PRAGMA table_info(sync_changes)")}:
+                tx.execute("DELETE FROM sync_changes")
+                tx.execute("ALTER TABLE sync_changes RENAME COLUMN timestamp TO meal_id")
+                tx.execute("UPDATE sync_state SET horizon = version")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_food_log_meal_id ON food_log(user_id, meal_id)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.file_name, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    # --- Chuyển đổi dòng <-> dict ---
+
+    @staticmethod
+    def _meal_from_row(row):
+        meal = {'id': row['meal_id']}
+        meal.update((field, row[field]) for field in MEAL_FIELDS)
+        if meal['nutrition_analysis'] is None:
+            del meal['nutrition_analysis']
+        return meal
+
+    @staticmethod
+    def _profile_from_row(row):
+        return {field: row[field] for field in PROFILE_FIELDS} if row else None
+
+    @staticmethod
+    def _insert_meals(conn, user_id, entries):
+        conn.executemany(
+            "INSERT INTO food_log (user_id, meal_id, timestamp, date, meal_name, calories, description, "
+            "nutrition_analysis) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(user_id, entry['id'], *(entry.get(field) for field in MEAL_FIELDS)) for entry in entries]
+        )
+        SQLiteStorage._update_rollup(conn, user_id, [(entry['date'], entry.get('calories') or 0, 1)
+                                                     for entry in entries])
+
+    @staticmethod
+    def _update_rollup(conn, user_id, deltas):
+        """Cộng dồn (date, calories, meals) vào daily_rollup trong cùng transaction."""
+        conn.executemany(
+            "INSERT INTO daily_rollup (user_id, date, calories, meals) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id, date) DO UPDATE SET "
+            "calories = calories + excluded.calories, meals = meals + excluded.meals",
+            [(user_id, date, calories, meals) for date, calories, meals in deltas]
+        )
+        conn.execute("DELETE FROM daily_rollup WHERE user_id = ? AND meals <= 0", (user_id,))
+
+    @staticmethod
+    def _upsert_profile(conn, user_id, profile):
+        if profile is None:
+            conn.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+            return
+        conn.execute(
+            f"INSERT OR REPLACE INTO profiles (user_id, {', '.join(PROFILE_FIELDS)}) "
+            f"VALUES (?{', ?' * len(PROFILE_FIELDS)})",
+            (user_id, *(profile.get(field) for field in PROFILE_FIELDS))
+        )
+
+    @staticmethod
+    def _record_sync(conn, user_id, kind, ids):
+        """Ghi nhật ký thay đổi cho delta sync trong cùng transaction (cùng quy tắc với record_changes)."""
+        row = conn.execute("SELECT version, horizon FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+        version, horizon = (row['version'] + 1, row['horizon']) if row else (1, 0)
+        conn.executemany("INSERT INTO sync_changes (user_id, version, kind, meal_id) VALUES (?, ?, ?, ?)",
+                         [(user_id, version, kind, meal_id) for meal_id in ids])
+        count = conn.execute("SELECT COUNT(*) FROM sync_changes WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if count > SYNC_CHANGES_LIMIT:
+            cutoff = conn.execute("SELECT id, version FROM sync_changes WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?",
+                                  (user_id, count - SYNC_CHANGES_LIMIT - 1)).fetchone()
+            conn.execute("DELETE FROM sync_changes WHERE user_id = ? AND id <= ?", (user_id, cutoff['id']))
+            horizon = max(horizon, cutoff['version'])
+        conn.execute("INSERT OR REPLACE INTO sync_state (user_id, version, horizon) VALUES (?, ?, ?)",
+                     (user_id, version, horizon))
+
+    @staticmethod
+    def _save_sync(conn, user_id, sync):
+        if not sync:
+            return
+        conn.execute("INSERT OR REPLACE INTO sync_state (user_id, version, horizon) VALUES (?, ?, ?)",
+                     (user_id, sync['version'], sync['horizon']))
+        conn.executemany("INSERT INTO sync_changes (user_id, version, kind, meal_id) VALUES (?, ?, ?, ?)",
+                         [(user_id, *change) for change in sync['changes']])
+
+    @staticmethod
+    def _load_sync(conn, user_id):
+        row = conn.execute("SELECT version, horizon FROM sync_state WHERE user_id = ?", (user_id,)).fetchone()
+        sync = new_sync_state()
+        if row is not None:
+            sync['version'], sync['horizon'] = row['version'], row['horizon']
+            sync['changes'] = [[r['version'], r['kind'], r['meal_id']] for r in conn.execute(
+                "SELECT version, kind, meal_id FROM sync_changes WHERE user_id = ? ORDER BY id", (user_id,))]
+        return sync
+
+    @staticmethod
+    def _bump_version(conn):
+        before = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (before + 1,))
+        return before, before + 1
+
+    # --- Hook cho CachedStorage ---
+
+    def _version(self):
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _load_user(self, user_id):
+        conn = self._connect()
+        row = conn.execute("SELECT username, password_hash FROM users WHERE username = ?",
+                           (user_id,)).fetchone()
+        if row is None:
+            return None
+        user = new_user_record(row['username'], row['password_hash'])
+        profile_row = conn.execute("SELECT * FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+        user['profile'] = self._profile_from_row(profile_row)
+        user['food_log'] = [self._meal_from_row(r) for r in conn.execute(
+            "SELECT * FROM food_log WHERE user_id = ? ORDER BY id", (user_id,))]
+        user['sync'] = self._load_sync(conn, user_id)
+        return user
+
+    def _write(self, op):
+        kind = op['op']
+        with self._transaction() as conn:
+            if kind == 'create_user':
+                user = op['user']
+                conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                             (user['username'], user['password_hash']))
+                self._upsert_profile(conn, user['username'], user.get('profile'))
+                self._insert_meals(conn, user['username'], user.get('food_log', []))
+            elif kind == 'set_profile':
+                self._upsert_profile(conn, op['user_id'], op['profile'])
+            elif kind == 'add_meals':
+                self._insert_meals(conn, op['user_id'], op['entries'])
+                self._record_sync(conn, op['user_id'], 'add', [entry['id'] for entry in op['entries']])
+            elif kind == 'delete_meal_ids':
+                params = [(op['user_id'], meal_id) for meal_id in op['ids']]
+                deltas = []
+                for param in params:
+                    deltas.extend((row['date'], -(row['calories'] or 0), -1) for row in conn.execute(
+                        "SELECT date, calories FROM food_log WHERE user_id = ? AND meal_id = ?", param))
+                conn.executemany("DELETE FROM food_log WHERE user_id = ? AND meal_id = ?", params)
+                self._update_rollup(conn, op['user_id'], deltas)
+                self._record_sync(conn, op['user_id'], 'delete', op['ids'])
+            before, after = self._bump_version(conn)
+        # Tiến trình khác đã ghi từ lần kiểm tra trước: bỏ toàn bộ cache
+        if before != self._seen_version:
+            self._cache.clear()
+        self._seen_version = after
+        # COMMIT khi _Transaction thoát đã bền vững: không có vé chờ
+        return None
+
+    # --- API chung ---
+
+    @_timed('get_rollup')
+    def get_rollup(self, user_id):
+        """Rollup dựng từ bảng daily_rollup (một lần quét theo khóa chính), không cần nạp cả food_log."""
+        conn = self._connect()
+        rows = conn.execute("SELECT date, calories, meals FROM daily_rollup WHERE user_id = ?", (user_id,)).fetchall()
+        if not rows and conn.execute("SELECT 1 FROM users WHERE username = ?", (user_id,)).fetchone() is None:
+            return None
+        rollup = CalorieRollup()
+        for row in rows:
+            rollup.add(row['date'], row['calories'], row['meals'])
+        return rollup
+
+    @_timed('load_all')
+    def load_all(self):
+        conn = self._connect()
+        users = {}
+        for row in conn.execute("SELECT username, password_hash FROM users"):
+            users[row['username']] = new_user_record(row['username'], row['password_hash'])
+        for row in conn.execute("SELECT * FROM profiles"):
+            if row['user_id'] in users:
+                users[row['user_id']]['profile'] = self._profile_from_row(row)
+        for row in conn.execute("SELECT * FROM food_log ORDER BY id"):
+            if row['user_id'] in users:
+                users[row['user_id']]['food_log'].append(self._meal_from_row(row))
+        for user_id, user in users.items():
+            user['sync'] = self._load_sync(conn, user_id)
+        return {"users": users}
+
+    @_timed('save_all')
+    def save_all(self, db):
+        """Ghi đè toàn bộ dữ liệu (dùng cho migrate và tương thích save_db)."""
+        with self._lock:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM daily_rollup")
+                conn.execute("DELETE FROM sync_changes")
+                conn.execute("DELETE FROM sync_state")
+                conn.execute("DELETE FROM food_log")
+                conn.execute("DELETE FROM profiles")
+                conn.execute("DELETE FROM users")
+                for username, user in db['users'].items():
+                    assign_meal_ids(username, user.get('food_log', []))
+                    conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                                 (username, user['password_hash']))
+                    self._upsert_profile(conn, username, user.get('profile'))
+                    self._insert_meals(conn, username, user.get('food_log', []))
+                    self._save_sync(conn, username, user.get('sync'))
+                self._bump_version(conn)
+            self._cache.clear()
+
+    def rebuild_rollups(self, check_only=False):
+        """Tính lại bảng daily_rollup (nguồn của get_rollup) và rollup trong cache từ food_log,
+        trả về {user_id: [ngày lệch]}."""
+        drift = super().rebuild_rollups(check_only)
+        with self._lock:
+            with self._transaction() as conn:
+                expected, actual = {}, {}
+                for row in conn.execute(SQLITE_ROLLUP_QUERY):
+                    expected.setdefault(row['user_id'], {})[row['date']] = (row['calories'], row['meals'])
+                for row in conn.execute("SELECT * FROM daily_rollup"):
+                    actual.setdefault(row['user_id'], {})[row['date']] = (row['calories'], row['meals'])
+                for user_id in set(expected) | set(actual):
+                    user_drift = diff_rollups(expected.get(user_id, {}), actual.get(user_id, {}))
+                    if user_drift:
+                        drift[user_id] = drift.get(user_id, []) + user_drift
+                if drift and not check_only:
+                    conn.execute("DELETE FROM daily_rollup")
+                    conn.execute(f"INSERT INTO daily_rollup (user_id, date, calories, meals) {SQLITE_ROLLUP_QUERY}")
+        return drift
+
+    def create_user(self, user):
+        try:
+            return super().create_user(user)
+        except sqlite3.IntegrityError:
+            # Tiến trình khác vừa tạo cùng username
+            return False
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class _Transaction:
+    """Context manager BEGIN IMMEDIATE ... COMMIT/ROLLBACK: khóa ghi ngay từ đầu để các writer xếp hàng."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+# --- KHỞI TẠO & MIGRATE ---
+
+def migrate_json_to_sqlite(json_file=DB_FILE, sqlite_file=SQLITE_FILE):
+    """Chuyển toàn bộ dữ liệu từ db.json sang SQLite (chỉ chạy khi SQLite còn trống)."""
+    source = JsonStorage(json_file)
+    target = SQLiteStorage(sqlite_file)
+    try:
+        db = source.load_all()
+        existing = target._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        if existing:
+            print(f"⚠️ {sqlite_file} đã có {existing} người dùng, bỏ qua migrate.")
+            return 0, 0
+        target.save_all(db)
+        meals = sum(len(user.get('food_log', [])) for user in db['users'].values())
+        print(f"✅ Đã migrate {len(db['users'])} người dùng, {meals} bữa ăn từ {json_file} sang {sqlite_file}")
+        return len(db['users']), meals
+    finally:
+        source.close()
+        target.close()
+
+def create_storage(backend=None):
+    """Tạo backend lưu trữ theo cấu hình STORAGE_BACKEND."""
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == 'sqlite':
+        # Migrate một lần: lần đầu chạy với SQLite mà db.json cũ vẫn còn
+        if not os.path.exists(SQLITE_FILE) and os.path.exists(DB_FILE):
+            migrate_json_to_sqlite(DB_FILE, SQLITE_FILE)
+        storage = SQLiteStorage(SQLITE_FILE)
+    elif backend == 'json':
+        storage = JsonStorage(DB_FILE)
+    else:
+        raise ValueError(f"STORAGE_BACKEND không hợp lệ: {backend}")
+    # Gộp journal / đóng kết nối khi tiến trình thoát
+    atexit.register(storage.close)
+    return storage
+
+def main():
+    parser = argparse.ArgumentParser(description="Công cụ quản lý dữ liệu AI Food Advisor")
+    sub = parser.add_subparsers(dest='command', required=True)
+    migrate = sub.add_parser('migrate', help="Chuyển db.json sang SQLite")
+    migrate.add_argument('--json', default=DB_FILE)
+    migrate.add_argument('--sqlite', default=SQLITE_FILE)
+    compact = sub.add_parser('compact', help="Gộp db.json.journal vào db.json")
+    compact.add_argument('--json', default=DB_FILE)
+    rebuild = sub.add_parser('rebuild-rollups', help="Tính lại tổng calories theo ngày và báo lệch")
+    rebuild.add_argument('--check', action='store_true', help="Chỉ kiểm tra, không sửa")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        migrate_json_to_sqlite(args.json, args.sqlite)
+    elif args.command == 'compact':
+        storage = JsonStorage(args.json)
+        storage.compact()
+        storage.close()
+        print(f"✅ Đã gộp journal vào {args.json}")
+    elif args.command == 'rebuild-rollups':
+        storage = create_storage()
+        drift = storage.rebuild_rollups(check_only=args.check)
+        for user_id, days in drift.items():
+            for day in days:
+                print(f"⚠️ {user_id} {day['date']}: mong đợi {day['expected']}, đang lưu {day['actual']}")
+        action = "phát hiện" if args.check else "đã sửa"
+        print(f"✅ Rollup: {action} {sum(len(days) for days in drift.values())} ngày lệch ở {len(drift)} người dùng")
+
+if __name__ == '__main__':
+    main()
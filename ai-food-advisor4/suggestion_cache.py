@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import threading
+from cache import LRUCache
+from logs import get_logger
+
+log = get_logger('suggestion_cache')
+
+# --- CACHE GỢI Ý THỰC ĐƠN ---
+SUGGESTION_CACHE_SIZE = int(os.environ.get('SUGGESTION_CACHE_SIZE', '256'))
+# Còn "tươi" trong TTL; sau đó vẫn trả bản cũ thêm STALE_TTL giây trong lúc làm mới chạy nền
+SUGGESTION_CACHE_TTL = float(os.environ.get('SUGGESTION_CACHE_TTL', '1800'))
+SUGGESTION_STALE_TTL = float(os.environ.get('SUGGESTION_STALE_TTL', str(6 * 3600)))
+# Làm tròn calories còn lại theo bước này để nhiều người dùng chung một mục cache
+SUGGESTION_BUCKET_KCAL = int(os.environ.get('SUGGESTION_BUCKET_KCAL', '100'))
+
+def remaining_calorie_bucket(remaining_calories, bucket_size=SUGGESTION_BUCKET_KCAL):
+    """Lượng tử hóa calories còn lại (ví dụ 437 -> 400 với bước 100)."""
+    return int(round(remaining_calories / bucket_size) * bucket_size)
+
+class SuggestionCache:
+    """Cache LRU + TTL với stale-while-revalidate cho kết quả gợi ý thực đơn."""
+
+    def __init__(self, maxsize=SUGGESTION_CACHE_SIZE, ttl=SUGGESTION_CACHE_TTL, stale_ttl=SUGGESTION_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = LRUCache(maxsize)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        # Tự đếm theo TTL (không dùng bộ đếm của LRUCache): mục đã hết hạn không phải lần trúng cache
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def _lookup(self, key):
+        """(giá trị, 'fresh' | 'stale') nếu còn dùng được, ngược lại (None, None)."""
+        entry = self._entries.peek(key)
+        if entry is not None:
+            value, created_at = entry
+            age = time.monotonic() - created_at
+            if age < self.ttl + self.stale_ttl:
+                self._entries.touch(key)
+                with self._lock:
+                    if age < self.ttl:
+                        self.hits += 1
+                        return value, 'fresh'
+                    self.stale_hits += 1
+                    return value, 'stale'
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def get_or_compute(self, key, compute):
+        """Trả về giá trị cache; hết hạn thì gọi compute() (đồng bộ hoặc chạy nền nếu còn bản cũ)."""
+        value, state = self._lookup(key)
+        if state == 'stale':
+            self._refresh_in_background(key, compute)
+        if state is not None:
+            return value
+        value = compute()
+        self._entries.put(key, (value, time.monotonic()))
+        return value
+
+    async def get_or_compute_async(self, key, compute):
+        """Như get_or_compute nhưng compute là coroutine function; bản cũ được làm mới bằng task nền."""
+        value, state = self._lookup(key)
+        if state == 'stale' and self._start_refresh(key):
+            asyncio.ensure_future(self._refresh_async(key, compute))
+        if state is not None:
+            return value
+        value = await compute()
+        self._entries.put(key, (value, time.monotonic()))
+        return value
+
+    async def _refresh_async(self, key, compute):
+        try:
+            self._entries.put(key, (await compute(), time.monotonic()))
+            self.refreshes += 1
+        except Exception as e:
+            log.warning("⚠️ Làm mới gợi ý thực đơn lỗi, giữ bản cũ", key=key, error=e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _start_refresh(self, key):
+        """True nếu chưa có lần làm mới nào cho key đang chạy (và đánh dấu đang chạy)."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh_in_background(self, key, compute):
+        if not self._start_refresh(key):
+            return
+
+        def refresh():
+            try:
+                self._entries.put(key, (compute(), time.monotonic()))
+                self.refreshes += 1
+            except Exception as e:
+                log.warning("⚠️ Làm mới gợi ý thực đơn lỗi, giữ bản cũ", key=key, error=e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='suggestion-refresh', daemon=True).start()
+
+    def stats(self):
+        """hits chỉ gồm mục còn tươi; stale_hits là bản hết hạn trả về trong lúc làm mới; còn lại là misses."""
+        stats = self._entries.stats()
+        total = self.hits + self.stale_hits + self.misses
+        stats.update({'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                      'hit_rate': round(self.hits / total, 4) if total else 0.0, 'refreshes': self.refreshes})
+        return stats
@@ -0,0 +1,74 @@
+"""Cấu hình chung cho test: fake Gemini chạy trong tiến trình, app dùng thư mục dữ liệu tạm.
+
+Biến môi trường phải đặt trước khi import app (app đọc cấu hình lúc import), nên phần này chạy ngay khi
+pytest nạp conftest. Chạy từ thư mục ai-food-advisor4:
+    python -m pytest -q tests
+"""
+import os
+import sys
+import uuid
+import asyncio
+import tempfile
+import threading
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+import fake_gemini
+
+def _start_fake_gemini():
+    """FakeGemini trên event loop riêng ở thread nền; trả về (fake, cổng)."""
+    fake = fake_gemini.FakeGemini(latency='0', seed=0)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    ports = []
+
+    async def serve():
+        server = await asyncio.start_server(fake.handle, '127.0.0.1', 0)
+        ports.append(server.sockets[0].getsockname()[1])
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), name='fake-gemini', daemon=True).start()
+    started.wait(10)
+    return fake, ports[0]
+
+FAKE, FAKE_PORT = _start_fake_gemini()
+DATA_DIR = tempfile.mkdtemp(prefix='food-advisor-test-')
+os.environ.update({
+    'GEMINI_API_KEY': 'fake',
+    'GEMINI_BASE_URL': f'http://127.0.0.1:{FAKE_PORT}',
+    'GEMINI_RATE_PER_SEC': '1000',
+    'GEMINI_RATE_BURST': '1000',
+    'STORAGE_BACKEND': 'json',
+    'DB_FILE': os.path.join(DATA_DIR, 'db.json'),
+    'SHARED_STORE': 'none',
+    'VISION_CACHE_ENABLED': '0',
+    'IMAGE_POOL_WORKERS': '0',
+})
+
+@pytest.fixture
+def fake():
+    """Fake Gemini dùng chung; tỉ lệ lỗi/phản hồi hỏng được trả về 0 sau mỗi test."""
+    yield FAKE
+    FAKE.error_rate = FAKE.malformed_rate = FAKE.fenced_rate = 0.0
+
+@pytest.fixture
+def app_module(monkeypatch):
+    """Module app với circuit breaker mới, để lỗi của test trước không làm mở breaker."""
+    import app
+    from gemini_client import CircuitBreaker
+    monkeypatch.setattr(app.gemini, 'breaker', CircuitBreaker())
+    return app
+
+@pytest.fixture
+def username():
+    return f'user-{uuid.uuid4().hex[:8]}'
+
+@pytest.fixture
+def profile():
+    return {'name': 'An', 'gender': 'nam', 'age': 30, 'height_cm': 170, 'weight_kg': 65,
+            'activity_level': 'ít', 'goal': 'giảm cân'}
@@ -0,0 +1,30 @@
+"""Route quản trị và số liệu: chỉ trả lời khi có X-Admin-Token khớp ADMIN_TOKEN (hoặc Bearer METRICS_TOKEN
+cho route số liệu); còn lại 404 như route không tồn tại."""
+import pytest
+
+METRICS_ROUTES = ['/api/jobs/metrics', '/api/images/metrics', '/api/gemini/metrics', '/api/suggestions/cache',
+                  '/metrics']
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'admin-secret')
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', 'scrape-secret')
+    return app_module.app.test_client()
+
+@pytest.mark.parametrize('path', METRICS_ROUTES)
+def test_metrics_require_token(client, path):
+    assert client.get(path).status_code == 404
+    assert client.get(path, headers={'X-Admin-Token': 'sai'}).status_code == 404
+    assert client.get(path, headers={'Authorization': 'Bearer admin-secret'}).status_code == 404
+    assert client.get(path, headers={'X-Admin-Token': 'admin-secret'}).status_code == 200
+    assert client.get(path, headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+def test_metrics_token_does_not_open_admin_routes(client):
+    assert client.get('/api/admin/profile', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 404
+    assert client.get('/api/admin/profile', headers={'X-Admin-Token': 'admin-secret'}).status_code == 200
+
+def test_unconfigured_tokens_hide_routes(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', None)
+    monkeypatch.setattr(app_module, 'METRICS_TOKEN', None)
+    assert client.get('/metrics', headers={'X-Admin-Token': ''}).status_code == 404
+    assert client.get('/metrics', headers={'Authorization': 'Bearer '}).status_code == 404
@@ -0,0 +1,222 @@
+"""Đường ASGI (asgi.py) với fake Gemini: log_meal và suggest_menu khi thành công, phản hồi bọc ```json,
+phản hồi hỏng, lỗi API có retry và khi circuit breaker mở."""
+import io
+import asyncio
+import httpx
+import pytest
+from PIL import Image
+
+MODEL_NOTE = 'Dữ liệu từ server giả lập'
+MODEL_ADVICE = 'Ăn nhiều rau xanh, uống đủ nước'
+
+@pytest.fixture(scope='module')
+def loop():
+    # Một event loop cho cả module: client.aio của Gemini giữ kết nối gắn với loop đã tạo ra nó
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+@pytest.fixture
+def asgi(app_module, monkeypatch):
+    import asgi
+    from suggestion_cache import SuggestionCache
+    monkeypatch.setattr(asgi, 'suggestion_cache', SuggestionCache())
+    return asgi
+
+@pytest.fixture
+def retries(app_module, monkeypatch):
+    """Retry không chờ thật; trả về danh sách các lần retry (số lần thử vừa lỗi)."""
+    original = app_module._retry_wait
+    attempts = []
+
+    def retry_wait(attempt, error, *args):
+        wait = original(attempt, error, *args)
+        if wait is None:
+            return None
+        attempts.append(attempt + 1)
+        return 0
+    monkeypatch.setattr(app_module, '_retry_wait', retry_wait)
+    return attempts
+
+@pytest.fixture
+def call(loop, asgi, username, profile):
+    """call(method, url, **kwargs) -> httpx.Response, gửi qua asgi.application với người dùng đã đăng nhập."""
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.application), base_url='http://test')
+
+    def call(method, url, **kwargs):
+        return loop.run_until_complete(client.request(method, url, **kwargs))
+
+    assert call('POST', '/api/register', json={'username': username, 'password': 'pw'}).status_code == 201
+    assert call('POST', '/api/login', json={'username': username, 'password': 'pw'}).status_code == 200
+    assert call('POST', '/api/profile', json=profile).status_code == 200
+    yield call
+    loop.run_until_complete(client.aclose())
+
+def photo():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'orange').save(buffer, 'JPEG')
+    return {'photo': ('meal.jpg', buffer.getvalue(), 'image/jpeg')}
+
+def log_meal_sync(call):
+    response = call('POST', '/api/log_meal?sync=1', files=photo(), data={'date': '2026-10-18', 'time': '12:00'})
+    assert response.status_code == 200
+    return response.json()['data']
+
+def test_log_meal_success(call, fake):
+    requests = fake.requests
+    meal = log_meal_sync(call)
+    assert meal['nutrition_analysis'] == MODEL_NOTE
+    assert meal['date'] == '2026-10-18'
+    assert fake.requests == requests + 1
+    assert call('GET', '/api/food_log').json()[0]['id'] == meal['id']
+
+def test_log_meal_job(call, fake):
+    response = call('POST', '/api/log_meal', files=photo())
+    assert response.status_code == 202
+    job = call('GET', response.json()['status_url'], params={'wait': 10}).json()
+    assert job['status'] == 'done'
+    assert job['data']['nutrition_analysis'] == MODEL_NOTE
+
+def test_log_meal_fenced_json(call, fake):
+    fake.fenced_rate = 1.0
+    fenced = fake.fenced
+    assert log_meal_sync(call)['nutrition_analysis'] == MODEL_NOTE
+    assert fake.fenced == fenced + 1
+
+def test_log_meal_malformed_response_falls_back(call, fake, monkeypatch):
+    # JSON bị cắt giữa chừng: không parse được, dùng dữ liệu trích từ văn bản
+    monkeypatch.setattr('fake_gemini.malformed', lambda text, rng: text[:len(text) // 2])
+    fake.malformed_rate = 1.0
+    meal = log_meal_sync(call)
+    assert meal['nutrition_analysis'] == 'Phân tích tự động từ mô tả'
+    assert 200 <= meal['calories'] <= 800
+
+def test_malformed_vision_response_is_not_cached(call, fake, app_module, monkeypatch, tmp_path):
+    from vision_cache import VisionCache
+    cache = VisionCache(str(tmp_path / 'vision.sqlite3'))
+    monkeypatch.setattr(app_module, 'vision_cache', cache)
+    monkeypatch.setattr('fake_gemini.malformed', lambda text, rng: text[:len(text) // 2])
+    fake.malformed_rate = 1.0
+    assert log_meal_sync(call)['nutrition_analysis'] == 'Phân tích tự động từ mô tả'
+    assert cache.stats()['entries'] == 0
+
+    # Phản hồi hợp lệ thì được cache: lần sau không gọi Gemini
+    fake.malformed_rate = 0.0
+    assert log_meal_sync(call)['nutrition_analysis'] == MODEL_NOTE
+    requests = fake.requests
+    assert log_meal_sync(call)['nutrition_analysis'] == MODEL_NOTE
+    assert fake.requests == requests
+    assert cache.stats()['entries'] == 1
+
+def test_log_meal_retries_api_error(call, fake, retries, app_module, monkeypatch):
+    retry_wait = app_module._retry_wait
+
+    def recover(*args):
+        # Lần thử đầu lỗi 503, lần sau thành công
+        fake.error_rate = 0.0
+        return retry_wait(*args)
+    monkeypatch.setattr(app_module, '_retry_wait', recover)
+    fake.error_rate = 1.0
+    requests, errors = fake.requests, fake.errors
+    meal = log_meal_sync(call)
+    assert meal['nutrition_analysis'] == MODEL_NOTE
+    assert retries == [1]
+    assert (fake.requests - requests, fake.errors - errors) == (2, 1)
+
+def test_log_meal_falls_back_after_retries(call, fake, retries, app_module):
+    from dishes import NUTRITION_NOTE
+    fake.error_rate = 1.0
+    requests = fake.requests
+    assert log_meal_sync(call)['nutrition_analysis'] == NUTRITION_NOTE
+    assert retries == [1, 2]
+    assert fake.requests == requests + 3
+
+def test_circuit_breaker_stops_calls(call, fake, retries, app_module, monkeypatch):
+    from dishes import NUTRITION_NOTE
+    from gemini_client import CircuitBreaker
+    monkeypatch.setattr(app_module.gemini, 'breaker', CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    fake.error_rate = 1.0
+    requests = fake.requests
+    # Lỗi thứ hai mở breaker: không thử lần ba
+    assert log_meal_sync(call)['nutrition_analysis'] == NUTRITION_NOTE
+    assert retries == [1]
+    assert fake.requests == requests + 2
+    assert app_module.gemini.breaker.state == 'open'
+
+    # Breaker đang mở: không gọi Gemini, trả dữ liệu mẫu ngay
+    fake.error_rate = 0.0
+    assert log_meal_sync(call)['nutrition_analysis'] == NUTRITION_NOTE
+    response = call('GET', '/api/suggest_menu')
+    assert response.status_code == 200
+    assert MODEL_ADVICE not in response.json()['advice']
+    assert fake.requests == requests + 2
+
+def test_client_errors_do_not_open_breaker(call, fake, retries, app_module, monkeypatch):
+    from gemini_client import CircuitBreaker
+    monkeypatch.setattr(app_module.gemini, 'breaker', CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    monkeypatch.setattr(fake, 'error_codes', [400])
+    fake.error_rate = 1.0
+    requests = fake.requests
+    # 400 là lỗi của yêu cầu, không phải sự cố của Gemini: breaker vẫn đóng, lời gọi sau vẫn tới API
+    assert MODEL_ADVICE not in call('GET', '/api/suggest_menu').json()['advice']
+    assert app_module.gemini.breaker.state == 'closed'
+    assert app_module.gemini.breaker._failures == 0
+    fake.error_rate = 0.0
+    assert log_meal_sync(call)['nutrition_analysis'] == MODEL_NOTE
+    assert fake.requests > requests + 1
+
+def test_suggest_menu_success(call, fake):
+    data = call('GET', '/api/suggest_menu').json()
+    assert data['advice'] == f'An ơi, {MODEL_ADVICE}'
+    assert len(data['menu_suggestions']) == 3
+
+def test_suggest_menu_fenced_json(call, fake):
+    fake.fenced_rate = 1.0
+    assert call('GET', '/api/suggest_menu').json()['advice'] == f'An ơi, {MODEL_ADVICE}'
+
+def test_suggest_menu_falls_back_on_api_error(call, fake, retries):
+    fake.error_rate = 1.0
+    response = call('GET', '/api/suggest_menu')
+    assert response.status_code == 200
+    assert MODEL_ADVICE not in response.json()['advice']
+    assert response.json()['menu_suggestions']
+    assert retries == [1, 2]
+
+def test_suggest_menu_malformed_response_is_not_cached(call, fake, asgi, monkeypatch):
+    # JSON bị cắt: dùng gợi ý mẫu và không cache, lần gọi sau vẫn hỏi lại Gemini
+    monkeypatch.setattr('fake_gemini.malformed', lambda text, rng: text[:len(text) // 2])
+    fake.malformed_rate = 1.0
+    requests = fake.requests
+    for _ in range(2):
+        data = call('GET', '/api/suggest_menu').json()
+        assert MODEL_ADVICE not in data['advice']
+        assert data['menu_suggestions']
+    assert fake.requests == requests + 2
+    assert len(asgi.suggestion_cache._entries) == 0
+
+def test_oversized_body_is_rejected_early(loop, asgi, app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    received = []
+
+    async def receive():
+        received.append(1)
+        return {'type': 'http.request', 'body': b'x' * 600, 'more_body': len(received) < 10}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/log_meal', 'root_path': '', 'query_string': b'',
+             'http_version': '1.1', 'headers': [(b'content-type', b'application/octet-stream')]}
+    loop.run_until_complete(asgi.application(scope, receive, send))
+    # Dừng ở khối thứ hai (1200 byte > 1024), không nhận nốt phần còn lại
+    assert len(received) == 2
+    assert sent[0]['status'] == 413
+
+    received.clear()
+    sent.clear()
+    scope['headers'] = [(b'content-length', b'4096')]
+    loop.run_until_complete(asgi.application(scope, receive, send))
+    assert received == []
+    assert sent[0]['status'] == 413
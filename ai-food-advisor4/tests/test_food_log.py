@@ -0,0 +1,80 @@
+"""Hợp đồng của /api/food_log: trang theo cursor (mới -> cũ, không trùng/sót), lọc ngày, chọn trường
+và đồng bộ thay đổi theo version (since)."""
+import pytest
+
+@pytest.fixture
+def client(app_module, username):
+    client = app_module.app.test_client()
+    assert client.post('/api/register', json={'username': username, 'password': 'pw'}).status_code == 201
+    assert client.post('/api/login', json={'username': username, 'password': 'pw'}).status_code == 200
+    return client
+
+@pytest.fixture
+def meals(app_module, username):
+    """7 bữa trong 3 ngày, hai bữa cùng timestamp (cursor phải tách được)."""
+    times = [('2026-10-01', '08:00'), ('2026-10-01', '12:00'), ('2026-10-02', '12:00'), ('2026-10-02', '12:00'),
+             ('2026-10-02', '19:00'), ('2026-10-03', '07:00'), ('2026-10-03', '12:00')]
+    entries = [app_module.build_meal_entry({'meal_name': f'Món {i}', 'estimated_calories': 100 + i},
+                                           f'{date}T{time}:00+07:00', date)
+               for i, (date, time) in enumerate(times)]
+    app_module.storage.add_meals(username, entries)
+    return entries
+
+def newest_first(entries):
+    return sorted(entries, key=lambda meal: (meal['date'], meal['timestamp']), reverse=True)
+
+def test_without_parameters_returns_full_list(client, meals):
+    assert sorted(meal['id'] for meal in client.get('/api/food_log').json) == sorted(meal['id'] for meal in meals)
+
+def test_cursor_pages_cover_log_once(client, meals):
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        page = client.get('/api/food_log', query_string=params).json
+        assert len(page['items']) <= 2
+        seen.extend(page['items'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert pages == 4
+    assert sorted(meal['id'] for meal in seen) == sorted(meal['id'] for meal in meals)
+    assert [(meal['date'], meal['timestamp']) for meal in seen] == \
+        [(meal['date'], meal['timestamp']) for meal in newest_first(meals)]
+
+def test_date_range_and_fields(client, meals):
+    page = client.get('/api/food_log', query_string={'start': '2026-10-02', 'end': '2026-10-02',
+                                                      'fields': 'id,calories'}).json
+    assert len(page['items']) == 3
+    assert all(set(item) == {'id', 'calories'} for item in page['items'])
+    assert page['next_cursor'] is None
+
+@pytest.mark.parametrize('params', [{'fields': 'id,password_hash'}, {'cursor': 'khong-hop-le'},
+                                    {'start': '2026-13-01'}, {'since': 'abc'}])
+def test_invalid_parameters(client, meals, params):
+    assert client.get('/api/food_log', query_string=params).status_code == 400
+
+def test_delta_since_version(client, meals, app_module, username):
+    version = client.get('/api/food_log', query_string={'limit': 1}).json['version']
+    assert client.get('/api/food_log', query_string={'since': version}).json == \
+        {'version': version, 'reset': False, 'added': [], 'deleted': []}
+
+    added = app_module.build_meal_entry({'meal_name': 'Bún chả', 'estimated_calories': 550},
+                                        '2026-10-04T12:00:00+07:00', '2026-10-04')
+    app_module.storage.add_meals(username, [added])
+    response = client.post('/api/delete_meals', json={'ids': [meals[0]['id']]})
+    assert response.json['deleted'] == [meals[0]['id']]
+
+    delta = client.get('/api/food_log', query_string={'since': version, 'fields': 'id,meal_name'}).json
+    assert delta['version'] > version
+    assert delta['reset'] is False
+    assert delta['added'] == [{'id': added['id'], 'meal_name': 'Bún chả'}]
+    assert delta['deleted'] == [meals[0]['id']]
+    assert client.get('/api/food_log', query_string={'since': delta['version']}).json['added'] == []
+
+def test_unknown_version_requires_reset(client, meals):
+    version = client.get('/api/food_log', query_string={'limit': 1}).json['version']
+    assert client.get('/api/food_log', query_string={'since': version + 100}).json == \
+        {'version': version, 'reset': True}
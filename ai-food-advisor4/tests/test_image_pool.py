@@ -0,0 +1,59 @@
+"""Process pool giải mã ảnh (image_pool.ImagePool): ảnh vào/ra qua shared memory và tự phục hồi khi
+tiến trình con chết."""
+import io
+import os
+import signal
+import time
+import pytest
+from PIL import Image
+import image_pool
+from image_pool import ImagePool
+
+INGEST = image_pool._ingest_shared
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    # Đặt trước khi fork tiến trình con (lúc warm) để die_once thấy được
+    monkeypatch.setenv('IMAGE_POOL_DIE_MARKER', str(tmp_path / 'died'))
+    pool = ImagePool(workers=1, max_pending=2, queue_timeout=1)
+    pool.warm()
+    yield pool
+    pool._executor.shutdown(wait=True)
+
+def jpeg(size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, 'JPEG')
+    buffer.seek(0)
+    return buffer
+
+def test_ingest_returns_image(pool):
+    img = pool.ingest(jpeg())
+    assert img.size == (64, 48)
+    assert pool.stats()['completed'] == 1
+
+def test_recovers_after_worker_is_killed(pool):
+    for pid in list(pool._executor._processes):
+        os.kill(pid, signal.SIGKILL)
+    time.sleep(0.2)
+    # Pool cũ đã hỏng: thay executor và chạy lại ảnh, request không thấy lỗi
+    assert pool.ingest(jpeg()).size == (64, 48)
+    stats = pool.stats()
+    assert (stats['restarts'], stats['completed'], stats['failed'], stats['in_flight']) == (1, 1, 0, 0)
+    assert pool.ingest(jpeg()).size == (64, 48)
+    assert pool.stats()['restarts'] == 1
+
+def die_once(name, size):
+    """Chạy trong tiến trình con: lần đầu tự kill tiến trình giữa lúc xử lý ảnh, lần sau xử lý bình thường."""
+    marker = os.environ['IMAGE_POOL_DIE_MARKER']
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os.kill(os.getpid(), signal.SIGKILL)
+    return INGEST(name, size)
+
+def test_worker_killed_mid_task_is_retried(pool, monkeypatch, tmp_path):
+    # Executor gửi hàm theo tên (pickle), nên tiến trình con đã fork trước đó cũng chạy die_once
+    monkeypatch.setattr(image_pool, '_ingest_shared', die_once)
+    assert pool.ingest(jpeg()).size == (64, 48)
+    assert (tmp_path / 'died').exists()
+    stats = pool.stats()
+    assert (stats['restarts'], stats['completed'], stats['failed']) == (1, 1, 0)
@@ -0,0 +1,76 @@
+"""Hàng đợi công việc nền (jobs.JobQueue): trạng thái queued -> running -> done/failed, long-poll,
+giới hạn hàng đợi và quyền xem công việc."""
+import asyncio
+import threading
+import pytest
+from jobs import JobQueue, QueueFull
+
+@pytest.fixture
+def jobs():
+    return JobQueue(workers=1, max_queue=1, name='test')
+
+def blocked(release, started=None):
+    """Công việc báo started rồi chờ tới khi release được set."""
+    def run(value):
+        if started is not None:
+            started.set()
+        release.wait(5)
+        return value
+    return run
+
+def test_job_runs_to_done(jobs):
+    release, started = threading.Event(), threading.Event()
+    running = jobs.submit('an', blocked(release, started), {'calories': 450})
+    assert running.status in ('queued', 'running')
+    assert started.wait(5)
+    assert jobs.get(running.id).status == 'running'
+
+    queued = jobs.submit('an', lambda: 'second')
+    assert queued.to_dict() == {'job_id': queued.id, 'status': 'queued'}
+
+    release.set()
+    assert jobs.get(running.id, wait=5).to_dict() == {'job_id': running.id, 'status': 'done',
+                                                      'data': {'calories': 450}}
+    assert jobs.get(queued.id, wait=5).to_dict()['data'] == 'second'
+    assert jobs.metrics()['completed'] == 2
+
+def test_failed_job_reports_error(jobs):
+    def fail():
+        raise ValueError('ảnh hỏng')
+    job = jobs.get(jobs.submit('an', fail).id, wait=5)
+    assert job.to_dict() == {'job_id': job.id, 'status': 'failed', 'error': 'ảnh hỏng'}
+    assert jobs.metrics()['failed'] == 1
+
+def test_full_queue_rejects(jobs):
+    release, started = threading.Event(), threading.Event()
+    jobs.submit('an', blocked(release, started), 1)
+    # Worker duy nhất đang bận, hàng đợi (1 chỗ) nhận thêm đúng một công việc
+    assert started.wait(5)
+    jobs.submit('an', blocked(release), 2)
+    with pytest.raises(QueueFull):
+        jobs.submit('an', blocked(release), 3)
+    release.set()
+    assert jobs.metrics()['rejected'] == 1
+
+def test_other_owner_cannot_see_job(jobs):
+    job = jobs.submit('an', lambda: 1)
+    assert jobs.get(job.id, owner='binh') is None
+    assert jobs.get(job.id, owner='an', wait=5).status == 'done'
+    assert jobs.get('khong-co') is None
+
+def test_async_job_transitions(jobs):
+    async def scenario():
+        release = asyncio.Event()
+
+        async def analyze():
+            await release.wait()
+            return 'phở'
+        job = jobs.submit_async('an', analyze)
+        assert job.status == 'queued'
+        await asyncio.sleep(0)
+        assert (await jobs.get_async(job.id, owner='an')).status == 'running'
+        release.set()
+        return await jobs.get_async(job.id, owner='an', wait=5)
+
+    job = asyncio.run(scenario())
+    assert job.to_dict() == {'job_id': job.id, 'status': 'done', 'data': 'phở'}
@@ -0,0 +1,63 @@
+"""Tổng hợp calories (rollups.CalorieRollup): cửa sổ trượt không bị lệch khi đọc (tính lại cửa sổ) xen giữa
+các lần thêm/xóa bữa ăn."""
+import random
+import sys
+import threading
+from datetime import date, timedelta
+import pytest
+from rollups import CalorieRollup
+from storage import JsonStorage, new_user_record
+
+START = date(2026, 10, 1)
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JsonStorage(str(tmp_path / 'db.json'))
+    storage.create_user(new_user_record('an', 'hash'))
+    yield storage
+    storage.close()
+
+@pytest.fixture
+def fast_switching():
+    # Đổi thread thường xuyên để lần đọc chen vào giữa lần ghi
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+def meal(day, calories):
+    date_text = (START + timedelta(days=day)).isoformat()
+    return {'timestamp': f'{date_text}T12:00:00+07:00', 'date': date_text, 'meal_name': 'Món',
+            'calories': calories, 'description': '', 'nutrition_analysis': ''}
+
+def test_random_writes_with_concurrent_reads_do_not_drift(storage, fast_switching):
+    rng = random.Random(0)
+    rollup = storage.get_rollup('an')
+    stop = threading.Event()
+
+    def read():
+        # Mỗi lần đọc đổi "hôm nay": buộc tính lại cửa sổ trong lúc thread kia đang ghi
+        while not stop.is_set():
+            rollup.window(rng.choice((7, 14, 30)), START + timedelta(days=rng.randrange(40)))
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    try:
+        for _ in range(300):
+            food_log = storage.get_user('an')['food_log']
+            if food_log and rng.random() < 0.4:
+                storage.delete_meal_ids('an', [rng.choice(food_log)['id']])
+            else:
+                storage.add_meals('an', [meal(rng.randrange(40), rng.randrange(100, 900))])
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+
+    assert storage.rebuild_rollups(check_only=True) == {}
+    expected = CalorieRollup.from_entries(storage.load_all()['users']['an']['food_log'])
+    # So ở đúng ngày neo cuối cùng (không tính lại): cửa sổ duy trì gia tăng phải khớp
+    anchor = rollup._anchor
+    for days in (7, 14, 30):
+        assert rollup.window(days, anchor) == expected.window(days, anchor)
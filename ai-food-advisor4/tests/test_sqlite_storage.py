@@ -0,0 +1,147 @@
+"""Backend SQLite (storage.SQLiteStorage): migrate từ db.json và từ schema cũ, xóa bữa ăn, dựng lại rollup
+và so khớp kết quả đọc với backend JSON."""
+import sqlite3
+import pytest
+from storage import JsonStorage, SQLiteStorage, migrate_json_to_sqlite, new_user_record, PROFILE_FIELDS
+
+PROFILE = dict(zip(PROFILE_FIELDS, ['An', 'nam', 30, 170.0, 65.0, 'ít', 'giảm cân', 2200, 1700]))
+
+@pytest.fixture
+def sqlite_file(tmp_path):
+    return str(tmp_path / 'db.sqlite3')
+
+@pytest.fixture
+def sqlite_storage(sqlite_file):
+    storage = SQLiteStorage(sqlite_file)
+    storage.create_user(new_user_record('an', 'hash'))
+    yield storage
+    storage.close()
+
+def meal(day, calories, hour=12):
+    return {'timestamp': f'2026-10-{day:02d}T{hour:02d}:00:00+07:00', 'date': f'2026-10-{day:02d}',
+            'meal_name': f'Món {calories}', 'calories': calories, 'description': '', 'nutrition_analysis': ''}
+
+def plain(user):
+    return dict(user, food_log=[meal.to_dict() if hasattr(meal, 'to_dict') else dict(meal)
+                                for meal in user['food_log']])
+
+def pages(storage, user_id, limit=3):
+    result, cursor = [], None
+    while True:
+        items, cursor = storage.get_food_log(user_id).page(limit, cursor)
+        result.append([item['id'] for item in items])
+        if cursor is None:
+            return result
+
+def stored_rollup(storage, user_id='an'):
+    return {row['date']: (row['calories'], row['meals']) for row in storage._connect().execute(
+        "SELECT * FROM daily_rollup WHERE user_id = ?", (user_id,))}
+
+def test_migrate_json_round_trip(tmp_path, sqlite_file):
+    source = JsonStorage(str(tmp_path / 'db.json'))
+    for username in ('an', 'binh'):
+        source.create_user(new_user_record(username, f'hash-{username}'))
+    source.set_profile('an', PROFILE)
+    source.add_meals('an', [meal(1, 400, 8), meal(1, 600), meal(2, 500), meal(2, 500)])
+    source.add_meals('an', [meal(3, 700)])
+    source.delete_meals('an', [meal(1, 400, 8)['timestamp']])
+    source.add_meals('binh', [meal(5, 300)])
+    source.close()
+
+    assert migrate_json_to_sqlite(str(tmp_path / 'db.json'), sqlite_file) == (2, 5)
+    json_storage, sqlite_storage = JsonStorage(str(tmp_path / 'db.json')), SQLiteStorage(sqlite_file)
+    try:
+        for user_id in ('an', 'binh', 'khong-co'):
+            json_user, sqlite_user = json_storage.get_user(user_id), sqlite_storage.get_user(user_id)
+            assert (json_user and plain(json_user)) == (sqlite_user and plain(sqlite_user))
+        for user_id in ('an', 'binh'):
+            json_rollup, sqlite_rollup = json_storage.get_rollup(user_id), sqlite_storage.get_rollup(user_id)
+            assert json_rollup.daily_totals() == sqlite_rollup.daily_totals()
+            for days in (7, 30):
+                assert json_rollup.window(days, '2026-10-05') == sqlite_rollup.window(days, '2026-10-05')
+            assert pages(json_storage, user_id) == pages(sqlite_storage, user_id)
+        assert sqlite_storage.get_user('an')['profile'] == PROFILE
+        assert stored_rollup(sqlite_storage) == {'2026-10-01': (600, 1), '2026-10-02': (1000, 2),
+                                                 '2026-10-03': (700, 1)}
+        # SQLite đã có dữ liệu: không migrate lần hai
+        assert migrate_json_to_sqlite(str(tmp_path / 'db.json'), sqlite_file) == (0, 0)
+    finally:
+        json_storage.close()
+        sqlite_storage.close()
+
+def test_migrate_old_schema(sqlite_file):
+    # Schema trước khi có meal_id / daily_rollup, nhật ký đồng bộ theo timestamp
+    conn = sqlite3.connect(sqlite_file)
+    conn.executescript("""
+        CREATE TABLE users (username TEXT PRIMARY KEY, password_hash TEXT NOT NULL);
+        CREATE TABLE food_log (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, timestamp TEXT NOT NULL,
+                               date TEXT NOT NULL, meal_name TEXT, calories INTEGER, description TEXT,
+                               nutrition_analysis TEXT);
+        CREATE TABLE sync_state (user_id TEXT PRIMARY KEY, version INTEGER NOT NULL, horizon INTEGER NOT NULL);
+        CREATE TABLE sync_changes (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL,
+                                   version INTEGER NOT NULL, kind TEXT NOT NULL, timestamp TEXT NOT NULL);
+        INSERT INTO users VALUES ('an', 'hash');
+        INSERT INTO food_log (user_id, timestamp, date, meal_name, calories, description)
+            VALUES ('an', '2026-10-01T12:00:00+07:00', '2026-10-01', 'Phở', 450, ''),
+                   ('an', '2026-10-02T12:00:00+07:00', '2026-10-02', 'Cơm', 650, '');
+        INSERT INTO sync_state VALUES ('an', 2, 0);
+        INSERT INTO sync_changes (user_id, version, kind, timestamp) VALUES ('an', 2, 'add', '2026-10-02T12:00:00+07:00');
+    """)
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(sqlite_file)
+    try:
+        food_log = storage.get_user('an')['food_log']
+        assert [meal['meal_name'] for meal in food_log] == ['Phở', 'Cơm']
+        assert all(meal['id'] for meal in food_log)
+        # Nhật ký cũ bị bỏ: client tải lại từ đầu
+        assert storage.get_user('an')['sync'] == {'version': 2, 'horizon': 2, 'changes': []}
+        assert stored_rollup(storage) == {'2026-10-01': (450, 1), '2026-10-02': (650, 1)}
+        assert storage.rebuild_rollups(check_only=True) == {}
+        # Mở lại: id giữ nguyên
+        reopened = SQLiteStorage(sqlite_file)
+        assert [meal['id'] for meal in reopened.get_user('an')['food_log']] == [meal['id'] for meal in food_log]
+        reopened.close()
+    finally:
+        storage.close()
+
+def test_delete_meals(sqlite_storage, sqlite_file):
+    sqlite_storage.add_meals('an', [meal(1, 400, 8), meal(1, 600), meal(2, 500)])
+    version = sqlite_storage.get_user('an')['sync']['version']
+    assert sqlite_storage.delete_meals('an', [meal(1, 400, 8)['timestamp'], meal(9, 0)['timestamp']]) == 1
+    assert sqlite_storage.delete_meals('khong-co', [meal(1, 600)['timestamp']]) == 0
+
+    expected = {'2026-10-01': (600, 1), '2026-10-02': (500, 1)}
+    assert sqlite_storage.get_rollup('an').daily_totals() == expected
+    assert stored_rollup(sqlite_storage) == expected
+    # Instance mới (cache rỗng) đọc lại từ SQLite
+    reopened = SQLiteStorage(sqlite_file)
+    try:
+        user = reopened.get_user('an')
+        assert sorted(meal['calories'] for meal in user['food_log']) == [500, 600]
+        assert user['sync']['version'] == version + 1
+        assert user['sync']['changes'][-1][1] == 'delete'
+        assert reopened.get_rollup('an').daily_totals() == expected
+    finally:
+        reopened.close()
+
+def test_rebuild_rollups_repairs_table_and_cache(sqlite_storage):
+    sqlite_storage.add_meals('an', [meal(1, 400), meal(2, 500)])
+    assert sqlite_storage.rebuild_rollups(check_only=True) == {}
+
+    conn = sqlite_storage._connect()
+    conn.execute("UPDATE daily_rollup SET calories = 999 WHERE date = '2026-10-01'")
+    conn.execute("DELETE FROM daily_rollup WHERE date = '2026-10-02'")
+    drift = sqlite_storage.rebuild_rollups(check_only=True)
+    assert sorted(day['date'] for day in drift['an']) == ['2026-10-01', '2026-10-02']
+    # get_rollup đọc từ bảng
+    assert sqlite_storage.get_rollup('an').daily_totals() == {'2026-10-01': (999, 1)}
+    # check_only không sửa
+    assert sqlite_storage.rebuild_rollups(check_only=True) == drift
+
+    assert sqlite_storage.rebuild_rollups() == drift
+    assert sqlite_storage.rebuild_rollups(check_only=True) == {}
+    assert stored_rollup(sqlite_storage) == {'2026-10-01': (400, 1), '2026-10-02': (500, 1)}
+    assert sqlite_storage.get_rollup('an').calories('2026-10-01') == 400
+    assert sqlite_storage.get_rollup('khong-co') is None
@@ -0,0 +1,142 @@
+"""Backend JSON (storage.JsonStorage): replay journal có dòng cuối ghi dở, gộp journal rồi nạp lại và hai
+instance (hai tiến trình) cùng ghi một file."""
+import os
+import pytest
+from storage import JsonStorage, new_user_record
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'db.json')
+
+@pytest.fixture
+def open_storage(db_file):
+    """open_storage() -> JsonStorage mới trên cùng db_file; đóng hết khi xong test."""
+    opened = []
+
+    def open_storage():
+        storage = JsonStorage(db_file)
+        opened.append(storage)
+        return storage
+    yield open_storage
+    for storage in opened:
+        storage.close()
+
+def meal(day, calories):
+    return {'timestamp': f'2026-10-{day:02d}T12:00:00+07:00', 'date': f'2026-10-{day:02d}',
+            'meal_name': f'Món {calories}', 'calories': calories, 'description': '', 'nutrition_analysis': ''}
+
+def food_log(storage, user_id='an'):
+    return sorted((meal['date'], meal['calories']) for meal in storage.get_user(user_id)['food_log'])
+
+def test_replay_ignores_truncated_last_line(open_storage, db_file):
+    first = open_storage()
+    first.create_user(new_user_record('an', 'hash'))
+    first.add_meals('an', [meal(1, 400)])
+    first.add_meals('an', [meal(2, 500)])
+    # Tiến trình ghi bị kill giữa dòng journal
+    with open(db_file + '.journal', 'ab') as f:
+        f.write(b'{"op": "add_meals", "user_id": "an", "entr')
+
+    second = open_storage()
+    assert food_log(second) == [('2026-10-01', 400), ('2026-10-02', 500)]
+    # Lần ghi sau kết thúc dòng dở trước khi ghi dòng mới: không dính vào nhau
+    second.add_meals('an', [meal(3, 600)])
+    assert food_log(open_storage()) == [('2026-10-01', 400), ('2026-10-02', 500), ('2026-10-03', 600)]
+    assert food_log(first) == food_log(second)
+
+def test_compaction_then_reload(open_storage, db_file):
+    storage = open_storage()
+    storage.create_user(new_user_record('an', 'hash'))
+    storage.add_meals('an', [meal(1, 400), meal(2, 500)])
+    storage.delete_meals('an', [meal(1, 400)['timestamp']])
+    version = storage.get_user('an')['sync']['version']
+    storage.compact()
+    assert os.path.getsize(db_file + '.journal') == 0
+
+    reloaded = open_storage()
+    user = reloaded.get_user('an')
+    assert food_log(reloaded) == [('2026-10-02', 500)]
+    assert user['sync']['version'] == version
+    assert reloaded.get_rollup('an').calories('2026-10-02') == 500
+    # Ghi tiếp sau khi gộp: seq tiếp nối, instance cũ đọc được
+    reloaded.add_meals('an', [meal(3, 600)])
+    assert food_log(storage) == [('2026-10-02', 500), ('2026-10-03', 600)]
+
+def test_two_instances_write_same_file(open_storage):
+    first, second = open_storage(), open_storage()
+    first.create_user(new_user_record('an', 'hash'))
+    second.create_user(new_user_record('binh', 'hash'))
+    for day in range(1, 6):
+        writer = first if day % 2 else second
+        writer.add_meals('an', [meal(day, 100 * day)])
+    second.set_profile('binh', {'name': 'Bình'})
+    first.compact()
+    second.add_meals('binh', [meal(9, 900)])
+
+    expected = [(f'2026-10-{day:02d}', 100 * day) for day in range(1, 6)]
+    for storage in (first, second, open_storage()):
+        assert food_log(storage) == expected
+        assert food_log(storage, 'binh') == [('2026-10-09', 900)]
+        assert storage.get_user('binh')['profile'] == {'name': 'Bình'}
+        assert storage.get_rollup('an').calories('2026-10-03') == 300
+    ids = [meal['id'] for meal in first.get_user('an')['food_log']]
+    assert len(set(ids)) == len(ids) == 5
+
+# --- Ghi snapshot nguyên tử và bản sao lưu ---
+
+def test_interrupted_save_keeps_previous_snapshot(open_storage, db_file, monkeypatch):
+    import storage as storage_module
+    storage = open_storage()
+    storage.create_user(new_user_record('an', 'hash'))
+    storage.compact()
+    with open(db_file, 'rb') as f:
+        previous = f.read()
+
+    def crash(src, dst):
+        raise OSError("mất điện giữa lúc đổi tên")
+    storage.add_meals('an', [meal(1, 400)])
+    monkeypatch.setattr(storage_module.os, 'replace', crash)
+    with pytest.raises(OSError):
+        storage.compact()
+    monkeypatch.undo()
+    with open(db_file, 'rb') as f:
+        assert f.read() == previous
+    assert not [name for name in os.listdir(os.path.dirname(db_file)) if '.tmp-' in name]
+    # Journal chưa bị cắt: không mất bữa ăn vừa ghi
+    assert food_log(open_storage()) == [('2026-10-01', 400)]
+
+def test_stale_temp_file_is_ignored_and_removed(open_storage, db_file):
+    storage = open_storage()
+    storage.create_user(new_user_record('an', 'hash'))
+    storage.compact()
+    # Tiến trình bị kill khi đang ghi file tạm
+    with open(db_file + '.tmp-crash', 'wb') as f:
+        f.write(b'{"users": {"an": {"usern')
+    reopened = open_storage()
+    assert reopened.get_user('an')['username'] == 'an'
+    assert not os.path.exists(db_file + '.tmp-crash')
+
+def test_corrupt_snapshot_falls_back_to_backup(open_storage, db_file):
+    storage = open_storage()
+    storage.create_user(new_user_record('an', 'hash'))
+    storage.compact()
+    storage.add_meals('an', [meal(1, 400)])
+    # Lần gộp thứ hai giữ snapshot trước đó làm db.json.1
+    storage.compact()
+    assert os.path.exists(db_file + '.1')
+    with open(db_file, 'r+b') as f:
+        f.truncate(os.path.getsize(db_file) // 2)
+
+    reopened = open_storage()
+    # Bản sao lưu có trước bữa ăn: người dùng còn, thay đổi sau bản sao lưu thì mất
+    assert reopened.get_user('an')['username'] == 'an'
+    assert food_log(reopened) == []
+
+def test_corrupt_snapshot_without_readable_backup_raises(db_file):
+    from storage import SnapshotCorrupted, load_data, save_data
+    save_data(db_file, {'users': {}}, backups=0)
+    for path in (db_file, db_file + '.1'):
+        with open(path, 'wb') as f:
+            f.write(b'{"users": ')
+    with pytest.raises(SnapshotCorrupted):
+        load_data(db_file, {'users': {}})
@@ -0,0 +1,44 @@
+"""Cache gợi ý thực đơn (suggestion_cache.SuggestionCache): đếm hit/stale/miss theo TTL và làm mới nền."""
+import pytest
+from suggestion_cache import SuggestionCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Đồng hồ giả cho time.monotonic trong suggestion_cache; tăng bằng clock.advance(giây)."""
+    class Clock:
+        now = 1000.0
+
+        def advance(self, seconds):
+            self.now += seconds
+    clock = Clock()
+    monkeypatch.setattr('suggestion_cache.time.monotonic', lambda: clock.now)
+    return clock
+
+def counts(cache):
+    stats = cache.stats()
+    return stats['hits'], stats['stale_hits'], stats['misses']
+
+def test_expired_entries_are_not_counted_as_hits(clock):
+    cache = SuggestionCache(ttl=10, stale_ttl=20)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'advice': len(calls)}
+
+    assert cache.get_or_compute('k', compute) == {'advice': 1}
+    assert counts(cache) == (0, 0, 1)
+    assert cache.get_or_compute('k', compute) == {'advice': 1}
+    assert counts(cache) == (1, 0, 1)
+
+    # Hết TTL nhưng còn trong stale_ttl: trả bản cũ, đếm là stale (không phải hit)
+    clock.advance(15)
+    cache._start_refresh('k')  # coi như đang làm mới: không chạy thread làm mới nền trong test
+    assert cache.get_or_compute('k', compute) == {'advice': 1}
+    assert counts(cache) == (1, 1, 1)
+
+    # Quá cả stale_ttl: là miss và tính lại
+    clock.advance(60)
+    assert cache.get_or_compute('k', compute) == {'advice': 2}
+    assert counts(cache) == (1, 1, 2)
+    assert cache.stats()['hit_rate'] == 0.25
@@ -0,0 +1,50 @@
+"""Cache kết quả phân tích ảnh (vision_cache.VisionCache): TTL, evict theo last_access và so khớp gần đúng."""
+import time
+import pytest
+import vision_cache
+from vision_cache import VisionCache
+
+MEAL = {'meal_name': 'Phở bò', 'estimated_calories': 450}
+
+@pytest.fixture
+def cache(tmp_path):
+    return VisionCache(str(tmp_path / 'vision.sqlite3'), max_size=2)
+
+def last_access(cache, key):
+    return cache._conn.execute("SELECT last_access FROM vision_cache WHERE key = ?", (key,)).fetchone()[0]
+
+def test_memory_hits_keep_entry_from_eviction(cache):
+    cache.put('a', 1, MEAL)
+    cache.put('b', 2, MEAL)
+    time.sleep(0.01)
+    # Trúng trong bộ nhớ: 'a' là mục dùng gần nhất, evict phải bỏ 'b'
+    assert cache.get('a', 1) == MEAL
+    cache.put('c', 3, MEAL)
+    assert cache.get('b', 2) is None
+    assert cache.get('a', 1) == MEAL
+    assert cache.get('c', 3) == MEAL
+
+def test_memory_hits_are_written_back(cache, monkeypatch):
+    cache.put('a', 1, MEAL)
+    stored = last_access(cache, 'a')
+    time.sleep(0.01)
+    cache.get('a', 1)
+    # Chưa tới hạn ghi dồn
+    assert last_access(cache, 'a') == stored
+    monkeypatch.setattr(vision_cache, 'VISION_CACHE_ACCESS_FLUSH', 0)
+    cache.get('a', 1)
+    assert last_access(cache, 'a') > stored
+
+def test_expired_entry_is_a_miss(cache):
+    cache.ttl = 0
+    cache.put('a', 1, MEAL)
+    assert cache.get('a', 1) is None
+    assert cache.stats()['entries'] == 0
+
+def test_near_match_is_opt_in(tmp_path):
+    exact = VisionCache(str(tmp_path / 'exact.sqlite3'))
+    exact.put('a', 0b1111, MEAL)
+    assert exact.get('b', 0b1110) is None
+    near = VisionCache(str(tmp_path / 'near.sqlite3'), max_distance=4)
+    near.put('a', 0b1111, MEAL)
+    assert near.get('b', 0b1110) == MEAL
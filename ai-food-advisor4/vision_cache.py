@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+from cache import LRUCache
+from logs import get_logger
+
+log = get_logger('vision_cache')
+
+# --- CẤU HÌNH CACHE KẾT QUẢ PHÂN TÍCH ẢNH ---
+VISION_CACHE_ENABLED = os.environ.get('VISION_CACHE_ENABLED', '1') != '0'
+VISION_CACHE_FILE = os.environ.get('VISION_CACHE_FILE', 'vision_cache.sqlite3')
+VISION_CACHE_TTL = float(os.environ.get('VISION_CACHE_TTL', str(7 * 24 * 3600)))
+VISION_CACHE_SIZE = int(os.environ.get('VISION_CACHE_SIZE', '5000'))
+# Khoảng cách Hamming tối đa giữa hai dHash để coi là cùng một ảnh. Mặc định 0 = tắt so khớp gần đúng:
+# cache dùng chung cho mọi người dùng, và hai ảnh chụp khác nhau (của hai người) có thể có dHash gần nhau,
+# khi đó người sau nhận kết quả phân tích ảnh của người trước. Chỉ bật (ví dụ 4) nếu chấp nhận điều này
+# để trúng cache cả với ảnh bị nén lại / đổi kích thước.
+VISION_CACHE_PHASH_DISTANCE = int(os.environ.get('VISION_CACHE_PHASH_DISTANCE', '0'))
+# last_access của các lần trúng trong bộ nhớ được gom lại, ghi vào SQLite tối đa mỗi chừng này giây
+# (và luôn ghi trước khi evict, để mục hay dùng không bị bỏ trước)
+VISION_CACHE_ACCESS_FLUSH = float(os.environ.get('VISION_CACHE_ACCESS_FLUSH', '30'))
+
+VISION_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vision_cache (
+    key TEXT PRIMARY KEY,
+    phash INTEGER NOT NULL,
+    ai_data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_vision_cache_last_access ON vision_cache(last_access);
+"""
+
+def difference_hash(img, hash_size=8):
+    """dHash 64 bit: so sánh độ sáng các điểm ảnh kề nhau trên ảnh xám 9x8."""
+    small = np.asarray(img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+def _hamming_distances(hashes, target):
+    xor = np.bitwise_xor(hashes, np.uint64(target))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class VisionCache:
+    """Cache ai_data theo nội dung ảnh (SHA-256 của ảnh đã chuẩn hóa), lưu bền trong SQLite.
+
+    Ảnh tải lại gần giống (nén lại, đổi kích thước) được nhận diện qua dHash khi bật max_distance > 0.
+    """
+
+    def __init__(self, file_name=VISION_CACHE_FILE, ttl=VISION_CACHE_TTL, max_size=VISION_CACHE_SIZE,
+                 max_distance=VISION_CACHE_PHASH_DISTANCE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        # key -> (expires_at, ai_data): lần trúng trong bộ nhớ cũng phải kiểm tra TTL
+        self._memory = LRUCache(min(max_size, 512))
+        # key -> last_access chưa ghi vào SQLite (trúng trong bộ nhớ)
+        self._pending_access = {}
+        self._access_flushed_at = time.time()
+        self._conn = sqlite3.connect(file_name, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(VISION_CACHE_SCHEMA)
+        # Chỉ mục dHash trong bộ nhớ để quét gần đúng bằng NumPy
+        rows = self._conn.execute("SELECT key, phash FROM vision_cache").fetchall()
+        self._phash_keys = [key for key, _ in rows]
+        self._phashes = np.array([phash & 0xFFFFFFFFFFFFFFFF for _, phash in rows], dtype=np.uint64)
+        self._purge_expired()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(img):
+        """(khóa SHA-256, dHash) của ảnh đã thumbnail."""
+        normalized = img.convert('RGB')
+        digest = hashlib.sha256(f"{normalized.size}".encode())
+        digest.update(normalized.tobytes())
+        return digest.hexdigest(), difference_hash(normalized)
+
+    def _purge_expired(self):
+        expired = self._conn.execute("SELECT key FROM vision_cache WHERE created_at < ?",
+                                     (time.time() - self.ttl,)).fetchall()
+        for (key,) in expired:
+            self._delete(key)
+
+    def _load(self, key):
+        """(expires_at, ai_data) của mục còn hạn trong SQLite, None nếu không có hoặc đã hết hạn."""
+        row = self._conn.execute("SELECT ai_data, created_at FROM vision_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        expires_at = row[1] + self.ttl
+        if expires_at < time.time():
+            self._delete(key)
+            return None
+        self._conn.execute("UPDATE vision_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return expires_at, json.loads(row[0])
+
+    def _touch(self, key):
+        """Ghi nhận lần trúng trong bộ nhớ; ghi dồn vào SQLite theo VISION_CACHE_ACCESS_FLUSH."""
+        now = time.time()
+        self._pending_access[key] = now
+        if now - self._access_flushed_at >= VISION_CACHE_ACCESS_FLUSH:
+            self._flush_access()
+
+    def _flush_access(self):
+        if self._pending_access:
+            self._conn.executemany("UPDATE vision_cache SET last_access = ? WHERE key = ?",
+                                   [(at, key) for key, at in self._pending_access.items()])
+            self._pending_access.clear()
+        self._access_flushed_at = time.time()
+
+    def _delete(self, key):
+        self._conn.execute("DELETE FROM vision_cache WHERE key = ?", (key,))
+        self._memory.pop(key)
+        self._pending_access.pop(key, None)
+        if key in self._phash_keys:
+            index = self._phash_keys.index(key)
+            del self._phash_keys[index]
+            self._phashes = np.delete(self._phashes, index)
+
+    def get(self, key, phash):
+        """Trả về bản sao ai_data đã cache (khớp chính xác hoặc gần đúng), None nếu không có."""
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[0] < time.time():
+                self._delete(key)
+                cached = None
+            elif cached is None:
+                cached = self._load(key)
+                if cached is not None:
+                    self._memory.put(key, cached)
+            else:
+                self._touch(key)
+            if cached is not None:
+                self.hits += 1
+                return dict(cached[1])
+            if self.max_distance > 0 and len(self._phashes):
+                distances = _hamming_distances(self._phashes, phash)
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    cached = self._load(self._phash_keys[best])
+                    if cached is not None:
+                        self.near_hits += 1
+                        return dict(cached[1])
+            self.misses += 1
+            return None
+
+    def put(self, key, phash, ai_data):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO vision_cache (key, phash, ai_data, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                # SQLite INTEGER là số có dấu 64 bit
+                (key, phash - (1 << 64) if phash >= (1 << 63) else phash,
+                 json.dumps(ai_data, ensure_ascii=False), now, now)
+            )
+            self._memory.put(key, (now + self.ttl, dict(ai_data)))
+            if key not in self._phash_keys:
+                self._phash_keys.append(key)
+                self._phashes = np.append(self._phashes, np.uint64(phash))
+            self._evict()
+
+    def _evict(self):
+        """Giữ tối đa max_size mục, bỏ các mục lâu không dùng nhất."""
+        count = self._conn.execute("SELECT COUNT(*) FROM vision_cache").fetchone()[0]
+        if count <= self.max_size:
+            return
+        self._purge_expired()
+        # Đếm lại: các mục hết hạn vừa xóa đã giải phóng chỗ, không bỏ thêm mục còn hạn
+        count = self._conn.execute("SELECT COUNT(*) FROM vision_cache").fetchone()[0]
+        if count <= self.max_size:
+            return
+        self._flush_access()
+        stale = self._conn.execute("SELECT key FROM vision_cache ORDER BY last_access LIMIT ?",
+                                   (count - self.max_size,)).fetchall()
+        for (key,) in stale:
+            self._delete(key)
+
+    def stats(self):
+        total = self.hits + self.near_hits + self.misses
+        return {
+            'entries': len(self._phash_keys),
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.near_hits) / total, 4) if total else 0.0
+        }
+
+def create_vision_cache():
+    """Tạo cache theo cấu hình, trả về None nếu bị tắt hoặc lỗi."""
+    if not VISION_CACHE_ENABLED:
+        return None
+    try:
+        return VisionCache()
+    except Exception as e:
+        log.error("❌ Không khởi tạo được vision cache", error=e)
+        return None